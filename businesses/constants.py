@@ -12,3 +12,35 @@ ORDER_STATUS_CHOICES = (
     ("delivered", "delivered"),
     ("rework", "rework"),
 )
+
+# Guards the recursive referral queries against cycles in Business.referral
+REFERRAL_MAX_DEPTH = 50
+
+CONNECTION_PATH_MAX_DEPTH = 6
+
+DEFAULT_SWITCH_ATTEMPTS = 3
+
+BUSINESS_IMPORT_MAX_ROWS = 10000
+# Stays below the bound parameter limit of SQLite
+BUSINESS_IMPORT_LOOKUP_CHUNK = 500
+
+# Jaccard similarity of name trigrams above which businesses look duplicate
+DUPLICATE_NAME_THRESHOLD = 0.5
+DUPLICATE_NAME_LIMIT = 10
+DUPLICATE_REINDEX_CHUNK = 500
+
+# Left out of the name trigrams unless the name has nothing else
+BUSINESS_NAME_STOP_WORDS = frozenset(
+    [
+        "and",
+        "care",
+        "clinic",
+        "dental",
+        "dentist",
+        "dr",
+        "hospital",
+        "lab",
+        "laboratory",
+        "the",
+    ]
+)
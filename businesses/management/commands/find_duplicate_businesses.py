@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+
+from businesses.constants import DUPLICATE_NAME_THRESHOLD
+from businesses.models import Business
+from businesses.utils import DuplicateUtil
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports businesses sharing a gstin and businesses of one city with "
+        "similar names, from the gstin and name trigram indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=DUPLICATE_NAME_THRESHOLD,
+            help="Minimum name similarity, between 0 and 1",
+        )
+        parser.add_argument("--city", type=int, help="Only report this city id")
+        parser.add_argument(
+            "--reindex",
+            action="store_true",
+            help="Rebuild the name trigrams of every business first",
+        )
+
+    def handle(self, *args, **options):
+        if options["reindex"]:
+            count = DuplicateUtil.reindex_all()
+            self.stdout.write(f"Reindexed {count} business names")
+
+        gstin_groups = DuplicateUtil.get_gstin_duplicate_groups()
+        name_pairs = DuplicateUtil.get_name_duplicate_pairs(
+            options["threshold"], options["city"]
+        )
+
+        business_ids = {
+            business_id for group in gstin_groups.values() for business_id in group
+        }
+        business_ids.update(pair[0] for pair in name_pairs)
+        business_ids.update(pair[1] for pair in name_pairs)
+
+        names = dict(
+            Business.objects.filter(id__in=business_ids).values_list("id", "name")
+        )
+
+        def label(business_id):
+            return f"{business_id} ({names.get(business_id, '')})"
+
+        self.stdout.write(f"{len(gstin_groups)} gstins used more than once")
+
+        for gstin, group in gstin_groups.items():
+            self.stdout.write(f"  {gstin}: {', '.join(map(label, group))}")
+
+        self.stdout.write(f"{len(name_pairs)} pairs of similar names")
+
+        for business_id, other_business_id, city_id, similarity in name_pairs:
+            self.stdout.write(
+                f"  city {city_id}: {label(business_id)} ~ "
+                f"{label(other_business_id)} {similarity:.2f}"
+            )
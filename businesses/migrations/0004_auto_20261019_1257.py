@@ -0,0 +1,42 @@
+# Generated by Django 3.1.4 on 2026-10-19 12:57
+
+from django.db import migrations, models
+
+
+def keep_single_default(apps, schema_editor):
+    # Older rows may have several defaults per business, keep the newest one
+    for model_name in ['BusinessAccount', 'BusinessAddress']:
+        model = apps.get_model('businesses', model_name)
+
+        rows = model.objects.filter(is_default=True).order_by(
+            'business_id', '-modified_at', '-id'
+        ).values_list('id', 'business_id')
+
+        seen_business_ids = set()
+        duplicate_ids = []
+
+        for row_id, business_id in rows:
+            if business_id in seen_business_ids:
+                duplicate_ids.append(row_id)
+            seen_business_ids.add(business_id)
+
+        model.objects.filter(id__in=duplicate_ids).update(is_default=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('businesses', '0003_auto_20220510_1621'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_single_default, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='businessaccount',
+            constraint=models.UniqueConstraint(condition=models.Q(is_default=True), fields=('business',), name='unique_default_business_account'),
+        ),
+        migrations.AddConstraint(
+            model_name='businessaddress',
+            constraint=models.UniqueConstraint(condition=models.Q(is_default=True), fields=('business',), name='unique_default_business_address'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 3.1.4 on 2026-10-19 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copies of Business.normalize_gstin, DuplicateUtil.get_name_trigrams
+# and BUSINESS_NAME_STOP_WORDS as of this migration, later changes to them must
+# not change what it did.
+STOP_WORDS = frozenset(
+    ['and', 'care', 'clinic', 'dental', 'dentist', 'dr', 'hospital', 'lab', 'laboratory', 'the']
+)
+
+
+def normalize_gstin(gstin):
+    gstin = ''.join(char for char in str(gstin or '') if char.isalnum())
+    return gstin.upper() or None
+
+
+def get_name_trigrams(name):
+    words = ''.join(
+        char if char.isalnum() else ' ' for char in str(name or '').casefold()
+    ).split()
+    words = [word for word in words if word not in STOP_WORDS] or words
+
+    trigrams = set()
+
+    for word in words:
+        padded = f'  {word} '
+        trigrams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+
+    return trigrams
+
+
+def index_existing_businesses(apps, schema_editor):
+    Business = apps.get_model('businesses', 'Business')
+    BusinessNameTrigram = apps.get_model('businesses', 'BusinessNameTrigram')
+
+    businesses = list(Business.objects.filter(gstin__isnull=False).only('id', 'gstin'))
+
+    for business in businesses:
+        business.gstin_normalized = normalize_gstin(business.gstin)
+
+    Business.objects.bulk_update(businesses, ['gstin_normalized'], batch_size=500)
+
+    rows = Business.objects.filter(addresses__is_default=True).values_list(
+        'id', 'name', 'addresses__city_id'
+    )
+
+    BusinessNameTrigram.objects.bulk_create(
+        [
+            BusinessNameTrigram(business_id=business_id, city_id=city_id, trigram=trigram)
+            for business_id, name, city_id in rows
+            for trigram in get_name_trigrams(name)
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_pincode'),
+        ('businesses', '0004_auto_20261019_1257'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='gstin_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=15, null=True),
+        ),
+        migrations.CreateModel(
+            name='BusinessNameTrigram',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_trigrams', to='businesses.business')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='business_name_trigrams', to='core.city')),
+            ],
+            options={
+                'verbose_name': 'Business Name Trigram',
+                'verbose_name_plural': 'Business Name Trigrams',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='businessnametrigram',
+            index=models.Index(fields=['city', 'trigram'], name='business_trigram_city_idx'),
+        ),
+        migrations.RunPython(index_existing_businesses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.4 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('businesses', '0005_auto_20261019_1420'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['is_claimed', 'gstin_normalized'], name='business_claim_gstin_idx'),
+        ),
+    ]
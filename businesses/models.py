@@ -8,6 +8,9 @@ class Business(TimeStampedModel):
     name = models.CharField(max_length=255)
 
     gstin = models.CharField(max_length=15, null=True, blank=True)
+    gstin_normalized = models.CharField(
+        max_length=15, null=True, blank=True, db_index=True, editable=False
+    )
 
     category = models.CharField(
         max_length=12, choices=CATEGORY_CHOICES, default="laboratory"
@@ -39,12 +42,57 @@ class Business(TimeStampedModel):
         through="BusinessConnect",
     )
 
+    @staticmethod
+    def normalize_gstin(gstin):
+        gstin = "".join(char for char in str(gstin or "") if char.isalnum())
+        return gstin.upper() or None
+
+    def save(self, *args, **kwargs):
+        self.gstin_normalized = self.normalize_gstin(self.gstin)
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "gstin" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | {"gstin_normalized"}
+
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.id} - {self.name}"
 
     class Meta:
         verbose_name = "Business"
         verbose_name_plural = "Businesses"
+        indexes = [
+            models.Index(
+                fields=["is_claimed", "gstin_normalized"],
+                name="business_claim_gstin_idx",
+            ),
+        ]
+
+
+class BusinessNameTrigram(models.Model):
+    """
+    Trigrams of a business name, scoped to the city of its default address.
+    Maintained by DuplicateUtil, backs the fuzzy duplicate lookups.
+    """
+
+    business = models.ForeignKey(
+        "businesses.Business", on_delete=models.CASCADE, related_name="name_trigrams"
+    )
+    city = models.ForeignKey(
+        "core.City", on_delete=models.CASCADE, related_name="business_name_trigrams"
+    )
+    trigram = models.CharField(max_length=3)
+
+    def __str__(self):
+        return f"{self.business_id} - {self.trigram}"
+
+    class Meta:
+        verbose_name = "Business Name Trigram"
+        verbose_name_plural = "Business Name Trigrams"
+        indexes = [
+            models.Index(fields=["city", "trigram"], name="business_trigram_city_idx"),
+        ]
 
 
 class BusinessOwner(TimeStampedModel):
@@ -148,6 +196,13 @@ class BusinessAddress(TimeStampedModel):
         verbose_name = "Business Address"
         verbose_name_plural = "Business Addresses"
         ordering = ["business", "address_type"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["business"],
+                condition=models.Q(is_default=True),
+                name="unique_default_business_address",
+            ),
+        ]
 
 
 class BusinessAccount(TimeStampedModel):
@@ -176,6 +231,13 @@ class BusinessAccount(TimeStampedModel):
     class Meta:
         verbose_name = "Business Account"
         verbose_name_plural = "Business Accounts"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["business"],
+                condition=models.Q(is_default=True),
+                name="unique_default_business_account",
+            ),
+        ]
 
 
 class BusinessConnect(TimeStampedModel):
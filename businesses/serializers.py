@@ -7,11 +7,13 @@ from django.core.validators import EmailValidator
 from rest_framework import serializers
 
 from core.serializers import (
+    ExpandableFieldsMixin,
     ServerErrorSerializer,
     ServerErrorModelSerializer,
     JobTypeSerializer,
 )
-from core.models import JobType, State, City, District
+from core.geography import geography_index
+from core.models import JobType
 
 from users.models import EmailUser
 
@@ -26,11 +28,22 @@ from businesses.models import (
     Order,
     OrderStatus,
 )
+from businesses.utils import DefaultRowUtil, DuplicateUtil
 
 from core.serializers import ServerErrorModelSerializer
 
 
 class BusinessOwnerUserSerializer(serializers.ModelSerializer):
+    def validate_email(self, email):
+        # The model's UniqueValidator compares the email as typed
+        email = EmailUser.objects.normalize_email(email)
+
+        if EmailUser.objects.filter(email=email).exists():
+            message = "server_exists_already"
+            raise serializers.ValidationError(message)
+
+        return email
+
     class Meta:
         model = EmailUser
         fields = [
@@ -87,15 +100,8 @@ class BusinessAccountSerializer(serializers.ModelSerializer):
 
         instance = BusinessAccount(**validated_data)
         instance.business = user.get_business()
-        instance.save()
-
-        is_default = validated_data["is_default"]
 
-        if is_default:
-            queryset = user.get_business().accounts.exclude(id=instance.id)
-            queryset.update(is_default=False)
-
-        return instance
+        return DefaultRowUtil.save(instance)
 
     def update(self, instance, validated_data):
 
@@ -111,50 +117,14 @@ class BusinessAccountSerializer(serializers.ModelSerializer):
             "account_type", instance.account_type
         )
         instance.is_default = validated_data.get("is_default", instance.is_default)
-        instance.save()
-
-        is_default = validated_data["is_default"]
 
-        if is_default:
-            queryset = BusinessAccount.objects.filter(
-                business_id=instance.business_id
-            ).exclude(id=instance.id)
-            queryset.update(is_default=False)
-
-        return instance
+        return DefaultRowUtil.save(instance)
 
 
 class BusinessAddressSerializer(ServerErrorModelSerializer):
-    city_id = serializers.IntegerField(write_only=True)
-    district_id = serializers.IntegerField(write_only=True)
-    state_id = serializers.IntegerField(write_only=True)
-
-    def validate_city_id(self, city_id):
-        queryset = City.objects.filter(id=city_id)
-
-        if not queryset.exists():
-            message = "server_absent"
-            raise serializers.ValidationError(message)
-
-        return queryset.first()
-
-    def validate_district_id(self, district_id):
-        queryset = District.objects.filter(id=district_id)
-
-        if not queryset.exists():
-            message = "server_absent"
-            raise serializers.ValidationError(message)
-
-        return queryset.first()
-
-    def validate_state_id(self, state_id):
-        queryset = State.objects.filter(id=state_id)
-
-        if not queryset.exists():
-            message = "server_absent"
-            raise serializers.ValidationError(message)
-
-        return queryset.first()
+    city_id = serializers.IntegerField(write_only=True, required=False)
+    district_id = serializers.IntegerField(write_only=True, required=False)
+    state_id = serializers.IntegerField(write_only=True, required=False)
 
     def validate_address_type(self, address_type):
         all_addresses = self.context["user"].get_business().addresses.all()
@@ -171,6 +141,87 @@ class BusinessAddressSerializer(ServerErrorModelSerializer):
 
         return address_type
 
+    @staticmethod
+    def fill_geography_from_pincode(data, instance=None):
+        pincode = data.get("pincode")
+
+        if pincode is not None and "city_id" not in data:
+            city_ids = geography_index.get_pincode_city_ids(pincode)
+
+            if "district_id" in data:
+                city_ids = [
+                    city_id
+                    for city_id in city_ids
+                    if geography_index.get_city_parents(city_id)[0]
+                    == data["district_id"]
+                ]
+
+            if len(city_ids) == 1:
+                data["city_id"] = city_ids[0]
+
+        if "city_id" in data:
+            district_id, state_id = geography_index.get_city_parents(data["city_id"])
+            data.setdefault("district_id", district_id)
+            data.setdefault("state_id", state_id)
+
+        if instance is None:
+            errors = {
+                field: "server_required"
+                for field in ["city_id", "district_id", "state_id"]
+                if field not in data
+            }
+
+            if errors:
+                raise serializers.ValidationError(errors)
+
+        return data
+
+    @staticmethod
+    def validate_geography(data, instance=None):
+        """
+        Checks city_id, district_id, state_id and pincode against the in-memory
+        geography index, shared by the address endpoints and the bulk import.
+        """
+        checks = [
+            ("city_id", geography_index.has_city),
+            ("district_id", geography_index.has_district),
+            ("state_id", geography_index.has_state),
+        ]
+        errors = {
+            field: "server_absent"
+            for field, exists in checks
+            if field in data and not exists(data[field])
+        }
+
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        # Legacy addresses may disagree with the pincode data, so an edit only
+        # checks the pincode against the city when it changes either of them
+        check_pincode = "pincode" in data or "city_id" in data
+        data = BusinessAddressSerializer.fill_geography_from_pincode(data, instance)
+
+        city_id = data.get("city_id", getattr(instance, "city_id", None))
+        district_id = data.get("district_id", getattr(instance, "district_id", None))
+        state_id = data.get("state_id", getattr(instance, "state_id", None))
+
+        errors = geography_index.get_hierarchy_errors(city_id, district_id, state_id)
+
+        if check_pincode:
+            pincode = data.get("pincode", getattr(instance, "pincode", None))
+            pincode_city_ids = geography_index.get_pincode_city_ids(pincode)
+
+            if pincode_city_ids and city_id not in pincode_city_ids:
+                errors["pincode"] = "server_pincode_not_in_city"
+
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        return data
+
+    def validate(self, data):
+        return self.validate_geography(data, self.instance)
+
     class Meta:
         model = BusinessAddress
         fields = [
@@ -201,45 +252,30 @@ class BusinessAddressSerializer(ServerErrorModelSerializer):
 
     def create(self, validated_data):
         user = self.context["user"]
-        state = validated_data.pop("state_id")
 
-        is_default = validated_data["is_default"]
+        is_default = validated_data.get("is_default", False)
         is_default = is_default if user.get_business().addresses.count() > 0 else True
 
         instance = BusinessAddress(**validated_data)
         instance.business = user.get_business()
-        instance.state = state
         instance.is_default = is_default
-        instance.save()
 
-        if is_default:
-            queryset = user.get_business().addresses.exclude(id=instance.id)
-            queryset.update(is_default=False)
-
-        return instance
+        return DefaultRowUtil.save(instance)
 
     def update(self, instance, validated_data):
 
         instance.name = validated_data.get("name", instance.name)
         instance.address = validated_data.get("address", instance.address)
-        instance.city = validated_data.get("city", instance.city)
+        instance.city_id = validated_data.get("city_id", instance.city_id)
+        instance.district_id = validated_data.get("district_id", instance.district_id)
+        instance.state_id = validated_data.get("state_id", instance.state_id)
         instance.pincode = validated_data.get("pincode", instance.pincode)
         instance.address_type = validated_data.get(
             "address_type", instance.address_type
         )
-        instance.state = validated_data.get("state_id", instance.state)
         instance.is_default = validated_data.get("is_default", instance.is_default)
-        instance.save()
 
-        is_default = validated_data["is_default"]
-
-        if is_default:
-            queryset = BusinessAddress.objects.filter(
-                business_id=instance.business_id
-            ).exclude(id=instance.id)
-            queryset.update(is_default=False)
-
-        return instance
+        return DefaultRowUtil.save(instance)
 
 
 class ToggleDefaultBusinessAddressSerializer(ServerErrorModelSerializer):
@@ -255,15 +291,7 @@ class ToggleDefaultBusinessAddressSerializer(ServerErrorModelSerializer):
 
         instance.is_default = True if instance.is_default == False else False
 
-        all_other_addresses = BusinessAddress.objects.filter(
-            business_id=instance.business_id
-        ).exclude(id=instance.id)
-
-        with transaction.atomic():
-            instance.save()
-            all_other_addresses.update(is_default=False)
-
-        return instance
+        return DefaultRowUtil.save(instance)
 
 
 class BusinessContactSerializer(ServerErrorModelSerializer):
@@ -332,15 +360,20 @@ class BusinessContactSerializer(ServerErrorModelSerializer):
 
     def update(self, instance, validated_data):
 
-        instance.contact = validated_data.get("contact", instance.contact)
-        instance.contact_type = validated_data.get(
-            "contact_type", instance.contact_type
-        )
+        contact = validated_data.get("contact", instance.contact)
+        contact_type = validated_data.get("contact_type", instance.contact_type)
+
+        # A verification only holds for the contact that was verified
+        if (contact, contact_type) != (instance.contact, instance.contact_type):
+            instance.is_verified = False
+
+        instance.contact = contact
+        instance.contact_type = contact_type
         instance.save()
         return instance
 
 
-class BusinessSerializer(ServerErrorModelSerializer):
+class BusinessSerializer(ExpandableFieldsMixin, ServerErrorModelSerializer):
 
     owners = BusinessOwnerUserSerializer(many=True, read_only=True)
     contacts = BusinessContactSerializer(many=True, read_only=True)
@@ -364,6 +397,12 @@ class BusinessSerializer(ServerErrorModelSerializer):
             "accounts",
         ]
         read_only_fields = ["is_active", "is_claimed", "referral", "owners"]
+        expandable_fields = {
+            "owners": ("prefetch_related", "owners"),
+            "contacts": ("prefetch_related", "contacts"),
+            "addresses": ("prefetch_related", "addresses"),
+            "accounts": ("prefetch_related", "accounts"),
+        }
 
 
 class BusinessOnlySerializer(serializers.ModelSerializer):
@@ -380,12 +419,67 @@ class BusinessOnlySerializer(serializers.ModelSerializer):
         read_only_fields = ["is_active"]
 
 
+class ReferralBusinessSerializer(BusinessOnlySerializer):
+    depth = serializers.IntegerField(read_only=True)
+
+    class Meta(BusinessOnlySerializer.Meta):
+        fields = BusinessOnlySerializer.Meta.fields + [
+            "referral",
+            "is_claimed",
+            "depth",
+        ]
+
+
+class SuggestedLaboratorySerializer(BusinessOnlySerializer):
+    dentist_count = serializers.IntegerField(read_only=True)
+
+    class Meta(BusinessOnlySerializer.Meta):
+        fields = BusinessOnlySerializer.Meta.fields + ["dentist_count"]
+
+
+class DuplicateBusinessSerializer(BusinessOnlySerializer):
+    match = serializers.CharField(read_only=True)
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(BusinessOnlySerializer.Meta):
+        fields = BusinessOnlySerializer.Meta.fields + [
+            "is_claimed",
+            "match",
+            "similarity",
+        ]
+
+
+class PossibleDuplicatesSerializer(ServerErrorSerializer):
+    name = serializers.CharField(max_length=255)
+    gstin = serializers.CharField(required=False, allow_blank=True)
+    city_id = serializers.IntegerField(required=False)
+    pincode = serializers.CharField(max_length=6, required=False)
+
+    def validate(self, data):
+        if "city_id" not in data:
+            city_ids = geography_index.get_pincode_city_ids(data.get("pincode"))
+
+            if len(city_ids) != 1:
+                raise serializers.ValidationError({"city_id": "server_required"})
+
+            data["city_id"] = city_ids[0]
+
+        return data
+
+
+class ClaimCandidateSerializer(BusinessOnlySerializer):
+    matched_by = serializers.ListField(child=serializers.CharField(), read_only=True)
+
+    class Meta(BusinessOnlySerializer.Meta):
+        fields = BusinessOnlySerializer.Meta.fields + ["matched_by"]
+
+
 class BusinessWithOwnerSerializer(ServerErrorModelSerializer):
 
     name = serializers.CharField(max_length=255)
     gstin = serializers.CharField(
-        max_length=16,
-        min_length=16,
+        max_length=15,
+        min_length=15,
         required=False,
         allow_null=True,
         allow_blank=True,
@@ -402,6 +496,13 @@ class BusinessWithOwnerSerializer(ServerErrorModelSerializer):
     owner = BusinessOwnerUserSerializer(write_only=True)
     address = BusinessAddressSerializer(write_only=True)
 
+    def validate_gstin(self, gstin):
+        if DuplicateUtil.get_gstin_duplicates(gstin).exists():
+            message = "server_exists_already"
+            raise serializers.ValidationError(message)
+
+        return gstin
+
     class Meta:
         model = Business
         fields = [
@@ -439,8 +540,8 @@ class BusinessWithOwnerSerializer(ServerErrorModelSerializer):
         business = Business()
         business.name = validated_data["name"]
         business.category = validated_data["category"]
-        business.gstin = validated_data["gstin"]
-        business.website = validated_data["website"]
+        business.gstin = validated_data.get("gstin")
+        business.website = validated_data.get("website")
         business.referral = current_business
         business.is_claimed = False
 
@@ -450,9 +551,9 @@ class BusinessWithOwnerSerializer(ServerErrorModelSerializer):
         business_owner.is_active = True
 
         business_address = BusinessAddress()
-        business_address.city = address["city_id"]
-        business_address.district = address["district_id"]
-        business_address.state = address["state_id"]
+        business_address.city_id = address["city_id"]
+        business_address.district_id = address["district_id"]
+        business_address.state_id = address["state_id"]
         business_address.is_default = True
         business_address.address_type = "headquarters"
         business_address.address = address["address"]
@@ -470,7 +571,43 @@ class BusinessWithOwnerSerializer(ServerErrorModelSerializer):
         return business
 
 
-class OrderSerializer(ServerErrorModelSerializer):
+class BusinessImportRowSerializer(ServerErrorSerializer):
+    """One flat row of a bulk customer import, see BusinessImportUtil."""
+
+    name = serializers.CharField(max_length=255)
+    gstin = serializers.CharField(
+        max_length=15,
+        min_length=15,
+        required=False,
+        allow_null=True,
+        allow_blank=True,
+        trim_whitespace=True,
+    )
+    website = serializers.URLField(
+        required=False,
+        allow_null=True,
+        allow_blank=True,
+        trim_whitespace=True,
+    )
+    category = serializers.ChoiceField(choices=CATEGORY_CHOICES, default="dentist")
+
+    first_name = serializers.CharField(max_length=255)
+    last_name = serializers.CharField(max_length=255)
+    email = serializers.EmailField(max_length=254)
+    mobile = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+    address_name = serializers.CharField(max_length=255)
+    address = serializers.CharField()
+    pincode = serializers.CharField(max_length=6)
+    city_id = serializers.IntegerField(required=False)
+    district_id = serializers.IntegerField(required=False)
+    state_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        return BusinessAddressSerializer.validate_geography(data)
+
+
+class OrderSerializer(ExpandableFieldsMixin, ServerErrorModelSerializer):
 
     order_type = serializers.ChoiceField(read_only=True, choices=["placed", "received"])
     job_types = JobTypeSerializer(read_only=True, many=True)
@@ -588,6 +725,13 @@ class OrderSerializer(ServerErrorModelSerializer):
         create_only_fields = [
             "to_business_id",
         ]
+        expandable_fields = {
+            "from_business": ("select_related", "from_business"),
+            "from_user": ("select_related", "from_user"),
+            "job_types": ("prefetch_related", "job_types"),
+            "to_business": ("select_related", "to_business"),
+            "to_user": ("select_related", "to_user"),
+        }
 
     def create(self, validated_data):
         job_types = validated_data.pop("job_types_ids")
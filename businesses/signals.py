@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.response_cache import response_cache
+
+from businesses.models import (
+    Business,
+    BusinessAccount,
+    BusinessAddress,
+    BusinessConnect,
+    BusinessContact,
+    BusinessOwner,
+)
+from businesses.utils import ConnectionGraphUtil, DuplicateUtil
+
+
+def invalidate_responses_on_commit(business_ids, connected=False):
+    """
+    Drops the cached list responses and connections of business_ids once the
+    transaction commits. With connected, also those of their connected
+    businesses, whose customers_of_laboratory and connections embed them.
+    """
+    business_ids = list(business_ids)
+
+    def invalidate():
+        invalidated = set(business_ids)
+
+        if connected:
+            for business_id in business_ids:
+                invalidated.update(ConnectionGraphUtil.get_neighbors(business_id))
+
+        response_cache.invalidate(invalidated)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=BusinessConnect)
+@receiver(post_delete, sender=BusinessConnect)
+def invalidate_business_connect(sender, instance, **kwargs):
+    invalidate_responses_on_commit([instance.from_business_id, instance.to_business_id])
+
+
+@receiver(m2m_changed, sender=Business.connected_businesses.through)
+def invalidate_connected_businesses(sender, instance, action, pk_set, **kwargs):
+    # add()/remove() on Business.connected_businesses bulk write BusinessConnect
+    # rows without post_save, clear() does not even report the other ends.
+    if action == "pre_clear":
+        business_ids = set(ConnectionGraphUtil.get_neighbors(instance.pk))
+        business_ids.add(instance.pk)
+        invalidate_responses_on_commit(business_ids)
+
+    if action in ["post_add", "post_remove"]:
+        invalidate_responses_on_commit([instance.pk, *pk_set])
+
+
+# On commit, so a cascading delete does not re-create trigrams of a business
+# that is about to go away.
+@receiver(post_save, sender=Business)
+def reindex_business_name(sender, instance, created, update_fields, **kwargs):
+    # A new business has no address yet, its address save indexes it
+    if created or (update_fields is not None and "name" not in update_fields):
+        return
+
+    business_id = instance.pk
+    transaction.on_commit(lambda: DuplicateUtil.reindex([business_id]))
+
+
+@receiver(post_save, sender=BusinessAddress)
+@receiver(post_delete, sender=BusinessAddress)
+def reindex_business_address(sender, instance, **kwargs):
+    business_id = instance.business_id
+    transaction.on_commit(lambda: DuplicateUtil.reindex([business_id]))
+
+
+@receiver(post_save, sender=Business)
+@receiver(post_delete, sender=Business)
+@receiver(post_save, sender=BusinessOwner)
+@receiver(post_delete, sender=BusinessOwner)
+@receiver(post_save, sender=BusinessAddress)
+@receiver(post_delete, sender=BusinessAddress)
+@receiver(post_save, sender=BusinessContact)
+@receiver(post_delete, sender=BusinessContact)
+@receiver(post_save, sender=BusinessAccount)
+@receiver(post_delete, sender=BusinessAccount)
+def invalidate_business_responses(sender, instance, **kwargs):
+    business_id = instance.pk if sender is Business else instance.business_id
+    invalidate_responses_on_commit([business_id], connected=True)
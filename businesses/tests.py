@@ -1,3 +1,889 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from businesses.models import (
+    Business,
+    BusinessAccount,
+    BusinessAddress,
+    BusinessConnect,
+    BusinessContact,
+    BusinessOwner,
+    Order,
+)
+from businesses.utils import (
+    ClaimUtil,
+    ConnectionGraphUtil,
+    DefaultRowUtil,
+    DuplicateUtil,
+    ReferralUtil,
+)
+from core.geography import geography_index
+from core.models import City, District, Pincode, State
+from core.response_cache import SQLiteResponseStore, response_cache
+from users.models import EmailUser
+
+
+# Transactional, the signals invalidate on commit
+class BusinessResponseCacheTests(TransactionTestCase):
+    def setUp(self):
+        response_cache.clear()
+
+        self.owner = EmailUser.objects.create_user(
+            "owner@example.com", "password123", user_type="owner"
+        )
+        self.business = Business.objects.create(name="Lab", category="laboratory")
+        BusinessOwner.objects.create(business=self.business, owner=self.owner)
+
+        self.dentist = Business.objects.create(name="Clinic", category="dentist")
+        BusinessConnect.objects.create(
+            from_business=self.business, to_business=self.dentist
+        )
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        return response
+
+    def test_contacts_are_cached_until_they_change(self):
+        url = "/api/business/contacts/"
+
+        self.assertEqual(self.get(url)["X-Cache"], "MISS")
+        self.assertEqual(self.get(url)["X-Cache"], "HIT")
+
+        BusinessContact.objects.create(business=self.business, contact="9876543210")
+
+        response = self.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data[0]["contact"], "9876543210")
+        self.assertEqual(self.get(url)["X-Cache"], "HIT")
+
+    def test_customers_change_with_a_connected_business(self):
+        url = "/api/businesses/customers_of_laboratory/"
+
+        self.get(url)
+        self.assertEqual(self.get(url)["X-Cache"], "HIT")
+
+        BusinessContact.objects.create(business=self.dentist, contact="9876543210")
+
+        response = self.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(
+            response.data["results"][0]["contacts"][0]["contact"], "9876543210"
+        )
+
+        stats = response_cache.get_stats()["endpoints"]
+        self.assertEqual(
+            stats["businesses:customers_of_laboratory"],
+            {"hits": 1, "misses": 2, "hit_ratio": 1 / 3},
+        )
+
+    def get_customer_ids(self):
+        response = self.get("/api/businesses/customers_of_laboratory/")
+        return response["X-Cache"], [item["id"] for item in response.data["results"]]
+
+    def test_import_refreshes_the_customers(self):
+        state = State.objects.create(name="State", gst_code=27)
+        district = District.objects.create(name="District", state=state)
+        city = City.objects.create(name="City", district=district)
+
+        self.assertEqual(self.get_customer_ids(), ("MISS", [self.dentist.id]))
+
+        response = self.client.post(
+            "/api/businesses/import_customers/",
+            [
+                {
+                    "name": "Imported clinic",
+                    "first_name": "Imported",
+                    "last_name": "Dentist",
+                    "email": "imported@example.com",
+                    "address_name": "Clinic",
+                    "address": "Road",
+                    "pincode": "400001",
+                    "city_id": city.id,
+                    "district_id": district.id,
+                    "state_id": state.id,
+                }
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+
+        imported_id = response.data["rows"][0]["business_id"]
+        cache_status, customer_ids = self.get_customer_ids()
+
+        self.assertEqual(cache_status, "MISS")
+        self.assertEqual(sorted(customer_ids), sorted([self.dentist.id, imported_id]))
+
+    def test_claim_refreshes_the_customers(self):
+        Business.objects.filter(id=self.dentist.id).update(is_claimed=False)
+
+        claimant = EmailUser.objects.create_user(
+            "dentist@example.com",
+            "password123",
+            user_type="owner",
+            is_email_verified=True,
+        )
+        clinic = Business.objects.create(name="My clinic", category="dentist")
+        BusinessOwner.objects.create(business=clinic, owner=claimant)
+        BusinessContact.objects.create(
+            business=self.dentist, contact="dentist@example.com", contact_type="email"
+        )
+
+        self.assertEqual(self.get_customer_ids(), ("MISS", [self.dentist.id]))
+
+        ClaimUtil.claim(claimant, clinic, self.dentist)
+
+        self.assertEqual(self.get_customer_ids(), ("MISS", [clinic.id]))
+
+
+# Transactional, the signals invalidate on commit
+class ConnectionGraphTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "responses.sqlite3")
+
+        # Two worker processes, each with its own store on the same file
+        self.stores = [SQLiteResponseStore(path), SQLiteResponseStore(path)]
+        self.addCleanup(setattr, response_cache, "store", None)
+
+        self.lab = Business.objects.create(name="Lab", category="laboratory")
+        self.dentist = Business.objects.create(name="Clinic", category="dentist")
+        BusinessConnect.objects.create(from_business=self.lab, to_business=self.dentist)
+
+    def get_neighbors(self, worker, business_id):
+        response_cache.store = self.stores[worker]
+        return ConnectionGraphUtil.get_neighbors(business_id)
+
+    def test_connections_are_shared_between_workers(self):
+        self.assertEqual(
+            self.get_neighbors(0, self.lab.id), {self.dentist.id: "dentist"}
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.get_neighbors(1, self.lab.id), {self.dentist.id: "dentist"}
+            )
+
+        other_lab = Business.objects.create(name="Other lab", category="laboratory")
+        BusinessConnect.objects.create(from_business=other_lab, to_business=self.lab)
+
+        self.assertEqual(
+            self.get_neighbors(0, self.lab.id),
+            {self.dentist.id: "dentist", other_lab.id: "laboratory"},
+        )
+
+    def test_category_change_reaches_the_connected_businesses(self):
+        self.get_neighbors(0, self.lab.id)
+
+        self.dentist.category = "laboratory"
+        self.dentist.save()
+
+        self.assertEqual(
+            self.get_neighbors(1, self.lab.id), {self.dentist.id: "laboratory"}
+        )
+
+
+class DuplicateCheckTests(TestCase):
+    def setUp(self):
+        state = State.objects.create(name="State", gst_code=27)
+        district = District.objects.create(name="District", state=state)
+        self.city = City.objects.create(name="City", district=district)
+        self.other_city = City.objects.create(name="Other city", district=district)
+
+        self.lab = self.create_business(
+            "Sharma Dental Lab", self.city, gstin="27AAPFU0939F1ZV"
+        )
+        self.elsewhere = self.create_business("Sharma Dental Lab", self.other_city)
+        self.unrelated = self.create_business("Smile Clinic", self.city)
+
+        # The address signals reindex on commit, which a TestCase never reaches
+        DuplicateUtil.reindex([self.lab.id, self.elsewhere.id, self.unrelated.id])
+
+    def create_business(self, name, city, gstin=None):
+        business = Business.objects.create(name=name, gstin=gstin)
+        BusinessAddress.objects.create(
+            business=business,
+            name="Headquarters",
+            address="Road",
+            pincode="400001",
+            city=city,
+            district=city.district,
+            state=city.district.state,
+            is_default=True,
+        )
+
+        return business
+
+    def get_matches(self, *args, **kwargs):
+        return [
+            (business.id, business.match, business.similarity)
+            for business in DuplicateUtil.get_possible_duplicates(*args, **kwargs)
+        ]
+
+    def test_gstin_match_ignores_formatting(self):
+        self.assertEqual(
+            self.get_matches("Unrelated name", None, gstin=" 27aapfu0939f1zv "),
+            [(self.lab.id, "gstin", 1.0)],
+        )
+        self.assertEqual(
+            self.get_matches(
+                "Unrelated name", None, gstin="27AAPFU0939F1ZV", exclude_id=self.lab.id
+            ),
+            [],
+        )
+
+    def test_name_match_is_fuzzy_and_per_city(self):
+        [(business_id, match, similarity)] = self.get_matches(
+            "Sharma Dental Labs", self.city.id
+        )
+
+        self.assertEqual((business_id, match), (self.lab.id, "name"))
+        self.assertGreaterEqual(similarity, 0.5)
+        self.assertLess(similarity, 1.0)
+
+        self.assertEqual(self.get_matches("Verma Ortho Studio", self.city.id), [])
+
+    def test_gstin_match_comes_first_and_once(self):
+        self.assertEqual(
+            self.get_matches(
+                "Sharma Dental Lab", self.city.id, gstin="27AAPFU0939F1ZV"
+            ),
+            [(self.lab.id, "gstin", 1.0)],
+        )
+
+    def test_possible_duplicates_endpoint(self):
+        user = EmailUser.objects.create_user(
+            "owner@example.com", "password123", user_type="owner"
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get(
+            "/api/businesses/possible_duplicates/",
+            {"name": "Sharma Dental", "city_id": self.other_city.id},
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [(item["id"], item["match"]) for item in response.data],
+            [(self.elsewhere.id, "name")],
+        )
+
+
+class DefaultRowTests(TestCase):
+    def setUp(self):
+        state = State.objects.create(name="State", gst_code=27)
+        district = District.objects.create(name="District", state=state)
+        self.city = City.objects.create(name="City", district=district)
+        self.business = Business.objects.create(name="Lab")
+
+    def create_address(self, name, is_default=False):
+        return BusinessAddress.objects.create(
+            business=self.business,
+            name=name,
+            address="Road",
+            pincode="400001",
+            city=self.city,
+            district=self.city.district,
+            state=self.city.district.state,
+            is_default=is_default,
+        )
+
+    def create_account(self, account_number, is_default=False):
+        return BusinessAccount.objects.create(
+            business=self.business,
+            account_name="Lab",
+            account_number=account_number,
+            bank_name="Bank",
+            ifsc_code="BANK0000001",
+            is_default=is_default,
+        )
+
+    def get_default_ids(self, model):
+        return list(
+            model.objects.filter(business=self.business, is_default=True).values_list(
+                "id", flat=True
+            )
+        )
+
+    def test_second_default_row_is_rejected(self):
+        self.create_address("Headquarters", is_default=True)
+        self.create_account(1, is_default=True)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_address("Branch", is_default=True)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_account(2, is_default=True)
+
+        # Other businesses and non default rows are not affected
+        self.create_address("Branch")
+        other = Business.objects.create(name="Clinic")
+        BusinessAccount.objects.create(
+            business=other,
+            account_name="Clinic",
+            account_number=3,
+            bank_name="Bank",
+            ifsc_code="BANK0000001",
+            is_default=True,
+        )
+
+    def test_save_as_default_leaves_one_default(self):
+        headquarters = self.create_address("Headquarters", is_default=True)
+        branch = self.create_address("Branch")
+
+        DefaultRowUtil.save_as_default(branch)
+        self.assertEqual(self.get_default_ids(BusinessAddress), [branch.id])
+
+        new = BusinessAddress(
+            business=self.business,
+            name="New branch",
+            address="Road",
+            pincode="400001",
+            city=self.city,
+            district=self.city.district,
+            state=self.city.district.state,
+            is_default=True,
+        )
+        DefaultRowUtil.save(new)
+        self.assertEqual(self.get_default_ids(BusinessAddress), [new.id])
+
+        headquarters.refresh_from_db()
+        self.assertFalse(headquarters.is_default)
+
+        account = self.create_account(1, is_default=True)
+        other_account = self.create_account(2)
+
+        DefaultRowUtil.save_as_default(other_account)
+        self.assertEqual(self.get_default_ids(BusinessAccount), [other_account.id])
+
+        account.refresh_from_db()
+        self.assertFalse(account.is_default)
+
+    def test_save_as_default_retries_a_lost_race(self):
+        self.create_address("Headquarters", is_default=True)
+        branch = self.create_address("Branch")
+        save = branch.save
+        calls = []
+
+        def save_after_a_conflict(*args, **kwargs):
+            calls.append(args)
+
+            if len(calls) == 1:
+                raise IntegrityError("unique_default_business_address")
+
+            save(*args, **kwargs)
+
+        with mock.patch.object(branch, "save", save_after_a_conflict):
+            DefaultRowUtil.save_as_default(branch)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.get_default_ids(BusinessAddress), [branch.id])
+
+
+class ImportCustomersTests(TestCase):
+    url = "/api/businesses/import_customers/"
+
+    def setUp(self):
+        state = State.objects.create(name="State", gst_code=27)
+        district = District.objects.create(name="District", state=state)
+        self.city = City.objects.create(name="City", district=district)
+
+        self.owner = EmailUser.objects.create_user(
+            "owner@example.com", "password123", user_type="owner"
+        )
+        self.business = Business.objects.create(
+            name="Lab", category="laboratory", gstin="27AAPFU0939F1ZV"
+        )
+        BusinessOwner.objects.create(business=self.business, owner=self.owner)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def get_row(self, number, **fields):
+        return {
+            "name": f"Clinic {number}",
+            "first_name": "Imported",
+            "last_name": "Dentist",
+            "email": f"dentist{number}@example.com",
+            "address_name": "Clinic",
+            "address": "Road",
+            "pincode": "400001",
+            "city_id": self.city.id,
+            **fields,
+        }
+
+    def get_statuses(self, response):
+        return [(row["status"], row.get("errors")) for row in response.data["rows"]]
+
+    def test_rows_are_reported_one_by_one(self):
+        response = self.client.post(
+            self.url,
+            [
+                self.get_row(1, gstin="27aabcu9603r1zm", mobile="9876543210"),
+                self.get_row(2, gstin="27AABCU9603R1Z"),
+                self.get_row(3, email=None),
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data["created"], response.data["failed"]), (1, 2))
+
+        statuses = self.get_statuses(response)
+        self.assertEqual(statuses[0], ("created", None))
+        self.assertEqual(statuses[1][0], "invalid")
+        self.assertEqual(list(statuses[1][1]), ["gstin"])
+        self.assertEqual(statuses[2][0], "invalid")
+        self.assertEqual(list(statuses[2][1]), ["email"])
+
+        business = Business.objects.get(id=response.data["rows"][0]["business_id"])
+        self.assertEqual(business.gstin_normalized, "27AABCU9603R1ZM")
+        self.assertFalse(business.is_claimed)
+        self.assertEqual(business.referral, self.business)
+        self.assertEqual(business.owners.get().mobile, 9876543210)
+        self.assertTrue(business.addresses.get().is_default)
+        self.assertTrue(
+            BusinessConnect.objects.filter(
+                from_business=self.business, to_business=business
+            ).exists()
+        )
+        self.assertFalse(Business.objects.filter(name="Clinic 2").exists())
+
+    def test_duplicates_within_the_file(self):
+        response = self.client.post(
+            self.url,
+            [
+                self.get_row(1, email="Same@example.com"),
+                self.get_row(2, email="same@EXAMPLE.com"),
+                self.get_row(3, gstin="27AABCU9603R1ZM"),
+                self.get_row(4, gstin=" 27aabcu9603r1zm "),
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.get_statuses(response),
+            [
+                ("duplicate", {"email": "server_duplicate_in_file"}),
+                ("duplicate", {"email": "server_duplicate_in_file"}),
+                ("duplicate", {"gstin": "server_duplicate_in_file"}),
+                ("duplicate", {"gstin": "server_duplicate_in_file"}),
+            ],
+        )
+        self.assertFalse(Business.objects.filter(name__startswith="Clinic").exists())
+
+    def test_duplicates_of_existing_rows(self):
+        response = self.client.post(
+            self.url,
+            [
+                self.get_row(1, email="OWNER@example.com"),
+                self.get_row(2, gstin="27aapfu0939f1zv"),
+            ],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.get_statuses(response),
+            [
+                ("duplicate", {"email": "server_exists_already"}),
+                ("duplicate", {"gstin": "server_exists_already"}),
+            ],
+        )
+
+    def test_csv_upload(self):
+        row = self.get_row(1)
+        content = ",".join(row) + "\n" + ",".join(str(value) for value in row.values())
+        upload = io.BytesIO(content.encode("utf-8"))
+        upload.name = "customers.csv"
+
+        response = self.client.post(self.url, {"file": upload}, format="multipart")
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.get_statuses(response), [("created", None)])
+        self.assertTrue(EmailUser.objects.filter(email="dentist1@example.com").exists())
+
+
+class AddressGeographyTests(TestCase):
+    url = "/api/business/addresses/"
+
+    def setUp(self):
+        self.state = State.objects.create(name="State", gst_code=27)
+        self.district = District.objects.create(name="District", state=self.state)
+        self.city = City.objects.create(name="City", district=self.district)
+
+        self.other_state = State.objects.create(name="Other state", gst_code=29)
+        self.other_district = District.objects.create(
+            name="Other district", state=self.other_state
+        )
+        self.other_city = City.objects.create(
+            name="Other city", district=self.other_district
+        )
+
+        # The core signals reload the index on commit, which a TestCase never reaches
+        geography_index.invalidate()
+        self.addCleanup(geography_index.invalidate)
+
+        owner = EmailUser.objects.create_user(
+            "owner@example.com", "password123", user_type="owner"
+        )
+        self.business = Business.objects.create(name="Lab", category="laboratory")
+        BusinessOwner.objects.create(business=self.business, owner=owner)
+
+        self.client = APIClient()
+        self.client.force_authenticate(owner)
+
+    def post(self, **fields):
+        return self.client.post(
+            self.url,
+            {
+                "name": "Headquarters",
+                "address": "Road",
+                "pincode": "400001",
+                "address_type": "headquarters",
+                **fields,
+            },
+            format="json",
+        )
+
+    def test_parents_are_filled_from_the_city(self):
+        response = self.post(city_id=self.city.id)
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            (response.data["city"], response.data["district"], response.data["state"]),
+            (self.city.id, self.district.id, self.state.id),
+        )
+
+        address = BusinessAddress.objects.get(business=self.business)
+        self.assertEqual(address.state_id, self.state.id)
+
+    def test_matching_ids_are_accepted(self):
+        response = self.post(
+            city_id=self.city.id, district_id=self.district.id, state_id=self.state.id
+        )
+
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_mismatched_ids_are_rejected(self):
+        response = self.post(
+            city_id=self.city.id,
+            district_id=self.other_district.id,
+            state_id=self.other_state.id,
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"city_id": ["server_city_not_in_district"]})
+
+        response = self.post(
+            city_id=self.other_city.id,
+            district_id=self.other_district.id,
+            state_id=self.state.id,
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data, {"district_id": ["server_district_not_in_state"]}
+        )
+
+        response = self.post(city_id=0, district_id=self.district.id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"city_id": ["server_absent"]})
+
+        self.assertFalse(BusinessAddress.objects.exists())
+
+    def test_hierarchy_errors(self):
+        self.assertEqual(
+            geography_index.get_hierarchy_errors(
+                self.city.id, self.district.id, self.state.id
+            ),
+            {},
+        )
+        self.assertEqual(
+            geography_index.get_hierarchy_errors(
+                self.other_city.id, self.district.id, self.other_state.id
+            ),
+            {
+                "city_id": "server_city_not_in_district",
+                "district_id": "server_district_not_in_state",
+            },
+        )
+        # Ids that do not exist are reported by the existence checks
+        self.assertEqual(geography_index.get_hierarchy_errors(0, 0, 0), {})
+
+    def add_pincodes(self):
+        Pincode.objects.create(code="400001", city=self.city)
+        Pincode.objects.create(code="400002", city=self.city)
+        Pincode.objects.create(code="560001", city=self.other_city)
+        geography_index.invalidate()
+
+    def test_pincodes_are_searched_by_prefix(self):
+        self.add_pincodes()
+
+        self.assertEqual(
+            [place["pincode"] for place in geography_index.search_pincodes("4000", 1)],
+            ["400001"],
+        )
+
+        response = self.client.get("/api/pincodes/", {"search": "4000"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data,
+            [
+                {
+                    "pincode": code,
+                    "city_id": self.city.id,
+                    "city": "City",
+                    "district_id": self.district.id,
+                    "district": "District",
+                    "state_id": self.state.id,
+                    "state": "State",
+                }
+                for code in ["400001", "400002"]
+            ],
+        )
+
+        response = self.client.get("/api/pincodes/", {"search": "40000A"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_geography_is_filled_from_the_pincode(self):
+        self.add_pincodes()
+
+        response = self.post(pincode="560001")
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            (response.data["city"], response.data["district"], response.data["state"]),
+            (self.other_city.id, self.other_district.id, self.other_state.id),
+        )
+
+        response = self.post(
+            pincode="560001", city_id=self.city.id, address_type="branch"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"pincode": ["server_pincode_not_in_city"]})
+
+    def test_legacy_addresses_are_only_checked_on_pincode_changes(self):
+        self.add_pincodes()
+        address = BusinessAddress.objects.create(
+            name="Headquarters",
+            address="Road",
+            pincode="400001",
+            business=self.business,
+            city=self.other_city,
+            district=self.other_district,
+            state=self.other_state,
+        )
+        url = f"{self.url}{address.id}/"
+
+        response = self.client.patch(url, {"name": "Office"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+
+        response = self.client.patch(
+            url, {"city_id": self.other_city.id}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"pincode": ["server_pincode_not_in_city"]})
+
+
+class ExpandableFieldsTests(TestCase):
+    def setUp(self):
+        owner = EmailUser.objects.create_user(
+            "owner@example.com", "password123", user_type="owner"
+        )
+        self.business = Business.objects.create(name="Lab", category="laboratory")
+        BusinessOwner.objects.create(business=self.business, owner=owner)
+        BusinessContact.objects.create(business=self.business, contact="9876543210")
+
+        self.dentist = Business.objects.create(name="Clinic", category="dentist")
+        Order.objects.create(
+            doctor_name="Doctor",
+            patient_name="Patient",
+            patient_age=30,
+            teeth={},
+            from_business=self.dentist,
+            from_user=owner,
+            to_business=self.business,
+        )
+
+        self.client = APIClient()
+        self.client.force_authenticate(owner)
+
+    def get_results(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+
+        self.assertEqual(response.status_code, 200)
+        self.queries = " ".join(query["sql"] for query in queries.captured_queries)
+
+        return response.data["results"]
+
+    def get_business(self, params=None):
+        results = self.get_results("/api/businesses/", params)
+        return next(item for item in results if item["id"] == self.business.id)
+
+    def test_fields_limits_the_fields_and_the_queries(self):
+        self.assertEqual(
+            dict(self.get_business({"fields": "id,name"})),
+            {"id": self.business.id, "name": "Lab"},
+        )
+        self.assertNotIn("businesses_businesscontact", self.queries)
+
+    def test_expand_embeds_only_the_listed_fields(self):
+        business = self.get_business({"expand": "contacts"})
+
+        self.assertIn("name", business)
+        self.assertEqual(business["contacts"][0]["contact"], "9876543210")
+        self.assertNotIn("owners", business)
+        self.assertNotIn("addresses", business)
+        self.assertNotIn("businesses_businessaddress", self.queries)
+
+        business = self.get_business()
+        self.assertEqual(
+            {"owners", "contacts", "addresses", "accounts"} - set(business), set()
+        )
+
+    def test_unknown_names_are_ignored(self):
+        self.assertEqual(
+            dict(self.get_business({"fields": "id,bogus", "expand": "bogus"})),
+            {"id": self.business.id},
+        )
+
+    def test_nested_serializers_are_not_pruned(self):
+        # The nested serializers share the request of the context, but only
+        # the top level one reads fields
+        business = self.get_business({"fields": "id,contacts"})
+
+        self.assertEqual(list(business), ["id", "contacts"])
+        self.assertEqual(
+            set(business["contacts"][0]),
+            {
+                "id",
+                "contact",
+                "contact_type",
+                "is_verified",
+                "created_at",
+                "modified_at",
+                "business",
+            },
+        )
+
+    def test_foreign_keys_that_are_not_expanded_are_ids(self):
+        [order] = self.get_results("/api/orders/", {"expand": "to_business"})
+
+        self.assertEqual(order["to_business"]["name"], "Lab")
+        self.assertEqual(order["from_business"], self.dentist.id)
+        self.assertNotIn("job_types", order)
+
+        [order] = self.get_results("/api/orders/", {"fields": "id,from_business"})
+
+        self.assertEqual(list(order), ["id", "from_business"])
+        self.assertEqual(order["from_business"]["name"], "Clinic")
+
+
+class ReferralTests(TestCase):
+    def setUp(self):
+        self.root = Business.objects.create(name="Root", category="laboratory")
+        # Ten direct referrals, the first one with a chain of three below it
+        self.children = [
+            Business.objects.create(name=f"Child {index}", referral=self.root)
+            for index in range(10)
+        ]
+        self.chain = []
+        referral = self.children[0]
+
+        for depth in range(2, 5):
+            referral = Business.objects.create(name=f"Depth {depth}", referral=referral)
+            self.chain.append(referral)
+
+        owner = EmailUser.objects.create_user(
+            "owner@example.com", "password123", user_type="owner"
+        )
+        BusinessOwner.objects.create(business=self.root, owner=owner)
+
+        self.client = APIClient()
+        self.client.force_authenticate(owner)
+
+    def get_depths(self, businesses):
+        return [(business.id, business.depth) for business in businesses]
+
+    def test_descendants_stop_at_the_max_depth(self):
+        descendants = ReferralUtil.get_descendants(self.root.id, max_depth=3)
+
+        self.assertEqual(len(descendants), 12)
+        self.assertEqual(
+            self.get_depths(descendants)[-2:],
+            [(self.chain[0].id, 2), (self.chain[1].id, 3)],
+        )
+        self.assertEqual(
+            ReferralUtil.get_downline_counts(self.root.id, max_depth=3)["levels"],
+            [
+                {"depth": 1, "count": 10},
+                {"depth": 2, "count": 1},
+                {"depth": 3, "count": 1},
+            ],
+        )
+        self.assertEqual(
+            self.get_depths(ReferralUtil.get_ancestors(self.chain[2].id, max_depth=2)),
+            [(self.chain[1].id, 1), (self.chain[0].id, 2)],
+        )
+
+    def test_cycles_list_each_business_once(self):
+        Business.objects.filter(id=self.root.id).update(referral=self.chain[2])
+
+        descendants = ReferralUtil.get_descendants(self.root.id)
+
+        self.assertEqual(len(descendants), 13)
+        self.assertEqual(
+            len({business.id for business in descendants}), len(descendants)
+        )
+        self.assertNotIn(self.root.id, [business.id for business in descendants])
+        self.assertEqual(ReferralUtil.get_downline_counts(self.root.id)["total"], 13)
+
+        ancestors = ReferralUtil.get_ancestors(self.root.id)
+
+        self.assertEqual(
+            self.get_depths(ancestors),
+            [
+                (self.chain[2].id, 1),
+                (self.chain[1].id, 2),
+                (self.chain[0].id, 3),
+                (self.children[0].id, 4),
+            ],
+        )
+
+    def test_descendants_are_paginated_in_sql(self):
+        url = f"/api/businesses/{self.root.id}/referral_descendants/"
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"page": 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_items"], 13)
+        self.assertEqual(
+            [(item["id"], item["depth"]) for item in response.data["results"]],
+            [(child.id, 1) for child in self.children[8:]]
+            + [(self.chain[0].id, 2), (self.chain[1].id, 3), (self.chain[2].id, 4)],
+        )
+        self.assertTrue(
+            any("LIMIT" in query["sql"] for query in queries.captured_queries)
+        )
@@ -0,0 +1,949 @@
+import csv
+import io
+import math
+from collections import Counter
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Q
+
+from rest_framework import serializers
+
+from core.response_cache import response_cache
+from core.utils import BulkUtil
+
+from users.models import EmailUser
+
+from businesses.constants import (
+    BUSINESS_IMPORT_LOOKUP_CHUNK,
+    BUSINESS_IMPORT_MAX_ROWS,
+    BUSINESS_NAME_STOP_WORDS,
+    CONNECTION_PATH_MAX_DEPTH,
+    DEFAULT_SWITCH_ATTEMPTS,
+    DUPLICATE_NAME_LIMIT,
+    DUPLICATE_NAME_THRESHOLD,
+    DUPLICATE_REINDEX_CHUNK,
+    REFERRAL_MAX_DEPTH,
+)
+from businesses.models import (
+    Business,
+    BusinessAddress,
+    BusinessConnect,
+    BusinessContact,
+    BusinessEmployee,
+    BusinessNameTrigram,
+    BusinessOwner,
+    Order,
+)
+
+
+class ReferralUtil:
+    """
+    Walks the Business.referral tree with a single recursive CTE per call.
+    Every step of the recursion is a lookup on the indexed referral_id column.
+
+    The recursion stops at max_depth. A referral cycle would repeat
+    businesses, so each one is kept once, at its smallest depth, and the
+    business itself is left out.
+    """
+
+    ANCESTORS_CTE = """
+        WITH RECURSIVE ancestors(id, depth) AS (
+            SELECT referral_id, 1 FROM {table} WHERE id = %s
+            UNION ALL
+            SELECT business.referral_id, ancestors.depth + 1
+            FROM {table} AS business
+            JOIN ancestors ON business.id = ancestors.id
+            WHERE ancestors.depth < %s
+        ),
+        upline(id, depth) AS (
+            SELECT id, MIN(depth) FROM ancestors WHERE id != %s GROUP BY id
+        )
+    """
+
+    DESCENDANTS_CTE = """
+        WITH RECURSIVE descendants(id, depth) AS (
+            SELECT id, 1 FROM {table} WHERE referral_id = %s
+            UNION ALL
+            SELECT business.id, descendants.depth + 1
+            FROM {table} AS business
+            JOIN descendants ON business.referral_id = descendants.id
+            WHERE descendants.depth < %s
+        ),
+        downline(id, depth) AS (
+            SELECT id, MIN(depth) FROM descendants WHERE id != %s GROUP BY id
+        )
+    """
+
+    @staticmethod
+    def get_table():
+        return connection.ops.quote_name(Business._meta.db_table)
+
+    @staticmethod
+    def get_ancestors(business_id, max_depth=REFERRAL_MAX_DEPTH):
+        """Referrers of the business, nearest first, each with a depth."""
+        table = ReferralUtil.get_table()
+
+        sql = ReferralUtil.ANCESTORS_CTE.format(table=table) + (
+            f"SELECT {table}.*, upline.depth FROM {table} "
+            f"JOIN upline ON {table}.id = upline.id "
+            "ORDER BY upline.depth"
+        )
+
+        return list(Business.objects.raw(sql, [business_id, max_depth, business_id]))
+
+    @staticmethod
+    def get_descendants(business_id, max_depth=REFERRAL_MAX_DEPTH):
+        """
+        Downline of the business ordered by depth, each with a depth. Nothing
+        is loaded until it is iterated or sliced.
+        """
+        return ReferralDescendants(business_id, max_depth)
+
+    @staticmethod
+    def get_downline_counts(business_id, max_depth=REFERRAL_MAX_DEPTH):
+        table = ReferralUtil.get_table()
+
+        sql = ReferralUtil.DESCENDANTS_CTE.format(table=table) + (
+            "SELECT depth, COUNT(*) FROM downline GROUP BY depth ORDER BY depth"
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [business_id, max_depth, business_id])
+            rows = cursor.fetchall()
+
+        return {
+            "total": sum(count for depth, count in rows),
+            "levels": [{"depth": depth, "count": count} for depth, count in rows],
+        }
+
+
+class ReferralDescendants:
+    """
+    Downline of a business for the Paginator, counted and sliced in SQL so a
+    page only loads its own rows.
+    """
+
+    def __init__(self, business_id, max_depth):
+        self.business_id = business_id
+        self.max_depth = max_depth
+
+    def get_params(self):
+        return [self.business_id, self.max_depth, self.business_id]
+
+    def count(self):
+        sql = ReferralUtil.DESCENDANTS_CTE + "SELECT COUNT(*) FROM downline"
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql.format(table=ReferralUtil.get_table()), self.get_params()
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def get_businesses(self, limit=None, offset=0):
+        table = ReferralUtil.get_table()
+        sql = ReferralUtil.DESCENDANTS_CTE.format(table=table) + (
+            f"SELECT {table}.*, downline.depth FROM {table} "
+            f"JOIN downline ON {table}.id = downline.id "
+            f"ORDER BY downline.depth, {table}.id"
+        )
+        params = self.get_params()
+
+        if limit is not None:
+            sql += " LIMIT %s OFFSET %s"
+            params += [limit, offset]
+
+        return list(Business.objects.raw(sql, params))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = index.start or 0
+            stop = index.stop if index.stop is not None else self.count()
+
+            return self.get_businesses(max(0, stop - start), start)
+
+        return self.get_businesses(1, index)[0]
+
+    def __iter__(self):
+        return iter(self.get_businesses())
+
+
+class ConnectionGraphUtil:
+    """
+    Answers connection queries from per business adjacency lists kept in
+    core.response_cache, so walking the graph costs a cache lookup per hop and
+    one query per hop only for the businesses that are not cached yet.
+
+    The adjacency of a business is {"out": {id: category}, "in": {id: category}}
+    built from its active BusinessConnect rows. It is cached under the
+    generation of the business, which businesses.signals bumps for both ends
+    whenever a BusinessConnect row is written and for the connected businesses
+    whenever a business changes. With the SQLite store that reaches every
+    worker process, with the local memory one only the current process.
+    """
+
+    @staticmethod
+    def build_adjacency(business_ids):
+        adjacency = {business_id: {"out": {}, "in": {}} for business_id in business_ids}
+
+        rows = BusinessConnect.objects.filter(
+            Q(from_business_id__in=business_ids) | Q(to_business_id__in=business_ids),
+            is_active=True,
+        ).values_list(
+            "from_business_id",
+            "from_business__category",
+            "to_business_id",
+            "to_business__category",
+        )
+
+        for from_id, from_category, to_id, to_category in rows:
+            if from_id in adjacency:
+                adjacency[from_id]["out"][to_id] = to_category
+
+            if to_id in adjacency:
+                adjacency[to_id]["in"][from_id] = from_category
+
+        return adjacency
+
+    @staticmethod
+    def get_adjacency(business_ids):
+        return response_cache.get_values(
+            set(business_ids), "connections", ConnectionGraphUtil.build_adjacency
+        )
+
+    @staticmethod
+    def merge_directions(adjacency):
+        neighbors = dict(adjacency["in"])
+        neighbors.update(adjacency["out"])
+        return neighbors
+
+    @staticmethod
+    def get_neighbors(business_id):
+        """Connected businesses in both directions as {id: category}."""
+        adjacency = ConnectionGraphUtil.get_adjacency([business_id])
+        return ConnectionGraphUtil.merge_directions(adjacency[business_id])
+
+    @staticmethod
+    def get_mutual_connections(business_id, other_business_id):
+        adjacency = ConnectionGraphUtil.get_adjacency([business_id, other_business_id])
+
+        neighbors = ConnectionGraphUtil.merge_directions(adjacency[business_id])
+        other_neighbors = ConnectionGraphUtil.merge_directions(
+            adjacency[other_business_id]
+        )
+
+        return sorted(set(neighbors) & set(other_neighbors))
+
+    @staticmethod
+    def get_suggested_laboratories(business_id):
+        """
+        Laboratories used by the dentists connected to the business, that the
+        business is not connected to yet, as [(laboratory_id, dentist_count)]
+        with the most shared dentists first.
+        """
+        neighbors = ConnectionGraphUtil.get_neighbors(business_id)
+
+        dentist_ids = [
+            neighbor_id
+            for neighbor_id, category in neighbors.items()
+            if category == "dentist"
+        ]
+
+        counts = Counter()
+
+        for adjacency in ConnectionGraphUtil.get_adjacency(dentist_ids).values():
+            dentist_neighbors = ConnectionGraphUtil.merge_directions(adjacency)
+
+            for neighbor_id, category in dentist_neighbors.items():
+                if category != "laboratory":
+                    continue
+
+                if neighbor_id == business_id or neighbor_id in neighbors:
+                    continue
+
+                counts[neighbor_id] += 1
+
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    @staticmethod
+    def get_shortest_path(
+        business_id, other_business_id, max_depth=CONNECTION_PATH_MAX_DEPTH
+    ):
+        """
+        Breadth first search over connections in both directions. Returns the
+        business ids from business_id to other_business_id, or None.
+        """
+        if business_id == other_business_id:
+            return [business_id]
+
+        parents = {business_id: None}
+        frontier = [business_id]
+
+        for depth in range(max_depth):
+            if not frontier:
+                break
+
+            next_frontier = []
+            adjacency = ConnectionGraphUtil.get_adjacency(frontier)
+
+            for current_id in frontier:
+                neighbors = ConnectionGraphUtil.merge_directions(adjacency[current_id])
+
+                for neighbor_id in sorted(neighbors):
+                    if neighbor_id in parents:
+                        continue
+
+                    parents[neighbor_id] = current_id
+
+                    if neighbor_id == other_business_id:
+                        path = [neighbor_id]
+
+                        while parents[path[-1]] is not None:
+                            path.append(parents[path[-1]])
+
+                        return path[::-1]
+
+                    next_frontier.append(neighbor_id)
+
+            frontier = next_frontier
+
+        return None
+
+
+class DefaultRowUtil:
+    """
+    Keeps one is_default row per business for BusinessAddress and
+    BusinessAccount. The partial unique index on (business) where is_default
+    is checked row by row, so the old default is cleared before the new one
+    is written, inside one transaction. A concurrent switch that loses the
+    race hits the index instead of leaving two defaults, and is retried.
+    """
+
+    @staticmethod
+    def save_as_default(instance):
+        model = type(instance)
+
+        for attempt in range(DEFAULT_SWITCH_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    model.objects.filter(
+                        business_id=instance.business_id, is_default=True
+                    ).exclude(id=instance.id).update(is_default=False)
+
+                    instance.is_default = True
+                    instance.save()
+
+                return instance
+
+            except IntegrityError:
+                if attempt == DEFAULT_SWITCH_ATTEMPTS - 1:
+                    raise
+
+    @staticmethod
+    def save(instance):
+        if instance.is_default:
+            return DefaultRowUtil.save_as_default(instance)
+
+        instance.save()
+        return instance
+
+
+class BusinessImportUtil:
+    """
+    Bulk onboarding of customer businesses, the batch version of
+    BusinessWithOwnerSerializer.create.
+
+    Every row is validated up front, emails and gstins are checked for
+    duplicates with one query per chunk, then each table gets one bulk insert.
+    """
+
+    @staticmethod
+    def read_csv_rows(file):
+        """Streams the rows of an uploaded csv, blank cells are left out."""
+        reader = csv.DictReader(
+            io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        )
+
+        for row in reader:
+            yield {
+                key.strip(): value.strip()
+                for key, value in row.items()
+                if key and isinstance(value, str) and value.strip()
+            }
+
+    @staticmethod
+    def get_existing(queryset, field, values):
+        values = list(values)
+        existing = set()
+
+        for start in range(0, len(values), BUSINESS_IMPORT_LOOKUP_CHUNK):
+            chunk = values[start : start + BUSINESS_IMPORT_LOOKUP_CHUNK]
+            existing.update(
+                queryset.filter(**{f"{field}__in": chunk}).values_list(field, flat=True)
+            )
+
+        return existing
+
+    @staticmethod
+    def validate_rows(rows, row_serializer):
+        """
+        Returns (valid rows, report). The report has one entry per input row,
+        valid rows are (report entry, validated data) pairs.
+        """
+        report = []
+        valid_rows = []
+        emails = Counter()
+        gstins = Counter()
+
+        for number, row in enumerate(rows, start=1):
+            if number > BUSINESS_IMPORT_MAX_ROWS:
+                raise serializers.ValidationError({"rows": "server_max_length"})
+
+            try:
+                data = row_serializer.run_validation(row)
+            except serializers.ValidationError as error:
+                report.append(
+                    {"row": number, "status": "invalid", "errors": error.detail}
+                )
+                continue
+
+            data["email"] = EmailUser.objects.normalize_email(data["email"])
+            data["gstin"] = Business.normalize_gstin(data.get("gstin"))
+
+            emails[data["email"]] += 1
+
+            if data["gstin"]:
+                gstins[data["gstin"]] += 1
+
+            entry = {"row": number, "status": "valid"}
+            report.append(entry)
+            valid_rows.append((entry, data))
+
+        existing_emails = BusinessImportUtil.get_existing(
+            EmailUser.objects.all(), "email", emails
+        )
+        existing_gstins = BusinessImportUtil.get_existing(
+            Business.objects.all(), "gstin_normalized", gstins
+        )
+
+        unique_rows = []
+
+        for entry, data in valid_rows:
+            errors = {}
+
+            if data["email"] in existing_emails:
+                errors["email"] = "server_exists_already"
+            elif emails[data["email"]] > 1:
+                errors["email"] = "server_duplicate_in_file"
+
+            if data["gstin"] in existing_gstins:
+                errors["gstin"] = "server_exists_already"
+            elif gstins[data["gstin"]] > 1:
+                errors["gstin"] = "server_duplicate_in_file"
+
+            if errors:
+                entry["status"] = "duplicate"
+                entry["errors"] = errors
+            else:
+                unique_rows.append((entry, data))
+
+        return unique_rows, report
+
+    @staticmethod
+    def get_mobile(mobile):
+        mobile = str(mobile or "").strip()
+
+        return int(mobile) if len(mobile) == 10 and mobile.isdigit() else 0
+
+    @staticmethod
+    def create_businesses(rows, current_business):
+        """Creates the owner, business, address and connection of every row."""
+        if not rows:
+            return []
+
+        users = []
+        businesses = []
+
+        for entry, data in rows:
+            users.append(
+                EmailUser(
+                    first_name=data["first_name"],
+                    last_name=data["last_name"],
+                    email=data["email"],
+                    mobile=BusinessImportUtil.get_mobile(data.get("mobile")),
+                    user_type="owner",
+                )
+            )
+            businesses.append(
+                Business(
+                    name=data["name"],
+                    category=data["category"],
+                    gstin=data["gstin"],
+                    gstin_normalized=data["gstin"],
+                    website=data.get("website") or None,
+                    referral=current_business,
+                    is_claimed=False,
+                )
+            )
+
+        with transaction.atomic():
+            BulkUtil.bulk_create_with_ids(EmailUser, users)
+            BulkUtil.bulk_create_with_ids(Business, businesses)
+
+            owners = []
+            addresses = []
+            connects = []
+
+            for (entry, data), user, business in zip(rows, users, businesses):
+                owners.append(BusinessOwner(business=business, owner=user))
+                addresses.append(
+                    BusinessAddress(
+                        business=business,
+                        name=data["address_name"],
+                        address=data["address"],
+                        pincode=data["pincode"],
+                        city_id=data["city_id"],
+                        district_id=data["district_id"],
+                        state_id=data["state_id"],
+                        address_type="headquarters",
+                        is_default=True,
+                    )
+                )
+                # Both directions, like the symmetrical connected_businesses.add()
+                connects.append(
+                    BusinessConnect(
+                        from_business=business, to_business=current_business
+                    )
+                )
+                connects.append(
+                    BusinessConnect(
+                        from_business=current_business, to_business=business
+                    )
+                )
+
+            BusinessOwner.objects.bulk_create(owners)
+            BusinessAddress.objects.bulk_create(addresses)
+            BusinessConnect.objects.bulk_create(connects)
+
+            DuplicateUtil.reindex([business.id for business in businesses])
+
+            # Bulk inserts send no signals for businesses.signals to catch,
+            # the new generations also drop the cached connections
+            business_ids = [current_business.id] + [
+                business.id for business in businesses
+            ]
+            transaction.on_commit(lambda: response_cache.invalidate(business_ids))
+
+        for (entry, data), business in zip(rows, businesses):
+            entry["status"] = "created"
+            entry["business_id"] = business.id
+
+        return businesses
+
+
+class DuplicateUtil:
+    """
+    Duplicate business detection. Exact matches go through the indexed
+    Business.gstin_normalized, fuzzy name matches through BusinessNameTrigram,
+    whose (city, trigram) index only ever touches businesses of one city that
+    share a trigram with the name.
+    """
+
+    PAIRS_SQL = """
+        SELECT a.business_id, b.business_id, a.city_id, COUNT(*)
+        FROM {table} AS a
+        JOIN {table} AS b
+            ON b.city_id = a.city_id
+            AND b.trigram = a.trigram
+            AND b.business_id > a.business_id
+        {where}
+        GROUP BY a.business_id, b.business_id, a.city_id
+    """
+
+    @staticmethod
+    def get_name_trigrams(name):
+        """pg_trgm style trigrams of the significant words of a name."""
+        words = "".join(
+            char if char.isalnum() else " " for char in str(name or "").casefold()
+        ).split()
+        words = [
+            word for word in words if word not in BUSINESS_NAME_STOP_WORDS
+        ] or words
+
+        trigrams = set()
+
+        for word in words:
+            padded = f"  {word} "
+            trigrams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+
+        return trigrams
+
+    @staticmethod
+    def get_similarity(shared, count, other_count):
+        return shared / (count + other_count - shared)
+
+    @staticmethod
+    def reindex(business_ids):
+        """Rebuilds the name trigrams of the given businesses."""
+        business_ids = list(business_ids)
+
+        for start in range(0, len(business_ids), DUPLICATE_REINDEX_CHUNK):
+            chunk = business_ids[start : start + DUPLICATE_REINDEX_CHUNK]
+
+            rows = Business.objects.filter(
+                id__in=chunk, addresses__is_default=True
+            ).values_list("id", "name", "addresses__city_id")
+
+            trigrams = [
+                BusinessNameTrigram(
+                    business_id=business_id, city_id=city_id, trigram=trigram
+                )
+                for business_id, name, city_id in rows
+                for trigram in DuplicateUtil.get_name_trigrams(name)
+            ]
+
+            with transaction.atomic():
+                BusinessNameTrigram.objects.filter(business_id__in=chunk).delete()
+                BusinessNameTrigram.objects.bulk_create(trigrams)
+
+    @staticmethod
+    def reindex_all():
+        business_ids = Business.objects.order_by("id").values_list("id", flat=True)
+        DuplicateUtil.reindex(business_ids)
+
+        return len(business_ids)
+
+    @staticmethod
+    def get_gstin_duplicates(gstin, exclude_id=None):
+        gstin = Business.normalize_gstin(gstin)
+
+        if gstin is None:
+            return Business.objects.none()
+
+        return Business.objects.filter(gstin_normalized=gstin).exclude(id=exclude_id)
+
+    @staticmethod
+    def get_name_duplicates(
+        name,
+        city_id,
+        exclude_id=None,
+        threshold=DUPLICATE_NAME_THRESHOLD,
+        limit=DUPLICATE_NAME_LIMIT,
+    ):
+        """[(business_id, similarity)] of the same city, most similar first."""
+        trigrams = DuplicateUtil.get_name_trigrams(name)
+
+        if not trigrams or city_id is None:
+            return []
+
+        # A similarity of at least threshold needs this many shared trigrams
+        min_shared = max(1, math.ceil(threshold * len(trigrams)))
+
+        shared = dict(
+            BusinessNameTrigram.objects.filter(city_id=city_id, trigram__in=trigrams)
+            .exclude(business_id=exclude_id)
+            .values("business_id")
+            .annotate(shared=Count("id"))
+            .filter(shared__gte=min_shared)
+            .values_list("business_id", "shared")
+        )
+
+        if not shared:
+            return []
+
+        counts = dict(
+            BusinessNameTrigram.objects.filter(business_id__in=shared)
+            .values("business_id")
+            .annotate(count=Count("id"))
+            .values_list("business_id", "count")
+        )
+
+        matches = []
+
+        for business_id, shared_count in shared.items():
+            similarity = DuplicateUtil.get_similarity(
+                shared_count, len(trigrams), counts[business_id]
+            )
+
+            if similarity >= threshold:
+                matches.append((business_id, similarity))
+
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches[:limit]
+
+    @staticmethod
+    def get_possible_duplicates(name, city_id, gstin=None, exclude_id=None):
+        """
+        Businesses sharing the gstin, then businesses with a similar name in
+        the same city. Each one carries `match` and `similarity` attributes.
+        """
+        found = {}
+
+        for business in DuplicateUtil.get_gstin_duplicates(gstin, exclude_id):
+            business.match = "gstin"
+            business.similarity = 1.0
+            found[business.id] = business
+
+        name_matches = [
+            match
+            for match in DuplicateUtil.get_name_duplicates(name, city_id, exclude_id)
+            if match[0] not in found
+        ]
+        businesses = Business.objects.in_bulk([match[0] for match in name_matches])
+
+        for business_id, similarity in name_matches:
+            business = businesses[business_id]
+            business.match = "name"
+            business.similarity = round(similarity, 3)
+            found[business_id] = business
+
+        return list(found.values())
+
+    @staticmethod
+    def get_gstin_duplicate_groups():
+        """{gstin: [business ids]} of every gstin used more than once."""
+        gstins = (
+            Business.objects.filter(gstin_normalized__isnull=False)
+            .values("gstin_normalized")
+            .annotate(count=Count("id"))
+            .filter(count__gt=1)
+            .values_list("gstin_normalized", flat=True)
+        )
+
+        groups = {}
+        rows = (
+            Business.objects.filter(gstin_normalized__in=gstins)
+            .order_by("gstin_normalized", "id")
+            .values_list("gstin_normalized", "id")
+        )
+
+        for gstin, business_id in rows:
+            groups.setdefault(gstin, []).append(business_id)
+
+        return groups
+
+    @staticmethod
+    def get_name_duplicate_pairs(threshold=DUPLICATE_NAME_THRESHOLD, city_id=None):
+        """
+        [(business_id, other_business_id, city_id, similarity)] of every pair
+        of businesses in one city whose names look alike. Pairs come from a
+        self join of the trigram index, never from comparing all businesses.
+        """
+        where = "WHERE a.city_id = %s" if city_id is not None else ""
+        params = [city_id] if city_id is not None else []
+
+        sql = DuplicateUtil.PAIRS_SQL.format(
+            table=BusinessNameTrigram._meta.db_table, where=where
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        queryset = BusinessNameTrigram.objects.all()
+
+        if city_id is not None:
+            queryset = queryset.filter(city_id=city_id)
+
+        counts = dict(
+            queryset.values("business_id")
+            .annotate(count=Count("id"))
+            .values_list("business_id", "count")
+        )
+
+        pairs = []
+
+        for business_id, other_business_id, pair_city_id, shared in rows:
+            similarity = DuplicateUtil.get_similarity(
+                shared, counts[business_id], counts[other_business_id]
+            )
+
+            if similarity >= threshold:
+                pairs.append((business_id, other_business_id, pair_city_id, similarity))
+
+        pairs.sort(key=lambda pair: (-pair[3], pair[0], pair[1]))
+        return pairs
+
+
+class ClaimUtil:
+    """
+    Lets a signed up owner take over the unclaimed businesses labs created
+    for them. A placeholder matches on a contact the owner has verified, the
+    owner's mobile or email, against the mobile and email of its owner or
+    its contacts. A claim merges the unclaimed business into the owner's
+    with set based UPDATEs.
+    """
+
+    @staticmethod
+    def get_verified_contacts(user, business):
+        """(emails, mobiles) the user or the business verified."""
+        emails = set()
+        mobiles = set()
+
+        if user.is_email_verified:
+            emails.add(user.email)
+
+        if user.is_mobile_verified and user.mobile:
+            mobiles.add(user.mobile)
+
+        contacts = BusinessContact.objects.filter(
+            business=business, is_verified=True
+        ).values_list("contact_type", "contact")
+
+        for contact_type, contact in contacts:
+            contact = contact.strip()
+
+            if contact_type == "email":
+                emails.add(EmailUser.objects.normalize_email(contact))
+            elif contact_type == "mobile" and len(contact) == 10 and contact.isdigit():
+                mobiles.add(int(contact))
+
+        return emails, mobiles
+
+    @staticmethod
+    def get_candidates(user, business):
+        """{business_id: [matched_by]} of unclaimed businesses matching the user."""
+        unclaimed = Business.objects.filter(is_claimed=False, is_active=True).exclude(
+            id=business.id
+        )
+
+        emails, mobiles = ClaimUtil.get_verified_contacts(user, business)
+        lookups = []
+
+        if emails:
+            # Contacts are stored as typed
+            contact_emails = Q()
+            for email in emails:
+                contact_emails |= Q(contacts__contact__iexact=email)
+
+            lookups.append(
+                (
+                    "email",
+                    Q(business_owners__owner__email__in=emails)
+                    | Q(contacts__contact_type="email") & contact_emails,
+                )
+            )
+
+        if mobiles:
+            lookups.append(
+                (
+                    "mobile",
+                    Q(business_owners__owner__mobile__in=mobiles)
+                    | Q(
+                        contacts__contact_type="mobile",
+                        contacts__contact__in=[str(mobile) for mobile in mobiles],
+                    ),
+                )
+            )
+
+        if business.gstin_normalized:
+            lookups.append(("gstin", Q(gstin_normalized=business.gstin_normalized)))
+
+        candidates = {}
+
+        for matched_by, lookup in lookups:
+            business_ids = unclaimed.filter(lookup).values_list("id", flat=True)
+
+            for business_id in set(business_ids):
+                candidates.setdefault(business_id, []).append(matched_by)
+
+        return candidates
+
+    @staticmethod
+    def is_verified_match(user, matched_by):
+        """A gstin is only self declared, a claim needs a verified email or mobile."""
+        return "email" in matched_by or "mobile" in matched_by
+
+    @staticmethod
+    def get_claim_error(user, business, claimed_id):
+        """The message refusing the claim of claimed_id, None when it may go on."""
+        candidates = ClaimUtil.get_candidates(user, business)
+
+        if claimed_id not in candidates:
+            return "server_absent"
+
+        if not ClaimUtil.is_verified_match(user, candidates[claimed_id]):
+            return "server_claim_not_verified"
+
+        return None
+
+    @staticmethod
+    def claim(user, business, claimed):
+        """Moves connections, orders, referrals and employees of claimed to business."""
+        connects = BusinessConnect.objects.all()
+
+        with transaction.atomic():
+            # Checked again under the row lock, two claims of the same
+            # business cannot both get past it
+            claimed = Business.objects.select_for_update().get(id=claimed.id)
+            message = ClaimUtil.get_claim_error(user, business, claimed.id)
+
+            if message is not None:
+                raise serializers.ValidationError({"business_id": [message]})
+
+            business_ids = {business.id, claimed.id}
+            business_ids.update(ConnectionGraphUtil.get_neighbors(business.id))
+            business_ids.update(ConnectionGraphUtil.get_neighbors(claimed.id))
+
+            placeholder_ids = list(
+                BusinessOwner.objects.filter(business=claimed).values_list(
+                    "owner_id", flat=True
+                )
+            )
+
+            # Connections that would turn into self loops or repeat one the
+            # business already has go first, the rest is repointed.
+            connects.filter(
+                Q(from_business=claimed, to_business=business)
+                | Q(from_business=business, to_business=claimed)
+            ).delete()
+            connects.filter(
+                from_business=claimed,
+                to_business__in=connects.filter(from_business=business).values(
+                    "to_business"
+                ),
+            ).delete()
+            connects.filter(
+                to_business=claimed,
+                from_business__in=connects.filter(to_business=business).values(
+                    "from_business"
+                ),
+            ).delete()
+
+            connects.filter(from_business=claimed).update(from_business=business)
+            connects.filter(to_business=claimed).update(to_business=business)
+
+            Order.objects.filter(from_business=claimed).update(from_business=business)
+            Order.objects.filter(to_business=claimed).update(to_business=business)
+            Order.objects.filter(from_user__in=placeholder_ids).update(from_user=user)
+            Order.objects.filter(to_user__in=placeholder_ids).update(to_user=user)
+
+            BusinessEmployee.objects.filter(business=claimed).update(business=business)
+
+            Business.objects.filter(referral=claimed).exclude(id=business.id).update(
+                referral=business
+            )
+
+            # The lab that created the claimed business becomes the referral
+            if business.referral_id in [None, claimed.id]:
+                referral_id = claimed.referral_id
+                business.referral_id = (
+                    None if referral_id == business.id else referral_id
+                )
+
+            business.is_claimed = True
+            business.save(update_fields=["referral", "is_claimed", "modified_at"])
+
+            Business.objects.filter(id=claimed.id).update(
+                referral=None, is_claimed=True, is_active=False
+            )
+            EmailUser.objects.filter(id__in=placeholder_ids).update(is_active=False)
+            BusinessNameTrigram.objects.filter(business=claimed).delete()
+
+            # The UPDATEs and deletes above send no signals, the new
+            # generations also drop the cached connections
+            transaction.on_commit(lambda: response_cache.invalidate(business_ids))
+
+        return business
@@ -1,10 +1,14 @@
-from django.db.models import Q
+from django.db.models import Case, CharField, Q, Value, When
 
-from rest_framework import status, viewsets
+from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from core.utils import CurrentPagePagination, CommonUtil
+from core.renderers import ColumnarJSONRenderer
+from core.response_cache import response_cache
+from core.utils import CommonAuthenticationMixin, CurrentPagePagination
 
 from users.models import EmailUser
 
@@ -17,21 +21,74 @@ from businesses.serializers import (
     OrderSerializer,
     UpdateOrderStatusSerializer,
     BusinessWithOwnerSerializer,
+    BusinessImportRowSerializer,
+    DuplicateBusinessSerializer,
+    PossibleDuplicatesSerializer,
+    BusinessOnlySerializer,
+    ReferralBusinessSerializer,
+    SuggestedLaboratorySerializer,
 )
 from businesses.models import (
     Business,
     BusinessAccount,
-    # BusinessContact,
+    BusinessAddress,
+    BusinessContact,
     BusinessConnect,
     Order,
 )
+from businesses.utils import (
+    BusinessImportUtil,
+    ConnectionGraphUtil,
+    DuplicateUtil,
+    ReferralUtil,
+)
+
 
+class BusinessResponseCacheMixin:
+    """
+    Serves list responses from core.response_cache, per business of the
+    user, action and query params. The signals of businesses.signals drop
+    them when the business or one of its connected businesses changes.
+    """
+
+    def get_user_business(self):
+        if not hasattr(self, "user_business"):
+            user = (
+                EmailUser.objects.filter(id=self.request.user.pk)
+                .select_related("owned_business__business", "employer__business")
+                .first()
+            )
+            self.user_business = user.get_business()
+
+        return self.user_business
+
+    def get_cached_response(self, business_id, get_response):
+        return response_cache.get_response(
+            business_id,
+            f"{self.basename}:{self.action}",
+            self.request.query_params,
+            get_response,
+        )
 
-class BusinessViewset(viewsets.ModelViewSet):
+
+class CachedBusinessListMixin(BusinessResponseCacheMixin):
+    """Caches the list action of a viewset of the user's business."""
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            self.get_user_business().id,
+            lambda: super(CachedBusinessListMixin, self).list(request, *args, **kwargs),
+        )
+
+
+class BusinessViewset(
+    CommonAuthenticationMixin, BusinessResponseCacheMixin, viewsets.ModelViewSet
+):
 
     serializer_class = BusinessSerializer
     pagination_class = CurrentPagePagination
-    authentication_classes = CommonUtil.get_authentication_classes()
+    # Accept: application/vnd.crown.columnar+json or ?format=columnar
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer]
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -44,11 +101,33 @@ class BusinessViewset(viewsets.ModelViewSet):
         return context
 
     def get_queryset(self):
-        queryset = Business.objects.all().prefetch_related(
-            "contacts", "addresses", "accounts"
+        queryset = BusinessSerializer.prune_queryset(
+            Business.objects.all(), self.request
         )
         return queryset
 
+    def get_current_business(self, request):
+        current_user = (
+            EmailUser.objects.filter(id=request.user.pk)
+            .select_related("owned_business")
+            .first()
+        )
+
+        return current_user.get_business()
+
+    def get_business_id_param(self, request):
+        business_id = request.query_params.get("business_id", "")
+
+        if not business_id.isnumeric():
+            message = {"business_id": "server_invalid"}
+            raise serializers.ValidationError(message)
+
+        return int(business_id)
+
+    def get_businesses_in_order(self, business_ids):
+        businesses = Business.objects.in_bulk(business_ids)
+        return [businesses[item] for item in business_ids if item in businesses]
+
     def get_serializer_class(self):
         serializer = self.serializer_class
 
@@ -60,15 +139,19 @@ class BusinessViewset(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def customers_of_laboratory(self, request, *args, **kwargs):
 
-        current_user = (
-            EmailUser.objects.filter(id=request.user.pk)
-            .select_related("owned_business")
-            .first()
+        current_business = self.get_current_business(request)
+
+        return self.get_cached_response(
+            current_business.id,
+            lambda: self.get_customers_of_laboratory_response(
+                request, current_business
+            ),
         )
 
-        current_business = current_user.get_business()
+    def get_customers_of_laboratory_response(self, request, current_business):
 
         queryset = current_business.connected_businesses.all().order_by("-created_at")
+        queryset = BusinessSerializer.prune_queryset(queryset, request)
 
         queryset = self.filter_queryset(queryset)
 
@@ -94,28 +177,167 @@ class BusinessViewset(viewsets.ModelViewSet):
             serializer.data, status=status.HTTP_201_CREATED, headers=headers
         )
 
+    @action(detail=False, methods=["post"])
+    def import_customers(self, request, *args, **kwargs):
+        """
+        Bulk create_business_with_owner, from a csv `file` upload or a json
+        array of flat rows (see BusinessImportRowSerializer). Valid rows are
+        created, the others are reported back per row.
+        """
+
+        upload = request.FILES.get("file")
+
+        if upload is not None:
+            rows = BusinessImportUtil.read_csv_rows(upload)
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            raise serializers.ValidationError({"file": "server_required"})
+
+        current_business = self.get_current_business(request)
+
+        valid_rows, report = BusinessImportUtil.validate_rows(
+            rows, BusinessImportRowSerializer()
+        )
+        BusinessImportUtil.create_businesses(valid_rows, current_business)
+
+        created = len(valid_rows)
+        return Response(
+            {"created": created, "failed": len(report) - created, "rows": report},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
     @action(detail=False, methods=["get"])
-    def except_mine(self, request, *args, **kwargs):
+    def possible_duplicates(self, request, *args, **kwargs):
+        """
+        Checked before create_business_with_owner. ?name= with ?city_id= or
+        ?pincode=, optionally ?gstin=.
+        """
 
-        current_user = (
-            EmailUser.objects.filter(id=request.user.pk)
-            .select_related("owned_business")
-            .first()
+        serializer = PossibleDuplicatesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        data = serializer.validated_data
+        businesses = DuplicateUtil.get_possible_duplicates(
+            data["name"], data["city_id"], data.get("gstin")
         )
 
-        current_business = current_user.get_business()
+        serializer = DuplicateBusinessSerializer(businesses, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def except_mine(self, request, *args, **kwargs):
+
+        current_business = self.get_current_business(request)
 
         queryset = Business.objects.exclude(id=current_business.id)
+        queryset = BusinessSerializer.prune_queryset(queryset, request)
 
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=["get"])
+    def referral_ancestors(self, request, *args, **kwargs):
+
+        business = get_object_or_404(Business.objects.only("id"), pk=kwargs["pk"])
+
+        ancestors = ReferralUtil.get_ancestors(business.id)
+
+        serializer = ReferralBusinessSerializer(ancestors, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=["get"])
+    def referral_descendants(self, request, *args, **kwargs):
 
-class OrderViewset(viewsets.ModelViewSet):
+        business = get_object_or_404(Business.objects.only("id"), pk=kwargs["pk"])
+
+        descendants = ReferralUtil.get_descendants(business.id)
+
+        page = self.paginate_queryset(queryset=descendants)
+        if page is not None:
+            serializer = ReferralBusinessSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = ReferralBusinessSerializer(descendants, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=["get"])
+    def referral_downline_count(self, request, *args, **kwargs):
+
+        business = get_object_or_404(Business.objects.only("id"), pk=kwargs["pk"])
+
+        data = ReferralUtil.get_downline_counts(business.id)
+        data["id"] = business.id
+
+        return Response(data)
+
+    @action(detail=False, methods=["get"])
+    def connections(self, request, *args, **kwargs):
+
+        current_business = self.get_current_business(request)
+
+        neighbors = ConnectionGraphUtil.get_neighbors(current_business.id)
+        businesses = self.get_businesses_in_order(sorted(neighbors))
+
+        serializer = BusinessOnlySerializer(businesses, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def mutual_connections(self, request, *args, **kwargs):
+
+        current_business = self.get_current_business(request)
+        other_business_id = self.get_business_id_param(request)
+
+        business_ids = ConnectionGraphUtil.get_mutual_connections(
+            current_business.id, other_business_id
+        )
+        businesses = self.get_businesses_in_order(business_ids)
+
+        serializer = BusinessOnlySerializer(businesses, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def suggested_laboratories(self, request, *args, **kwargs):
+
+        current_business = self.get_current_business(request)
+
+        suggestions = ConnectionGraphUtil.get_suggested_laboratories(
+            current_business.id
+        )
+        businesses = self.get_businesses_in_order([item for item, _ in suggestions])
+
+        dentist_counts = dict(suggestions)
+        for business in businesses:
+            business.dentist_count = dentist_counts[business.id]
+
+        serializer = SuggestedLaboratorySerializer(businesses, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["get"])
+    def connection_path(self, request, *args, **kwargs):
+
+        current_business = self.get_current_business(request)
+        other_business_id = self.get_business_id_param(request)
+
+        path = ConnectionGraphUtil.get_shortest_path(
+            current_business.id, other_business_id
+        )
+
+        if path is None:
+            return Response({"path": None})
+
+        serializer = BusinessOnlySerializer(
+            self.get_businesses_in_order(path), many=True
+        )
+        return Response({"path": serializer.data})
+
+
+class OrderViewset(CommonAuthenticationMixin, viewsets.ModelViewSet):
 
     serializer_class = OrderSerializer
     pagination_class = CurrentPagePagination
-    authentication_classes = CommonUtil.get_authentication_classes()
+    # Accept: application/vnd.crown.columnar+json or ?format=columnar
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer]
 
     def get_permissions(self):
 
@@ -161,16 +383,16 @@ class OrderViewset(viewsets.ModelViewSet):
             Order.objects.filter(
                 Q(from_business=users_business) | Q(to_business=users_business)
             )
-            .select_related("from_business")
+            .annotate(
+                order_type=Case(
+                    When(from_business=users_business, then=Value("placed")),
+                    default=Value("received"),
+                    output_field=CharField(),
+                )
+            )
             .order_by("-created_at")
         )
-
-        # TODO: Need to find a way to do this via annotate or do it at the time of creation
-        for order in queryset:
-            if order.from_business.id == users_business.id:
-                order.order_type = "placed"
-            else:
-                order.order_type = "received"
+        queryset = OrderSerializer.prune_queryset(queryset, self.request)
 
         return queryset
 
@@ -187,11 +409,12 @@ class OrderViewset(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class BusinessAccountViewset(viewsets.ModelViewSet):
+class BusinessAccountViewset(
+    CommonAuthenticationMixin, CachedBusinessListMixin, viewsets.ModelViewSet
+):
 
     serializer_class = BusinessAccountSerializer
     # pagination_class = CurrentPagePagination
-    authentication_classes = CommonUtil.get_authentication_classes()
 
     def get_permissions(self):
         # For add_business_account
@@ -200,8 +423,7 @@ class BusinessAccountViewset(viewsets.ModelViewSet):
         return super().get_permissions()
 
     def get_queryset(self):
-        user = EmailUser.objects.filter(id=self.request.user.pk).first()
-        queryset = BusinessAccount.objects.filter(business=user.get_business())
+        queryset = BusinessAccount.objects.filter(business=self.get_user_business())
         return queryset
 
     def perform_create(self, serializer):
@@ -209,11 +431,12 @@ class BusinessAccountViewset(viewsets.ModelViewSet):
         serializer.save(user=user)
 
 
-class BusinessAddressViewset(viewsets.ModelViewSet):
+class BusinessAddressViewset(
+    CommonAuthenticationMixin, CachedBusinessListMixin, viewsets.ModelViewSet
+):
 
     serializer_class = BusinessAddressSerializer
     # pagination_class = CurrentPagePagination
-    authentication_classes = CommonUtil.get_authentication_classes()
 
     def get_permissions(self):
         # For add, edit and delete business_address
@@ -225,20 +448,13 @@ class BusinessAddressViewset(viewsets.ModelViewSet):
         context = super().get_serializer_context()
         context["user"] = (
             EmailUser.objects.filter(id=self.request.user.pk)
-            .select_related("business")
-            .prefetch_related("business__addresses")
+            .select_related("owned_business__business", "employer__business")
             .first()
         )
         return context
 
     def get_queryset(self):
-        user = (
-            EmailUser.objects.filter(id=self.request.user.pk)
-            .select_related("business")
-            .prefetch_related("business__addresses")
-            .first()
-        )
-        queryset = user.business.addresses.all()
+        queryset = BusinessAddress.objects.filter(business=self.get_user_business())
         return queryset
 
     @action(detail=True, methods=["put"])
@@ -257,11 +473,12 @@ class BusinessAddressViewset(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class BusinessContactViewset(viewsets.ModelViewSet):
+class BusinessContactViewset(
+    CommonAuthenticationMixin, CachedBusinessListMixin, viewsets.ModelViewSet
+):
 
     serializer_class = BusinessContactSerializer
     # pagination_class = CurrentPagePagination
-    authentication_classes = CommonUtil.get_authentication_classes()
 
     def get_permissions(self):
         # For add, edit and delete business_address
@@ -273,19 +490,11 @@ class BusinessContactViewset(viewsets.ModelViewSet):
         context = super().get_serializer_context()
         context["user"] = (
             EmailUser.objects.filter(id=self.request.user.pk)
-            .select_related("business")
-            .prefetch_related("business__contacts")
+            .select_related("owned_business__business", "employer__business")
             .first()
         )
         return context
 
     def get_queryset(self):
-        user = (
-            EmailUser.objects.filter(id=self.request.user.pk)
-            .select_related("business")
-            .prefetch_related("business__contacts")
-            .first()
-        )
-        # queryset = BusinessAddress.objects.filter(business=user.get_business())
-        queryset = user.business.contacts.all()
+        queryset = BusinessContact.objects.filter(business=self.get_user_business())
         return queryset
@@ -1,6 +1,14 @@
 from django.contrib import admin
 
-from core.models import City, District, State, JobType
+from core.models import (
+    City,
+    District,
+    State,
+    JobType,
+    OutboxMessage,
+    Pincode,
+    RevokedToken,
+)
 
 
 @admin.register(City)
@@ -45,6 +53,22 @@ class StateAdmin(admin.ModelAdmin):
     list_per_page = 50
 
 
+@admin.register(Pincode)
+class PincodeAdmin(admin.ModelAdmin):
+
+    list_display = [
+        "id",
+        "code",
+        "city",
+        "created_at",
+        "modified_at",
+    ]
+
+    list_per_page = 50
+    raw_id_fields = ["city"]
+    search_fields = ["code"]
+
+
 @admin.register(JobType)
 class OrderOptionAdmin(admin.ModelAdmin):
 
@@ -56,3 +80,36 @@ class OrderOptionAdmin(admin.ModelAdmin):
     ]
 
     list_per_page = 50
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+
+    list_display = [
+        "id",
+        "channel",
+        "recipient",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "sent_at",
+        "created_at",
+    ]
+
+    list_filter = ["channel", "status"]
+    list_per_page = 50
+    search_fields = ["recipient"]
+
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+
+    list_display = [
+        "id",
+        "jti",
+        "expiry",
+        "created_at",
+    ]
+
+    list_per_page = 50
+    search_fields = ["jti"]
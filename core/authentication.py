@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from rest_framework_simplejwt.authentication import JWTTokenUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from core.constants import JWT_VALIDATION_CACHE_SIZE
+from core.revocation import revocation_filter
+
+
+class TokenValidationCache:
+    """
+    LRU of validated tokens of this process, keyed by a digest of the raw
+    token. An entry lives until the token's exp, at most max_size entries
+    are kept.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def get_key(raw_token):
+        return hashlib.blake2b(raw_token, digest_size=16).digest()
+
+    def get(self, key, now):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            validated_token, expires_at = entry
+
+            if expires_at <= now:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return validated_token
+
+    def set(self, key, validated_token, expires_at):
+        with self.lock:
+            self.entries[key] = (validated_token, expires_at)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.expirations = self.evictions = 0
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedJWTTokenUserAuthentication(JWTTokenUserAuthentication):
+    """
+    JWTTokenUserAuthentication that decodes and verifies the signature of a
+    token once, then serves it from TokenValidationCache until it expires.
+
+    Only successfully validated tokens are cached. check_revoked runs on
+    every request, cached or not, so revocation never waits for an entry to
+    expire.
+    """
+
+    cache = TokenValidationCache(JWT_VALIDATION_CACHE_SIZE)
+
+    def get_validated_token(self, raw_token):
+        key = self.cache.get_key(raw_token)
+        validated_token = self.cache.get(key, time.time())
+
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            self.cache.set(key, validated_token, validated_token["exp"])
+
+        self.check_revoked(validated_token)
+
+        return validated_token
+
+    def check_revoked(self, validated_token):
+        if revocation_filter.is_revoked(validated_token[jwt_settings.JTI_CLAIM]):
+            raise InvalidToken("server_token_revoked")
@@ -0,0 +1,48 @@
+# The geography index is reloaded after this many seconds even without a
+# change signal, which bounds staleness for the other worker processes.
+GEOGRAPHY_INDEX_TIMEOUT = 15 * 60
+# A tree version this process has not loaded reloads its index, at most this
+# often, in case another worker process already loaded newer data.
+GEOGRAPHY_TREE_RELOAD_SECONDS = 5
+
+# The versioned tree URL changes whenever the data does, so it never goes stale
+GEOGRAPHY_TREE_MAX_AGE = 365 * 24 * 60 * 60
+GEOGRAPHY_DISTRICTS_MAX_AGE = 60 * 60
+
+PINCODE_SEARCH_LIMIT = 20
+# Upper bound of cities sharing one pincode, used when resolving exact codes
+PINCODE_MAX_CITIES = 50
+
+# Messages claimed by a dispatcher are hidden from the others this long, if it
+# dies mid batch they become due again afterwards.
+OUTBOX_LEASE_SECONDS = 5 * 60
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_POLL_SECONDS = 2
+# Failed sends are retried after 30s, 1m, 2m, ... capped at an hour
+OUTBOX_RETRY_BASE_SECONDS = 30
+OUTBOX_RETRY_MAX_SECONDS = 60 * 60
+OUTBOX_MAX_ATTEMPTS = 10
+
+SMS_TEMPLATES = {
+    "mobile_token": "{token} is your Crown verification code.",
+}
+
+# Validated JWTs kept per process by CachedJWTTokenUserAuthentication
+JWT_VALIDATION_CACHE_SIZE = 10000
+
+# Revoked JTIs the filter of core.revocation is sized for, it grows past that
+# on the next rebuild. At 0.1% false positives this is about 180KB per worker.
+REVOCATION_FILTER_CAPACITY = 100000
+REVOCATION_FILTER_ERROR_RATE = 0.001
+REVOCATION_FILTER_REBUILD_SECONDS = 60 * 60
+# Other workers see a revocation after at most this long
+REVOCATION_SYNC_SECONDS = 5
+# Each sync reads this far back, so rows of transactions that committed late
+# are not missed
+REVOCATION_SYNC_OVERLAP_SECONDS = 60
+
+# List responses cached per business by core.response_cache. Signals drop them
+# when the business changes, the timeout covers writes that send no signal,
+# like QuerySet.update() or a change to an owner's user.
+RESPONSE_CACHE_TIMEOUT_SECONDS = 5 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 5000
@@ -0,0 +1,259 @@
+import bisect
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from django.utils.functional import cached_property
+
+from core.constants import (
+    GEOGRAPHY_INDEX_TIMEOUT,
+    GEOGRAPHY_TREE_RELOAD_SECONDS,
+    PINCODE_MAX_CITIES,
+)
+from core.models import City, District, Pincode, State
+
+
+class GeographySnapshot:
+    """Immutable view of State, District and City, built with three queries."""
+
+    def __init__(self):
+        self.states = {
+            state_id: (name, gst_code)
+            for state_id, name, gst_code in State.objects.values_list(
+                "id", "name", "gst_code"
+            )
+        }
+        self.districts = {
+            district_id: (name, state_id)
+            for district_id, name, state_id in District.objects.values_list(
+                "id", "name", "state_id"
+            )
+        }
+        self.cities = {
+            city_id: (name, district_id)
+            for city_id, name, district_id in City.objects.values_list(
+                "id", "name", "district_id"
+            )
+        }
+        self.loaded_at = time.monotonic()
+
+    def get_district_tree(self, district_id):
+        name, state_id = self.districts[district_id]
+
+        return {
+            "id": district_id,
+            "name": name,
+            "state": state_id,
+            "cities": [
+                {"id": city_id, "name": city_name, "district": district_id}
+                for city_id, city_name in self.cities_by_district.get(district_id, [])
+            ],
+        }
+
+    def get_state_districts(self, state_id):
+        return [
+            self.get_district_tree(district_id)
+            for district_id in self.districts_by_state.get(state_id, [])
+        ]
+
+    @cached_property
+    def districts_by_state(self):
+        districts_by_state = {}
+
+        for district_id in sorted(self.districts):
+            state_id = self.districts[district_id][1]
+            districts_by_state.setdefault(state_id, []).append(district_id)
+
+        return districts_by_state
+
+    @cached_property
+    def cities_by_district(self):
+        cities_by_district = {}
+
+        for city_id in sorted(self.cities):
+            name, district_id = self.cities[city_id]
+            cities_by_district.setdefault(district_id, []).append((city_id, name))
+
+        return cities_by_district
+
+    @cached_property
+    def pincodes(self):
+        """
+        Sorted (codes, city_ids) arrays, loaded on the first pincode lookup.
+        A prefix matches the contiguous run starting at its bisect position.
+        """
+        codes = []
+        city_ids = []
+
+        for code, city_id in Pincode.objects.order_by("code", "city_id").values_list(
+            "code", "city_id"
+        ):
+            codes.append(code)
+            city_ids.append(city_id)
+
+        return codes, city_ids
+
+    def get_place(self, pincode, city_id):
+        city_name, district_id = self.cities[city_id]
+        district_name, state_id = self.districts[district_id]
+
+        return {
+            "pincode": pincode,
+            "city_id": city_id,
+            "city": city_name,
+            "district_id": district_id,
+            "district": district_name,
+            "state_id": state_id,
+            "state": self.states[state_id][0],
+        }
+
+    def search_pincodes(self, prefix, limit):
+        codes, city_ids = self.pincodes
+        places = []
+
+        index = bisect.bisect_left(codes, prefix)
+
+        while index < len(codes) and len(places) < limit:
+            if not codes[index].startswith(prefix):
+                break
+
+            if city_ids[index] in self.cities:
+                places.append(self.get_place(codes[index], city_ids[index]))
+
+            index += 1
+
+        return places
+
+    @cached_property
+    def tree(self):
+        """
+        The whole State -> District -> City tree in the StateSerializer
+        layout, rendered once per snapshot as compact JSON and gzip. The
+        version is a digest of the content, so every process that loaded the
+        same data serves the same version.
+        """
+        data = [
+            {
+                "id": state_id,
+                "name": self.states[state_id][0],
+                "gst_code": self.states[state_id][1],
+                "districts": self.get_state_districts(state_id),
+            }
+            for state_id in sorted(self.states)
+        ]
+
+        content = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+
+        return {
+            "version": hashlib.sha1(content).hexdigest()[:16],
+            "content": content,
+            "gzip_content": gzip.compress(content, mtime=0),
+        }
+
+
+class GeographyIndex:
+    """
+    In-memory State -> District -> City index for request time validation.
+
+    The snapshot is loaded on first use rather than at import, so a worker
+    boots without reaching the database. It is replaced as a whole when
+    core.signals reports a change, and reloaded after GEOGRAPHY_INDEX_TIMEOUT
+    so other processes pick up changes too.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+
+    def get_snapshot(self, max_age=GEOGRAPHY_INDEX_TIMEOUT):
+        snapshot = self.snapshot
+
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > max_age:
+            with self.lock:
+                if self.snapshot is snapshot:
+                    self.snapshot = GeographySnapshot()
+                snapshot = self.snapshot
+
+        return snapshot
+
+    def invalidate(self):
+        self.snapshot = None
+
+    def has_state(self, state_id):
+        return state_id in self.get_snapshot().states
+
+    def has_district(self, district_id):
+        return district_id in self.get_snapshot().districts
+
+    def has_city(self, city_id):
+        return city_id in self.get_snapshot().cities
+
+    def get_tree(self, version=None):
+        """
+        The current tree, None when version is given and the data in the
+        database has another one.
+        """
+        tree = self.get_snapshot().tree
+
+        if version is None or version == tree["version"]:
+            return tree
+
+        # Another process may have loaded newer data than this one
+        tree = self.get_snapshot(GEOGRAPHY_TREE_RELOAD_SECONDS).tree
+
+        return tree if version == tree["version"] else None
+
+    def get_state_districts(self, state_id):
+        """None when the state does not exist."""
+        snapshot = self.get_snapshot()
+
+        if state_id not in snapshot.states:
+            return None
+
+        return snapshot.get_state_districts(state_id)
+
+    def search_pincodes(self, prefix, limit):
+        """Places whose pincode starts with prefix, in pincode order."""
+        return self.get_snapshot().search_pincodes(prefix, limit)
+
+    def get_pincode_city_ids(self, pincode):
+        """Cities of an exact pincode, empty when the pincode is unknown."""
+        if not pincode:
+            return []
+
+        places = self.get_snapshot().search_pincodes(pincode, PINCODE_MAX_CITIES)
+
+        return [place["city_id"] for place in places if place["pincode"] == pincode]
+
+    def get_city_parents(self, city_id):
+        """(district_id, state_id) of an existing city."""
+        snapshot = self.get_snapshot()
+
+        district_id = snapshot.cities[city_id][1]
+        return district_id, snapshot.districts[district_id][1]
+
+    def get_hierarchy_errors(self, city_id, district_id, state_id):
+        """
+        Cross checks ids that exist on their own. Returns {field: message}.
+        """
+        snapshot = self.get_snapshot()
+        errors = {}
+
+        city = snapshot.cities.get(city_id)
+        district = snapshot.districts.get(district_id)
+
+        if city is not None and district is not None and city[1] != district_id:
+            errors["city_id"] = "server_city_not_in_district"
+
+        if district is not None and state_id in snapshot.states:
+            if district[1] != state_id:
+                errors["district_id"] = "server_district_not_in_state"
+
+        return errors
+
+
+geography_index = GeographyIndex()
@@ -0,0 +1,88 @@
+import abc
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.runner import DiscoverRunner
+
+from businesses.models import Business, BusinessAddress
+from core.models import City, District, State
+from core.utils import BulkUtil
+
+
+class BenchmarkCommand(BaseCommand, metaclass=abc.ABCMeta):
+    """
+    Base of the benchmark_* commands. run_benchmark runs against a throwaway
+    test database set up like the test runner does, never the real one.
+    """
+
+    def handle(self, *args, **options):
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+
+        try:
+            self.run_benchmark(*args, **options)
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+    @abc.abstractmethod
+    def run_benchmark(self, *args, **options):
+        """Runs the benchmark and reports it, with the command's options."""
+
+    def create_businesses(self, count):
+        """count businesses with an address each, prefetched to serialize."""
+        businesses = BulkUtil.bulk_create_with_ids(
+            Business, [Business(name=f"Benchmark {index}") for index in range(count)]
+        )
+        state = State.objects.create(name="Benchmark", gst_code=99)
+        district = District.objects.create(name="Benchmark", state=state)
+        city = City.objects.create(name="Benchmark", district=district)
+
+        BusinessAddress.objects.bulk_create(
+            [
+                BusinessAddress(
+                    business=business,
+                    name="Headquarters",
+                    address="Benchmark road",
+                    address_type="headquarters",
+                    city=city,
+                    district=district,
+                    state=state,
+                    pincode="400001",
+                )
+                for business in businesses
+            ]
+        )
+
+        return list(
+            Business.objects.filter(id__in=[business.id for business in businesses])
+            .prefetch_related("owners", "contacts", "addresses", "accounts")
+            .order_by("id")
+        )
+
+    def time_calls(self, function, repeat):
+        """Seconds taken by each of repeat calls of function."""
+        durations = []
+
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - started_at)
+
+        return durations
+
+    def report(self, label, durations, elapsed=None):
+        durations = sorted(durations)
+        elapsed = sum(durations) if elapsed is None else elapsed
+
+        def percentile(fraction):
+            index = min(len(durations) - 1, int(len(durations) * fraction))
+            return durations[index] * 1000
+
+        self.stdout.write(
+            f"{label}: {len(durations)} in {elapsed:.2f}s, "
+            f"{len(durations) / elapsed:.1f}/s, "
+            f"p50 {percentile(0.5):.2f}ms, p95 {percentile(0.95):.2f}ms, "
+            f"p99 {percentile(0.99):.2f}ms, max {durations[-1] * 1000:.2f}ms"
+        )
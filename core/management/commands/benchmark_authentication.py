@@ -0,0 +1,58 @@
+from django.test import RequestFactory
+
+from rest_framework_simplejwt.authentication import JWTTokenUserAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.authentication import CachedJWTTokenUserAuthentication
+from core.management.benchmark import BenchmarkCommand
+from core.utils import BulkUtil
+
+from users.models import EmailUser
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Authenticates --requests requests carrying --tokens distinct access "
+        "tokens, with the plain and the cached JWT authentication, and reports "
+        "the authentication cost per request and the cache hit ratio."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20000)
+        parser.add_argument("--tokens", type=int, default=100)
+
+    def run_benchmark(self, *args, **options):
+        users = BulkUtil.bulk_create_with_ids(
+            EmailUser,
+            [
+                EmailUser(email=f"user{index}@benchmark.local", password="!")
+                for index in range(options["tokens"])
+            ],
+        )
+
+        factory = RequestFactory()
+        requests = [
+            factory.get(
+                "/",
+                HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}",
+            )
+            for user in users
+        ]
+
+        for authentication in [
+            JWTTokenUserAuthentication(),
+            CachedJWTTokenUserAuthentication(),
+        ]:
+            CachedJWTTokenUserAuthentication.cache.clear()
+            calls = iter(range(options["requests"]))
+
+            def authenticate():
+                request = requests[next(calls) % len(requests)]
+                authentication.authenticate(request)
+
+            durations = self.time_calls(authenticate, options["requests"])
+            self.report(type(authentication).__name__, durations)
+
+        self.stdout.write(
+            f"Cache: {CachedJWTTokenUserAuthentication.cache.get_stats()}"
+        )
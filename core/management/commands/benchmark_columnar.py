@@ -0,0 +1,120 @@
+import gzip
+import json
+
+from django.db.models import CharField, Value
+from django.test import Client
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from businesses.models import Business, Order
+from businesses.serializers import BusinessSerializer, OrderSerializer
+from core.management.benchmark import BenchmarkCommand
+from core.renderers import ColumnarJSONRenderer, FastJSONRenderer
+from users.utils import InvitationUtil
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Compares the JSON and the columnar JSON responses of the business and "
+        "order list endpoints: bytes, gzipped bytes, request time, and the time "
+        "a client takes to parse them. The same for lists of --rows businesses "
+        "and orders serialized at once."
+    )
+
+    media_types = {
+        "json": FastJSONRenderer.media_type,
+        "columnar": ColumnarJSONRenderer.media_type,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def create_orders(self, businesses):
+        [user] = InvitationUtil.invite_employees(
+            businesses[0],
+            [
+                {
+                    "email": "benchmark@example.com",
+                    "first_name": "Benchmark",
+                    "last_name": "Employee",
+                }
+            ],
+        )
+
+        Order.objects.bulk_create(
+            [
+                Order(
+                    doctor_name="Benchmark doctor",
+                    patient_name=f"Patient {index}",
+                    patient_age=30 + index % 40,
+                    notes="Benchmark order",
+                    teeth={"upper_left": [1, 2], "lower_right": [6]},
+                    from_business=businesses[0],
+                    from_user=user,
+                    to_business=businesses[1 + index % (len(businesses) - 1)],
+                )
+                for index in range(len(businesses))
+            ]
+        )
+
+        return user
+
+    def report_sizes(self, label, contents):
+        for name, content in contents.items():
+            self.stdout.write(
+                f"  {label} {name}: {len(content)} bytes, "
+                f"{len(gzip.compress(content))} gzipped"
+            )
+
+    def report_parse_times(self, label, contents, repeat):
+        for name, content in contents.items():
+            self.report(
+                f"  {label} {name} parse",
+                self.time_calls(lambda: json.loads(content), repeat),
+            )
+
+    def run_benchmark(self, *args, **options):
+        repeat = options["repeat"]
+
+        businesses = self.create_businesses(options["rows"])
+        user = self.create_orders(businesses)
+
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+        for url in ["/api/businesses/", "/api/orders/"]:
+            self.stdout.write(url)
+            contents = {}
+
+            for name, media_type in self.media_types.items():
+                self.report(
+                    f"  {name} request",
+                    self.time_calls(
+                        lambda: client.get(url, HTTP_ACCEPT=media_type), repeat
+                    ),
+                )
+                contents[name] = client.get(url, HTTP_ACCEPT=media_type).content
+
+            self.report_sizes("page", contents)
+            self.report_parse_times("page", contents, repeat)
+
+        orders = Order.objects.annotate(
+            order_type=Value("placed", output_field=CharField())
+        ).select_related("from_business", "to_business", "from_user", "to_user")
+        payloads = {
+            "businesses": BusinessSerializer(businesses, many=True).data,
+            "orders": OrderSerializer(
+                orders, many=True, context={"action": "list"}
+            ).data,
+        }
+
+        for label, payload in payloads.items():
+            self.stdout.write(f"{len(payload)} {label} at once")
+            contents = {
+                "json": JSONRenderer().render(payload),
+                "columnar": ColumnarJSONRenderer().render(payload),
+            }
+
+            self.report_sizes("list", contents)
+            self.report_parse_times("list", contents, repeat)
@@ -0,0 +1,77 @@
+import io
+
+from django.core.management.base import CommandError
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from businesses.serializers import BusinessSerializer
+from core.management.benchmark import BenchmarkCommand
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+from core.utils import CurrentPagePagination
+from users.models import EmailToken
+from users.utils import InvitationUtil
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Renders serialized payloads, a page of businesses and a page of email "
+        "tokens with their UUIDs and datetimes, --repeat times with the DRF "
+        "JSONRenderer and with FastJSONRenderer, and parses the rendered pages "
+        "back with both parsers. Fails when the rendered bytes differ."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=2000)
+
+    def get_payloads(self):
+        businesses = self.create_businesses(CurrentPagePagination.page_size)
+
+        InvitationUtil.invite_employees(
+            businesses[0],
+            [
+                {
+                    "email": f"benchmark-{index}@example.com",
+                    "first_name": "Benchmark",
+                    "last_name": f"Employee {index}",
+                }
+                for index in range(CurrentPagePagination.page_size)
+            ],
+        )
+
+        return {
+            "businesses": BusinessSerializer(businesses, many=True).data,
+            "email tokens": list(
+                EmailToken.objects.values(
+                    "token", "expiry", "category", "is_used", "used_time", "created_at"
+                )
+            ),
+        }
+
+    def run_benchmark(self, *args, **options):
+        repeat = options["repeat"]
+
+        for name, payload in self.get_payloads().items():
+            rendered = JSONRenderer().render(payload)
+
+            if FastJSONRenderer().render(payload) != rendered:
+                raise CommandError(f"FastJSONRenderer rendered {name} differently")
+
+            self.stdout.write(f"{name}: {len(payload)} rows, {len(rendered)} bytes")
+
+            for renderer_class in [JSONRenderer, FastJSONRenderer]:
+                renderer = renderer_class()
+
+                self.report(
+                    f"  render with {renderer_class.__name__}",
+                    self.time_calls(lambda: renderer.render(payload), repeat),
+                )
+
+            for parser_class in [JSONParser, FastJSONParser]:
+                parser = parser_class()
+
+                self.report(
+                    f"  parse with {parser_class.__name__}",
+                    self.time_calls(lambda: parser.parse(io.BytesIO(rendered)), repeat),
+                )
@@ -0,0 +1,90 @@
+import random
+import time
+
+from django.test import Client
+from django.test.utils import override_settings
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+from businesses.models import BusinessConnect, BusinessContact, BusinessOwner
+from core.management.benchmark import BenchmarkCommand
+from core.response_cache import response_cache
+from users.models import EmailUser
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Requests the contact list and the customers of a laboratory --repeat "
+        "times, with a contact of the laboratory or one of its customers "
+        "created after about every --write-every requests, and reports the "
+        "request times and the hit rates of the response cache, for the store "
+        "of --store."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=1000)
+        parser.add_argument("--write-every", type=int, default=50)
+        parser.add_argument(
+            "--store", default="core.response_cache.LocalMemoryResponseStore"
+        )
+
+    def create_laboratory(self):
+        businesses = self.create_businesses(9)
+        laboratory, customers = businesses[0], businesses[1:]
+
+        owner = EmailUser.objects.create_user(
+            "benchmark@example.com", "password123", user_type="owner"
+        )
+        BusinessOwner.objects.create(business=laboratory, owner=owner)
+        BusinessConnect.objects.bulk_create(
+            [
+                BusinessConnect(from_business=laboratory, to_business=customer)
+                for customer in customers
+            ]
+        )
+
+        return owner, businesses
+
+    def run_benchmark(self, *args, **options):
+        owner, businesses = self.create_laboratory()
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(owner)}")
+        urls = [
+            "/api/business/contacts/",
+            "/api/businesses/customers_of_laboratory/",
+        ]
+
+        with override_settings(RESPONSE_CACHE_STORE=options["store"]):
+            response_cache.store = None
+            response_cache.clear()
+
+            durations = {"HIT": [], "MISS": []}
+
+            for index in range(options["repeat"]):
+                if random.random() < 1 / options["write_every"]:
+                    BusinessContact.objects.create(
+                        business=random.choice(businesses), contact=str(index)
+                    )
+
+                started_at = time.perf_counter()
+                response = client.get(urls[index % len(urls)])
+                durations[response["X-Cache"]].append(time.perf_counter() - started_at)
+
+            for key, values in durations.items():
+                if values:
+                    self.report(f"{key} requests", values)
+
+            stats = response_cache.get_stats()
+            self.stdout.write(
+                f"Hit rate {stats['hit_ratio']:.1%}, "
+                f"{stats['invalidations']} businesses invalidated"
+            )
+
+            for endpoint, endpoint_stats in stats["endpoints"].items():
+                self.stdout.write(
+                    f"  {endpoint}: {endpoint_stats['hits']} hits, "
+                    f"{endpoint_stats['misses']} misses, "
+                    f"{endpoint_stats['hit_ratio']:.1%}"
+                )
+
+            response_cache.clear()
+            response_cache.store = None
@@ -0,0 +1,43 @@
+from businesses.serializers import BusinessImportRowSerializer, BusinessSerializer
+from core.management.benchmark import BenchmarkCommand
+from core.utils import CurrentPagePagination
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measures the construction cost of the server_ error serializers: "
+        "binding the fields of a flat and a nested serializer, and rendering a "
+        "page of businesses with their nested serializers, --repeat times each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=2000)
+
+    def run_benchmark(self, *args, **options):
+        repeat = options["repeat"]
+
+        def construct_row_serializer():
+            BusinessImportRowSerializer(data={}).fields
+
+        self.report(
+            "BusinessImportRowSerializer fields",
+            self.time_calls(construct_row_serializer, repeat),
+        )
+
+        def construct_business_serializer():
+            BusinessSerializer(many=True).child.fields
+
+        self.report(
+            "BusinessSerializer fields",
+            self.time_calls(construct_business_serializer, repeat),
+        )
+
+        page = self.create_businesses(CurrentPagePagination.page_size)
+
+        def render_page():
+            BusinessSerializer(page, many=True).data
+
+        self.report(
+            f"BusinessSerializer page of {len(page)}",
+            self.time_calls(render_page, repeat),
+        )
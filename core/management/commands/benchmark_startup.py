@@ -0,0 +1,111 @@
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter, everything a worker loads before it answers
+STARTUP_SCRIPT = """
+import time
+
+started_at = time.perf_counter()
+
+import django
+
+django.setup()
+
+from django.test import Client
+
+status = Client().get({url!r}, HTTP_ACCEPT="application/json").status_code
+print(time.perf_counter() - started_at, status)
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Starts --repeat fresh interpreters that set Django up and answer one "
+        "request to --url, and reports the time to that first response. One "
+        "more run under -X importtime gives the import time per top level "
+        "package. With --max-seconds it fails when the median time to first "
+        "response is above it, to catch startup regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--url", default="/")
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--max-seconds", type=float)
+
+    def run_interpreter(self, url, *flags):
+        started_at = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, *flags, "-c", STARTUP_SCRIPT.format(url=url)],
+            capture_output=True,
+            cwd=settings.BASE_DIR,
+            text=True,
+        )
+        elapsed = time.perf_counter() - started_at
+
+        if result.returncode != 0:
+            raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+
+        in_process, status = result.stdout.split()[-2:]
+
+        return elapsed, float(in_process), int(status), result.stderr
+
+    def get_import_times(self, importtime_output):
+        """Microseconds of import time per top level package."""
+        times = Counter()
+
+        for line in importtime_output.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+
+            self_time, _, module = line[len("import time:") :].split("|")
+
+            if not self_time.strip().isdigit():
+                continue
+
+            times[module.strip().split(".")[0]] += int(self_time)
+
+        return times
+
+    def handle(self, *args, **options):
+        runs = [self.run_interpreter(options["url"]) for _ in range(options["repeat"])]
+
+        process_times = [run[0] for run in runs]
+        first_response_times = [run[1] for run in runs]
+
+        self.stdout.write(
+            f"Status {runs[0][2]} from {options['url']}, {len(runs)} cold starts"
+        )
+        self.stdout.write(
+            f"Process start to exit: median {statistics.median(process_times):.3f}s, "
+            f"max {max(process_times):.3f}s"
+        )
+        self.stdout.write(
+            f"Setup to first response: median "
+            f"{statistics.median(first_response_times):.3f}s, "
+            f"max {max(first_response_times):.3f}s"
+        )
+
+        *_, importtime_output = self.run_interpreter(options["url"], "-X", "importtime")
+        times = self.get_import_times(importtime_output)
+
+        self.stdout.write(f"Imports: {sum(times.values()) / 1000:.1f}ms in total")
+
+        for package, microseconds in times.most_common(options["top"]):
+            self.stdout.write(f"  {package:<32} {microseconds / 1000:8.1f}ms")
+
+        if options["max_seconds"] is not None:
+            median = statistics.median(first_response_times)
+
+            if median > options["max_seconds"]:
+                raise CommandError(
+                    f"Median time to first response {median:.3f}s is above "
+                    f"--max-seconds {options['max_seconds']:.3f}s"
+                )
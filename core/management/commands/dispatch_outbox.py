@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.constants import OUTBOX_BATCH_SIZE, OUTBOX_POLL_SECONDS
+from core.utils import OutboxUtil
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends the due emails and SMS of the outbox in batches of --batch-size. "
+        "Failed sends are retried with exponential backoff. Without --loop it "
+        "stops once nothing is due, with --loop it keeps polling every --poll "
+        "seconds, which is how it runs next to the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--poll", type=float, default=OUTBOX_POLL_SECONDS)
+
+    def handle(self, *args, **options):
+        totals = [0, 0, 0]
+
+        try:
+            while True:
+                messages = OutboxUtil.claim_due(options["batch_size"])
+
+                if not messages:
+                    if not options["loop"]:
+                        break
+
+                    time.sleep(options["poll"])
+                    continue
+
+                counts = OutboxUtil.dispatch(messages)
+                totals = [total + count for total, count in zip(totals, counts)]
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write("{} sent, {} to retry, {} failed".format(*totals))
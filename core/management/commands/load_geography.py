@@ -0,0 +1,338 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.geography import geography_index
+from core.models import City, District, Pincode, State
+
+
+def iter_csv_rows(file):
+    yield from csv.DictReader(file)
+
+
+def iter_json_lines_rows(file):
+    for line in file:
+        line = line.strip()
+
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_array_rows(file, chunk_size=1 << 16):
+    """Streams the objects of a top level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+
+            if not started:
+                if position == len(buffer):
+                    break
+
+                if buffer[position] != "[":
+                    raise CommandError("JSON input must be an array of objects")
+
+                started = True
+                position += 1
+                continue
+
+            if position < len(buffer) and buffer[position] == "]":
+                return
+
+            try:
+                row, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError("JSON input ended inside an object")
+                break
+
+            yield row
+
+        buffer = buffer[position:]
+
+        if not chunk:
+            return
+
+
+ROW_READERS = {
+    "csv": iter_csv_rows,
+    "jsonl": iter_json_lines_rows,
+    "json": iter_json_array_rows,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Upserts State, District, City and Pincode rows from a CSV, JSON array or JSON "
+        "lines file with the columns state, gst_code, district, city and "
+        "pincode. "
+        "Rows are matched on their names (case insensitive) under their parent, "
+        "so loading the same file twice changes nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=sorted(ROW_READERS), default=None)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or path.rsplit(".", 1)[-1].lower()
+
+        if file_format not in ROW_READERS:
+            raise CommandError(
+                f"Unknown format {file_format}, use --format {'|'.join(ROW_READERS)}"
+            )
+
+        self.batch_size = options["batch_size"]
+        self.load_maps()
+
+        self.stats = {
+            "rows": 0,
+            "skipped": 0,
+            "states_created": 0,
+            "states_updated": 0,
+            "districts_created": 0,
+            "cities_created": 0,
+            "pincodes_created": 0,
+        }
+
+        started_at = time.perf_counter()
+
+        with open(path, newline="", encoding="utf-8") as file:
+            batch = []
+
+            for row in ROW_READERS[file_format](file):
+                batch.append(row)
+
+                if len(batch) >= self.batch_size:
+                    self.load_batch(batch)
+                    batch = []
+
+            if batch:
+                self.load_batch(batch)
+
+        elapsed = time.perf_counter() - started_at
+        geography_index.invalidate()
+
+        for key, value in self.stats.items():
+            self.stdout.write(f"{key}: {value}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {self.stats['rows']} rows in {elapsed:.2f}s "
+                f"({self.stats['rows'] / max(elapsed, 1e-9):.0f} rows/s)"
+            )
+        )
+
+    def bulk_create(self, model, objects, parent_field=None):
+        """
+        bulk_create that returns a queryset of the rows it created. Backends
+        like SQLite do not return ids from bulk inserts, so the rows are read
+        back by their natural key, the name under their parent. Reading back
+        an id range instead could pick up rows inserted concurrently.
+        """
+        objects = list(objects)
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+        queryset = model.objects.filter(name__in={item.name for item in objects})
+
+        if parent_field:
+            queryset = queryset.filter(
+                **{
+                    f"{parent_field}__in": {
+                        getattr(item, parent_field) for item in objects
+                    }
+                }
+            )
+
+        return queryset
+
+    def load_maps(self):
+        self.states = {
+            name.casefold(): [state_id, gst_code]
+            for state_id, name, gst_code in State.objects.values_list(
+                "id", "name", "gst_code"
+            )
+        }
+        self.districts = {
+            (state_id, name.casefold()): district_id
+            for district_id, name, state_id in District.objects.values_list(
+                "id", "name", "state_id"
+            )
+        }
+        self.cities = {
+            (district_id, name.casefold()): city_id
+            for city_id, name, district_id in City.objects.values_list(
+                "id", "name", "district_id"
+            )
+        }
+        self.pincodes = set(Pincode.objects.values_list("code", "city_id"))
+
+    def clean_row(self, row):
+        if not isinstance(row, dict):
+            return None
+
+        state = str(row.get("state") or "").strip()
+        district = str(row.get("district") or "").strip()
+        city = str(row.get("city") or "").strip()
+        gst_code = str(row.get("gst_code") or "").strip()
+        pincode = str(row.get("pincode") or "").strip()
+
+        if not state or not gst_code.isnumeric():
+            return None
+
+        if pincode and (len(pincode) != 6 or not pincode.isnumeric()):
+            return None
+
+        return {
+            "state": state,
+            "gst_code": int(gst_code),
+            "district": district,
+            "city": city,
+            "pincode": pincode,
+        }
+
+    def load_batch(self, batch):
+        rows = []
+
+        for row in batch:
+            self.stats["rows"] += 1
+            row = self.clean_row(row)
+
+            if row is None:
+                self.stats["skipped"] += 1
+            else:
+                rows.append(row)
+
+        with transaction.atomic():
+            self.upsert_states(rows)
+            self.upsert_districts(rows)
+            self.upsert_cities(rows)
+            self.upsert_pincodes(rows)
+
+    def upsert_states(self, rows):
+        new_states = {}
+        changed_states = {}
+
+        for row in rows:
+            key = row["state"].casefold()
+            existing = self.states.get(key)
+
+            if existing is None:
+                new_states.setdefault(
+                    key, State(name=row["state"], gst_code=row["gst_code"])
+                )
+
+            elif existing[1] != row["gst_code"]:
+                existing[1] = row["gst_code"]
+                changed_states[existing[0]] = State(
+                    id=existing[0],
+                    gst_code=row["gst_code"],
+                    modified_at=timezone.now(),
+                )
+
+        if new_states:
+            queryset = self.bulk_create(State, new_states.values())
+            self.stats["states_created"] += len(new_states)
+
+            for state_id, name, gst_code in queryset.values_list(
+                "id", "name", "gst_code"
+            ):
+                if name.casefold() in new_states:
+                    self.states[name.casefold()] = [state_id, gst_code]
+
+        if changed_states:
+            State.objects.bulk_update(
+                changed_states.values(), ["gst_code", "modified_at"]
+            )
+            self.stats["states_updated"] += len(changed_states)
+
+    def upsert_districts(self, rows):
+        new_districts = {}
+
+        for row in rows:
+            if not row["district"]:
+                continue
+
+            state_id = self.states[row["state"].casefold()][0]
+            key = (state_id, row["district"].casefold())
+
+            if key not in self.districts and key not in new_districts:
+                new_districts[key] = District(name=row["district"], state_id=state_id)
+
+        if new_districts:
+            queryset = self.bulk_create(
+                District, new_districts.values(), parent_field="state_id"
+            )
+            self.stats["districts_created"] += len(new_districts)
+
+            for district_id, name, state_id in queryset.values_list(
+                "id", "name", "state_id"
+            ):
+                key = (state_id, name.casefold())
+
+                if key in new_districts:
+                    self.districts[key] = district_id
+
+    def upsert_cities(self, rows):
+        new_cities = {}
+
+        for row in rows:
+            if not row["district"] or not row["city"]:
+                continue
+
+            state_id = self.states[row["state"].casefold()][0]
+            district_id = self.districts[(state_id, row["district"].casefold())]
+            key = (district_id, row["city"].casefold())
+
+            if key not in self.cities and key not in new_cities:
+                new_cities[key] = City(name=row["city"], district_id=district_id)
+
+        if new_cities:
+            queryset = self.bulk_create(
+                City, new_cities.values(), parent_field="district_id"
+            )
+            self.stats["cities_created"] += len(new_cities)
+
+            for city_id, name, district_id in queryset.values_list(
+                "id", "name", "district_id"
+            ):
+                key = (district_id, name.casefold())
+
+                if key in new_cities:
+                    self.cities[key] = city_id
+
+    def upsert_pincodes(self, rows):
+        new_pincodes = {}
+
+        for row in rows:
+            if not row["district"] or not row["city"] or not row["pincode"]:
+                continue
+
+            state_id = self.states[row["state"].casefold()][0]
+            district_id = self.districts[(state_id, row["district"].casefold())]
+            city_id = self.cities[(district_id, row["city"].casefold())]
+            key = (row["pincode"], city_id)
+
+            if key not in self.pincodes and key not in new_pincodes:
+                new_pincodes[key] = Pincode(code=row["pincode"], city_id=city_id)
+
+        if new_pincodes:
+            Pincode.objects.bulk_create(
+                new_pincodes.values(), batch_size=self.batch_size
+            )
+            self.stats["pincodes_created"] += len(new_pincodes)
+            self.pincodes.update(new_pincodes)
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.4 on 2026-10-19 13:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Pincode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('code', models.CharField(db_index=True, max_length=6)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pincodes', to='core.city')),
+            ],
+            options={
+                'verbose_name': 'Pincode',
+                'verbose_name_plural': 'Pincodes',
+                'unique_together': {('code', 'city')},
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class TimeStampedModel(models.Model):
@@ -50,6 +51,21 @@ class City(TimeStampedModel):
         verbose_name_plural = "Cities"
 
 
+class Pincode(TimeStampedModel):
+    code = models.CharField(max_length=6, db_index=True)
+    city = models.ForeignKey(
+        "core.City", on_delete=models.PROTECT, related_name="pincodes"
+    )
+
+    def __str__(self):
+        return f"{self.code} - {self.city}"
+
+    class Meta:
+        verbose_name = "Pincode"
+        verbose_name_plural = "Pincodes"
+        unique_together = ["code", "city"]
+
+
 class JobType(TimeStampedModel):
     option = models.CharField(max_length=255)
 
@@ -59,3 +75,61 @@ class JobType(TimeStampedModel):
     class Meta:
         verbose_name = "Job Type"
         verbose_name_plural = "Job Types"
+
+
+class OutboxMessage(TimeStampedModel):
+    """
+    An email or SMS to deliver. Rows are written in the same transaction as
+    whatever they announce and sent later by the dispatch_outbox command.
+    """
+
+    CHANNEL_CHOICES = [
+        ("email", "Email"),
+        ("sms", "SMS"),
+    ]
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    channel = models.CharField(max_length=5, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=255)
+    # SendGrid dynamic template id for emails, SMS template name for SMS
+    template = models.CharField(max_length=255)
+    data = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.id} - {self.channel} - {self.recipient} - {self.status}"
+
+    class Meta:
+        verbose_name = "Outbox Message"
+        verbose_name_plural = "Outbox Messages"
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+
+class RevokedToken(TimeStampedModel):
+    """A JWT refused before its exp, see core.revocation."""
+
+    jti = models.CharField(max_length=255, unique=True)
+    # The token's own exp, past it the row can be purged
+    expiry = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.id} - {self.jti}"
+
+    class Meta:
+        verbose_name = "Revoked Token"
+        verbose_name_plural = "Revoked Tokens"
+        indexes = [
+            models.Index(fields=["created_at"], name="revoked_token_created_idx"),
+        ]
@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from core.constants import SMS_TEMPLATES
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxDeliveryError(Exception):
+    """The provider did not accept a batch, every message of it is retried."""
+
+    retryable = True
+
+
+class OutboxRejectedError(OutboxDeliveryError):
+    """
+    The provider refused a batch for its content, sending it again cannot
+    succeed. OutboxUtil.dispatch splits the batch to find the messages at
+    fault, a single rejected message fails without retries.
+    """
+
+    retryable = False
+
+
+class SendGridEmailProvider:
+    """
+    Sends through the SendGrid v3 mail/send endpoint. A batch shares one
+    dynamic template and goes as one request, with a personalization per
+    message.
+
+    The connection pool lives as long as the provider, which get_provider
+    keeps for the whole dispatcher process, so connections and TLS sessions
+    are reused between batches.
+    """
+
+    URL = "https://api.sendgrid.com/v3/mail/send"
+    RETRYABLE = {401, 403, 408, 429}
+    # SendGrid accepts up to 1000 personalizations per request
+    max_batch_size = 1000
+
+    def __init__(self):
+        # Only the dispatcher sends, web workers never import urllib3
+        import urllib3
+
+        self.pool = urllib3.PoolManager(
+            num_pools=1,
+            maxsize=4,
+            timeout=urllib3.Timeout(connect=5, read=30),
+            # Only short in-process retries, the outbox backs off for longer
+            retries=urllib3.Retry(
+                total=2,
+                backoff_factor=0.5,
+                status_forcelist=[429, 502, 503, 504],
+                allowed_methods=frozenset(["POST"]),
+                raise_on_status=False,
+            ),
+        )
+
+    def send(self, template, messages):
+        body = {
+            "from": {"email": settings.DEFAULT_FROM_EMAIL},
+            "template_id": template,
+            "personalizations": [
+                {
+                    "to": [{"email": message.recipient}],
+                    "dynamic_template_data": message.data,
+                }
+                for message in messages
+            ],
+        }
+
+        response = self.pool.request(
+            "POST",
+            self.URL,
+            body=json.dumps(body).encode("utf-8"),
+            headers={
+                "Authorization": f"Bearer {settings.SENDGRID_API_KEY}",
+                "Content-Type": "application/json",
+            },
+        )
+
+        if response.status < 300:
+            return
+
+        error = f"SendGrid answered {response.status}: {response.data[:500]!r}"
+
+        # An invalid address or payload, unlike rate limits, timeouts and an
+        # API key that lost its permissions, which recover once fixed
+        if 400 <= response.status < 500 and response.status not in self.RETRYABLE:
+            raise OutboxRejectedError(error)
+
+        raise OutboxDeliveryError(error)
+
+
+class LoggingProvider:
+    """
+    Writes messages to the log instead of delivering them. The SMS default
+    until a gateway is wired in, also handy for emails in local development.
+    """
+
+    max_batch_size = 1000
+
+    def send(self, template, messages):
+        for message in messages:
+            if message.channel == "sms":
+                text = SMS_TEMPLATES[template].format(**message.data)
+            else:
+                text = f"{template} {message.data}"
+
+            logger.info("%s to %s: %s", message.channel, message.recipient, text)
+
+
+class LocalMemoryProvider:
+    """
+    Keeps sent messages in LocalMemoryProvider.outbox, like the locmem email
+    backend does with django.core.mail.outbox. Stands in for real providers
+    in tests.
+    """
+
+    max_batch_size = 1000
+    outbox = []
+
+    def send(self, template, messages):
+        for message in messages:
+            LocalMemoryProvider.outbox.append(
+                {
+                    "channel": message.channel,
+                    "recipient": message.recipient,
+                    "template": template,
+                    "data": message.data,
+                }
+            )
+
+
+providers = {}
+providers_lock = threading.Lock()
+
+
+def get_provider(channel):
+    """Shared provider instance of channel, from settings.OUTBOX_PROVIDERS."""
+    path = settings.OUTBOX_PROVIDERS[channel]
+
+    if path not in providers:
+        with providers_lock:
+            if path not in providers:
+                providers[path] = import_string(path)()
+
+    return providers[path]
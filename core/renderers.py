@@ -0,0 +1,90 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson, and with the stdlib json of
+    JSONRenderer when orjson is not installed.
+
+    The output is byte for byte the output of JSONRenderer. orjson writes
+    compact UTF-8 like JSONRenderer does with the default COMPACT_JSON and
+    UNICODE_JSON. Dates, times, decimals, lazy strings and every other type
+    orjson does not write like the stdlib are handed to the default of
+    encoder_class. Pretty printing, non default JSON settings and data orjson
+    cannot encode, like integers beyond 64 bits, go to JSONRenderer.
+
+    Floats are the exception, orjson writes the ones below 1e-4 or from 1e16
+    in another but equal notation, 1e16 instead of 1e+16, and NaN and
+    Infinity as null where STRICT_JSON makes JSONRenderer fail.
+    """
+
+    if orjson is not None:
+        options = (
+            orjson.OPT_NON_STR_KEYS
+            | orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default, option=self.options
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escaped like JSONRenderer does, to stay a javascript subset
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    """
+    Renders a list of objects column by column, every key once with the
+    values of all the objects for it as an array, so
+    [{"id": 1, "name": "A"}, {"id": 2, "name": "B"}] becomes
+    {"id": [1, 2], "name": ["A", "B"]}.
+
+    Applies to list responses and to the results of CurrentPagePagination
+    responses, nested values are left as they are. Anything else, an empty
+    list included, renders like FastJSONRenderer.
+    """
+
+    media_type = "application/vnd.crown.columnar+json"
+    format = "columnar"
+
+    @staticmethod
+    def get_columns(rows):
+        if not rows or not all(isinstance(row, dict) for row in rows):
+            return rows
+
+        keys = rows[0].keys()
+
+        if any(row.keys() != keys for row in rows):
+            return rows
+
+        return {key: [row[key] for row in rows] for key in keys}
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            data = self.get_columns(data)
+        elif isinstance(data, dict) and isinstance(data.get("results"), list):
+            data = {**data, "results": self.get_columns(data["results"])}
+
+        return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,389 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from rest_framework.response import Response
+
+from core.constants import RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TIMEOUT_SECONDS
+
+
+class LocalMemoryResponseStore:
+    """
+    Responses and generations of this process only. A write in another
+    worker process does not bump the generations here, so it suits a single
+    process, like the development server.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.generations = Counter()
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_generation(self, business_id):
+        return self.generations[business_id]
+
+    def get_generations(self, business_ids):
+        return {
+            business_id: self.generations[business_id] for business_id in business_ids
+        }
+
+    def bump_generations(self, business_ids):
+        with self.lock:
+            for business_id in business_ids:
+                self.generations[business_id] += 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+
+            return value
+
+    def get_many(self, keys):
+        values = {}
+
+        for key in keys:
+            value = self.get(key)
+
+            if value is not None:
+                values[key] = value
+
+        return values
+
+    def set(self, key, business_id, value, timeout):
+        self.set_many([(key, business_id, value)], timeout)
+
+    def set_many(self, entries, timeout):
+        with self.lock:
+            expires_at = time.monotonic() + timeout
+
+            for key, business_id, value in entries:
+                self.entries[key] = (value, expires_at)
+                self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.generations.clear()
+            self.entries.clear()
+
+
+class SQLiteResponseStore:
+    """
+    Responses and generations in a SQLite file, shared by every worker
+    process of a host, so a write in one process drops the responses of the
+    business in all of them.
+    """
+
+    PRUNE_EVERY = 1000
+    # Below the bound variables SQLite allows in a statement
+    CHUNK_SIZE = 500
+
+    def __init__(self, path=None):
+        self.path = path or settings.RESPONSE_CACHE_SQLITE_PATH
+        self.local = threading.local()
+        self.sets = 0
+
+    def get_connection(self):
+        connection = getattr(self.local, "connection", None)
+
+        if connection is None or getattr(self.local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS generations "
+                "(business_id INTEGER PRIMARY KEY, generation INTEGER)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                "business_id INTEGER, value BLOB, expires_at REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_business_id "
+                "ON responses (business_id)"
+            )
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+
+        return connection
+
+    def get_generation(self, business_id):
+        row = (
+            self.get_connection()
+            .execute(
+                "SELECT generation FROM generations WHERE business_id = ?",
+                [business_id],
+            )
+            .fetchone()
+        )
+
+        return row[0] if row is not None else 0
+
+    def select_in(self, query, values, *params):
+        """Rows of query for values, its IN (%s) list filled a chunk at a time."""
+        connection = self.get_connection()
+        values = list(values)
+        rows = []
+
+        for start in range(0, len(values), self.CHUNK_SIZE):
+            chunk = values[start : start + self.CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            rows += connection.execute(query % placeholders, [*chunk, *params])
+
+        return rows
+
+    def get_generations(self, business_ids):
+        generations = dict.fromkeys(business_ids, 0)
+        generations.update(
+            self.select_in(
+                "SELECT business_id, generation FROM generations "
+                "WHERE business_id IN (%s)",
+                generations,
+            )
+        )
+
+        return generations
+
+    def bump_generations(self, business_ids):
+        connection = self.get_connection()
+        business_ids = [[business_id] for business_id in business_ids]
+
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            connection.executemany(
+                "INSERT INTO generations VALUES (?, 1) ON CONFLICT (business_id) "
+                "DO UPDATE SET generation = generation + 1",
+                business_ids,
+            )
+            # Unreachable with the new generation anyway
+            connection.executemany(
+                "DELETE FROM responses WHERE business_id = ?", business_ids
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def get(self, key):
+        row = (
+            self.get_connection()
+            .execute(
+                "SELECT value FROM responses WHERE key = ? AND expires_at > ?",
+                [key, time.time()],
+            )
+            .fetchone()
+        )
+
+        return row[0] if row is not None else None
+
+    def get_many(self, keys):
+        return dict(
+            self.select_in(
+                "SELECT key, value FROM responses WHERE key IN (%s) AND expires_at > ?",
+                keys,
+                time.time(),
+            )
+        )
+
+    def set(self, key, business_id, value, timeout):
+        self.set_many([(key, business_id, value)], timeout)
+
+    def set_many(self, entries, timeout):
+        connection = self.get_connection()
+        # Wall clock, monotonic clocks are not comparable across processes
+        now = time.time()
+        entries = [
+            [key, business_id, value, now + timeout]
+            for key, business_id, value in entries
+        ]
+
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", entries
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        previous_sets = self.sets
+        self.sets += len(entries)
+
+        if self.sets // self.PRUNE_EVERY != previous_sets // self.PRUNE_EVERY:
+            connection.execute("DELETE FROM responses WHERE expires_at < ?", [now])
+
+    def clear(self):
+        connection = self.get_connection()
+        connection.execute("DELETE FROM generations")
+        connection.execute("DELETE FROM responses")
+
+
+class ResponseCache:
+    """
+    Response data of list endpoints, cached per business, endpoint and query
+    params in the store of settings.RESPONSE_CACHE_STORE. get_values caches
+    other per business data the same way, like the connections of
+    businesses.utils.ConnectionGraphUtil.
+
+    Every key holds the generation of its business. Bumping the generation
+    makes the cached responses of a business unreachable at once. The
+    generation is read before the response is built, so a response built
+    from data that changed meanwhile is stored under the old generation and
+    never served.
+    """
+
+    def __init__(self):
+        self.store = None
+        self.lock = threading.Lock()
+
+        self.hits = Counter()
+        self.misses = Counter()
+        self.invalidations = 0
+
+    def get_store(self):
+        if self.store is None:
+            with self.lock:
+                if self.store is None:
+                    self.store = import_string(settings.RESPONSE_CACHE_STORE)()
+
+        return self.store
+
+    @staticmethod
+    def get_key(business_id, generation, endpoint, query_params=None):
+        query = (
+            urlencode(sorted(query_params.lists()), doseq=True) if query_params else ""
+        )
+        return f"{business_id}:{generation}:{endpoint}:{query}"
+
+    def get_response(self, business_id, endpoint, query_params, get_response):
+        """
+        Cached response of the endpoint for business_id, otherwise the one
+        of get_response, cached when it is a 200.
+        """
+        store = self.get_store()
+        key = self.get_key(
+            business_id, store.get_generation(business_id), endpoint, query_params
+        )
+        value = store.get(key)
+
+        if value is not None:
+            self.hits[endpoint] += 1
+
+            response = Response(pickle.loads(value))
+            response["X-Cache"] = "HIT"
+            return response
+
+        self.misses[endpoint] += 1
+
+        response = get_response()
+
+        if response.status_code == 200:
+            value = pickle.dumps(response.data, pickle.HIGHEST_PROTOCOL)
+            store.set(key, business_id, value, RESPONSE_CACHE_TIMEOUT_SECONDS)
+
+        response["X-Cache"] = "MISS"
+        return response
+
+    def get_values(self, business_ids, name, get_values):
+        """
+        {business_id: value} of name, the cached values and those of
+        get_values(missing business ids) for the others, which are cached.
+        """
+        store = self.get_store()
+        keys = {
+            business_id: self.get_key(business_id, generation, name)
+            for business_id, generation in store.get_generations(business_ids).items()
+        }
+        cached = store.get_many(keys.values())
+
+        values = {
+            business_id: pickle.loads(cached[key])
+            for business_id, key in keys.items()
+            if key in cached
+        }
+        missing = [business_id for business_id in keys if business_id not in values]
+
+        self.hits[name] += len(values)
+        self.misses[name] += len(missing)
+
+        if missing:
+            fresh = get_values(missing)
+
+            store.set_many(
+                [
+                    (
+                        keys[business_id],
+                        business_id,
+                        pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                    )
+                    for business_id, value in fresh.items()
+                ],
+                RESPONSE_CACHE_TIMEOUT_SECONDS,
+            )
+
+            values.update(fresh)
+
+        return values
+
+    def invalidate(self, business_ids):
+        business_ids = sorted(set(business_ids))
+
+        if business_ids:
+            self.get_store().bump_generations(business_ids)
+            self.invalidations += len(business_ids)
+
+    def clear(self):
+        self.get_store().clear()
+        self.hits.clear()
+        self.misses.clear()
+        self.invalidations = 0
+
+    def get_stats(self):
+        endpoints = {}
+
+        for endpoint in sorted(set(self.hits) | set(self.misses)):
+            hits = self.hits[endpoint]
+            lookups = hits + self.misses[endpoint]
+
+            endpoints[endpoint] = {
+                "hits": hits,
+                "misses": self.misses[endpoint],
+                "hit_ratio": hits / lookups,
+            }
+
+        hits = sum(self.hits.values())
+        lookups = hits + sum(self.misses.values())
+
+        return {
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "endpoints": endpoints,
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,184 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from core.constants import (
+    REVOCATION_FILTER_CAPACITY,
+    REVOCATION_FILTER_ERROR_RATE,
+    REVOCATION_FILTER_REBUILD_SECONDS,
+    REVOCATION_SYNC_OVERLAP_SECONDS,
+    REVOCATION_SYNC_SECONDS,
+)
+from core.models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Set membership with false positives at about error_rate once capacity
+    items were added, and never false negatives.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def get_positions(self, item):
+        # Double hashing, two halves of one digest give every probe position
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self.get_positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.get_positions(item)
+        )
+
+
+class RevocationFilter:
+    """
+    Revoked JTIs of RevokedToken, checked with a Bloom filter of this process.
+    A JTI the filter has not seen is not revoked, only filter positives are
+    looked up in the table.
+
+    The filter reads the rows created since its last sync at most every
+    REVOCATION_SYNC_SECONDS, and is rebuilt from the unexpired rows every
+    REVOCATION_FILTER_REBUILD_SECONDS or once it holds more than its capacity.
+
+    Each sync reads back REVOCATION_SYNC_OVERLAP_SECONDS before the last one,
+    for rows committed late. The JTIs of that window are remembered and not
+    added twice, so the count of the filter stays one per revoked token.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filter = None
+        self.built_at = 0.0
+        self.synced_at = 0.0
+        self.synced_until = None
+        self.recent_jtis = set()
+
+        self.checks = 0
+        self.positives = 0
+
+    @staticmethod
+    def get_recent_jtis(rows, now):
+        """JTIs of the rows the next sync reads again."""
+        since = now - timedelta(seconds=REVOCATION_SYNC_OVERLAP_SECONDS)
+        return {jti for jti, created_at in rows if created_at >= since}
+
+    def rebuild(self):
+        now = timezone.now()
+        rows = list(
+            RevokedToken.objects.filter(expiry__gt=now).values_list("jti", "created_at")
+        )
+
+        bloom_filter = BloomFilter(
+            max(REVOCATION_FILTER_CAPACITY, 2 * len(rows)),
+            REVOCATION_FILTER_ERROR_RATE,
+        )
+
+        for jti, created_at in rows:
+            bloom_filter.add(jti)
+
+        self.filter = bloom_filter
+        self.built_at = time.monotonic()
+        self.synced_until = now
+        self.recent_jtis = self.get_recent_jtis(rows, now)
+
+    def sync(self):
+        if time.monotonic() - self.synced_at < REVOCATION_SYNC_SECONDS:
+            return
+
+        with self.lock:
+            if time.monotonic() - self.synced_at < REVOCATION_SYNC_SECONDS:
+                return
+
+            if (
+                self.filter is None
+                or self.filter.count > self.filter.capacity
+                or time.monotonic() - self.built_at > REVOCATION_FILTER_REBUILD_SECONDS
+            ):
+                self.rebuild()
+            else:
+                now = timezone.now()
+                since = self.synced_until - timedelta(
+                    seconds=REVOCATION_SYNC_OVERLAP_SECONDS
+                )
+
+                rows = list(
+                    RevokedToken.objects.filter(
+                        created_at__gte=since, expiry__gt=now
+                    ).values_list("jti", "created_at")
+                )
+
+                for jti, created_at in rows:
+                    if jti not in self.recent_jtis:
+                        self.filter.add(jti)
+
+                self.synced_until = now
+                self.recent_jtis = self.get_recent_jtis(rows, now)
+
+            self.synced_at = time.monotonic()
+
+    def is_revoked(self, jti):
+        self.sync()
+        self.checks += 1
+
+        if jti not in self.filter:
+            return False
+
+        self.positives += 1
+
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, tokens):
+        """Revokes validated tokens, at once for this process."""
+        RevokedToken.objects.bulk_create(
+            [
+                RevokedToken(
+                    jti=token[jwt_settings.JTI_CLAIM],
+                    expiry=datetime_from_epoch(token["exp"]),
+                )
+                for token in tokens
+            ],
+            ignore_conflicts=True,
+        )
+
+        with self.lock:
+            if self.filter is not None:
+                for token in tokens:
+                    jti = token[jwt_settings.JTI_CLAIM]
+
+                    # The next sync reads the row back, it must not count twice
+                    if jti not in self.recent_jtis:
+                        self.filter.add(jti)
+                        self.recent_jtis.add(jti)
+
+    def get_stats(self):
+        return {
+            "revoked": self.filter.count if self.filter is not None else 0,
+            "checks": self.checks,
+            "positives": self.positives,
+        }
+
+
+revocation_filter = RevocationFilter()
@@ -1,8 +1,16 @@
+import copy
 from pprint import pprint
 
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 
 from core.models import City, District, State, JobType
+from core.revocation import revocation_filter
 
 
 class CitySerializer(serializers.ModelSerializer):
@@ -34,26 +42,190 @@ class JobTypeSerializer(serializers.ModelSerializer):
         fields = ["id", "option"]
 
 
-class ServerErrorSerializer(serializers.Serializer):
-    def __init__(self, *args, **kwargs):
-        super(ServerErrorSerializer, self).__init__(*args, **kwargs)
+class ServerErrorMessages(dict):
+    """
+    Shared by every field of one class. Fields copy the messages into their
+    own dict in __init__, so deep copies of a field can share this one.
+    """
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+server_error_messages = {}
+
+
+def get_server_error_messages(field_class, keys=()):
+    """
+    Error messages of field_class that are their own key prefixed with
+    "server_", e.g. {"required": "server_required"}, computed once per field
+    class and set of extra keys.
+    """
+    cache_key = (field_class, frozenset(keys))
+
+    if cache_key not in server_error_messages:
+        messages = {}
+
+        for klass in reversed(field_class.__mro__):
+            messages.update(getattr(klass, "default_error_messages", {}))
+
+        server_error_messages[cache_key] = ServerErrorMessages(
+            (key, "server_" + key) for key in [*messages, *keys]
+        )
+
+    return server_error_messages[cache_key]
+
+
+class ServerErrorMessagesMixin:
+    """
+    Fields fail with "server_" prefixed error keys instead of DRF's messages.
+
+    The messages are passed to the fields as error_messages when the
+    serializer class is created, so the validators a field builds from them,
+    like max_length, report them too. Instances pay nothing extra, the
+    declared fields they copy already carry the messages.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        cls._declared_fields = {
+            name: cls.with_server_error_messages(field)
+            for name, field in cls._declared_fields.items()
+        }
+
+    @staticmethod
+    def with_server_error_messages(field):
+        # Fields deep copy by calling their class again with the original
+        # arguments, so the messages go into those arguments
+        template = copy.copy(field)
+        template._kwargs = dict(field._kwargs)
+        template._kwargs["error_messages"] = get_server_error_messages(
+            type(field), field._kwargs.get("error_messages", ())
+        )
+
+        return copy.deepcopy(template)
 
-        for item in self.fields:
-            for error_key in self.fields[item].error_messages:
-                self.fields[item].error_messages[error_key] = "server_" + error_key
 
+class ServerErrorSerializer(ServerErrorMessagesMixin, serializers.Serializer):
+    pass
 
-class ServerErrorModelSerializer(serializers.ModelSerializer):
+
+class ServerErrorModelSerializer(ServerErrorMessagesMixin, serializers.ModelSerializer):
     """
-    TODO: Need to fix and use everywhere
-    Not working for ModelSerializer
-    When instantiated, errors get updated.
-    But when the errors are returned to user, they are the default error messages.
+    Also prefixes the messages of the fields built from the model.
+
+    Those fields only depend on the class, so they are built once per class
+    and every instance gets a deep copy, the way declared fields are copied.
     """
 
-    def __init__(self, *args, **kwargs):
-        super(ServerErrorModelSerializer, self).__init__(*args, **kwargs)
+    field_templates = {}
+
+    def get_fields(self):
+        serializer_class = type(self)
+
+        if serializer_class not in self.field_templates:
+            self.field_templates[serializer_class] = super().get_fields()
+
+        return copy.deepcopy(self.field_templates[serializer_class])
+
+    def build_field(self, *args, **kwargs):
+        field_class, field_kwargs = super().build_field(*args, **kwargs)
+
+        field_kwargs["error_messages"] = get_server_error_messages(
+            field_class, field_kwargs.get("error_messages", ())
+        )
+
+        return field_class, field_kwargs
+
+
+class ExpandableFieldsMixin:
+    """
+    Prunes the serializer with the `fields` and `expand` query params.
+
+    Meta.expandable_fields maps each nested field to the queryset method and
+    lookup that loads it, e.g. {"owners": ("prefetch_related", "owners")}.
+    A nested field that is not expanded is rendered as its primary key when
+    it is a foreign key on the model, otherwise it is dropped.
+
+    ?fields=id,name             only id and name, nothing is joined
+    ?expand=owners              all plain fields, only owners embedded
+    ?fields=id,name&expand=owners
+    """
+
+    @staticmethod
+    def get_query_param_set(request, name):
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+
+        value = request.query_params.get(name)
+
+        if value is None:
+            return None
+
+        return {item.strip() for item in value.split(",") if item.strip()}
+
+    @classmethod
+    def get_expanded_fields(cls, request):
+        expandable_fields = set(getattr(cls.Meta, "expandable_fields", {}))
+
+        expand = cls.get_query_param_set(request, "expand")
+
+        if expand is None:
+            expand = cls.get_query_param_set(request, "fields")
+
+        if expand is None:
+            return expandable_fields
+
+        return expandable_fields & expand
+
+    @classmethod
+    def prune_queryset(cls, queryset, request):
+        expandable_fields = getattr(cls.Meta, "expandable_fields", {})
+
+        for field_name in cls.get_expanded_fields(request):
+            method, lookup = expandable_fields[field_name]
+            queryset = getattr(queryset, method)(lookup)
+
+        return queryset
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        request = self.context.get("request")
+        requested_fields = self.get_query_param_set(request, "fields")
+        expanded_fields = self.get_expanded_fields(request)
+        expandable_fields = getattr(self.Meta, "expandable_fields", {})
+
+        for field_name in list(fields):
+            if (
+                requested_fields is not None
+                and field_name not in requested_fields
+                and field_name not in expanded_fields
+            ):
+                fields.pop(field_name)
+                continue
+
+            if field_name in expandable_fields and field_name not in expanded_fields:
+                model_field = self.Meta.model._meta.get_field(field_name)
+
+                if model_field.many_to_one:
+                    fields[field_name] = serializers.PrimaryKeyRelatedField(
+                        read_only=True
+                    )
+                else:
+                    fields.pop(field_name)
+
+        return fields
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """Refuses refresh tokens revoked by a logout."""
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+
+        if revocation_filter.is_revoked(refresh[jwt_settings.JTI_CLAIM]):
+            raise InvalidToken("server_token_revoked")
 
-        for item in self.fields:
-            for error_key in self.fields[item].error_messages:
-                self.fields[item].error_messages[error_key] = "server_" + error_key
+        return super().validate(attrs)
@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.geography import geography_index
+from core.models import City, District, Pincode, State
+
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+@receiver(post_save, sender=Pincode)
+@receiver(post_delete, sender=Pincode)
+def invalidate_geography_index(sender, **kwargs):
+    transaction.on_commit(geography_index.invalidate)
@@ -1,3 +1,565 @@
-from django.test import TestCase
+import datetime
+import decimal
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.authentication import TokenValidationCache
+from core.constants import GEOGRAPHY_TREE_RELOAD_SECONDS, OUTBOX_MAX_ATTEMPTS
+from core.geography import GeographySnapshot, geography_index
+from core.management.commands.benchmark_startup import (
+    Command as BenchmarkStartupCommand,
+)
+from core.management.commands.load_geography import Command as LoadGeographyCommand
+from core.models import City, District, OutboxMessage, Pincode, State
+from core.outbox import (
+    LocalMemoryProvider,
+    OutboxDeliveryError,
+    OutboxRejectedError,
+    SendGridEmailProvider,
+)
+from core.parsers import FastJSONParser
+from core.renderers import ColumnarJSONRenderer, FastJSONRenderer
+from core.response_cache import SQLiteResponseStore
+from core.revocation import RevocationFilter
+from core.serializers import ServerErrorModelSerializer
+from core.utils import OutboxUtil
+
+
+class FailingProvider:
+    max_batch_size = 1000
+
+    def send(self, template, messages):
+        raise OutboxDeliveryError("provider down")
+
+
+class RejectingProvider(LocalMemoryProvider):
+    """Refuses any batch with an invalid recipient, like a SendGrid 400."""
+
+    calls = 0
+
+    def send(self, template, messages):
+        RejectingProvider.calls += 1
+
+        if any(message.recipient.startswith("invalid") for message in messages):
+            raise OutboxRejectedError("SendGrid answered 400")
+
+        super().send(template, messages)
+
+
+@override_settings(
+    OUTBOX_PROVIDERS={
+        "email": "core.outbox.LocalMemoryProvider",
+        "sms": "core.outbox.LocalMemoryProvider",
+    }
+)
+class OutboxDispatchTests(TestCase):
+    def setUp(self):
+        LocalMemoryProvider.outbox = []
+
+    def test_dispatch_sends_due_messages(self):
+        OutboxUtil.enqueue("email", "one@example.com", "d-1", {"verify_url": "u1"})
+        OutboxUtil.enqueue("email", "two@example.com", "d-1", {"verify_url": "u2"})
+        OutboxUtil.enqueue("sms", 9876543210, "mobile_token", {"token": "123456"})
+
+        sent, retried, failed = OutboxUtil.dispatch(OutboxUtil.claim_due())
+
+        self.assertEqual((sent, retried, failed), (3, 0, 0))
+        self.assertEqual(len(LocalMemoryProvider.outbox), 3)
+        self.assertFalse(OutboxMessage.objects.exclude(status="sent").exists())
+        self.assertEqual(OutboxUtil.claim_due(), [])
+
+    def test_rolled_back_message_is_never_sent(self):
+        try:
+            with transaction.atomic():
+                OutboxUtil.enqueue("email", "one@example.com", "d-1", {})
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(OutboxUtil.claim_due(), [])
+
+    @override_settings(OUTBOX_PROVIDERS={"email": "core.tests.FailingProvider"})
+    def test_failed_send_backs_off_then_gives_up(self):
+        message = OutboxUtil.enqueue("email", "one@example.com", "d-1", {})
+
+        self.assertEqual(OutboxUtil.dispatch(OutboxUtil.claim_due()), (0, 1, 0))
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, "pending")
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+
+        OutboxMessage.objects.filter(id=message.id).update(
+            attempts=OUTBOX_MAX_ATTEMPTS - 1, next_attempt_at=timezone.now()
+        )
+
+        self.assertEqual(OutboxUtil.dispatch(OutboxUtil.claim_due()), (0, 0, 1))
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, "failed")
+
+    @override_settings(OUTBOX_PROVIDERS={"email": "core.tests.RejectingProvider"})
+    def test_rejected_batch_fails_only_the_bad_message(self):
+        RejectingProvider.calls = 0
+
+        for index in range(16):
+            recipient = "invalid" if index == 5 else f"user{index}@example.com"
+            OutboxUtil.enqueue("email", recipient, "d-1", {})
+
+        self.assertEqual(OutboxUtil.dispatch(OutboxUtil.claim_due()), (15, 0, 1))
+        self.assertEqual(RejectingProvider.calls, 9)
+        self.assertEqual(len(LocalMemoryProvider.outbox), 15)
+
+        message = OutboxMessage.objects.get(recipient="invalid")
+        self.assertEqual((message.status, message.attempts), ("failed", 1))
+
+    def test_sendgrid_client_errors_are_not_retried(self):
+        class Pool:
+            def request(self, *args, **kwargs):
+                return mock.Mock(status=self.status, data=b"{}")
+
+        provider = SendGridEmailProvider()
+        provider.pool = Pool()
+        message = OutboxUtil.build("email", "one@example.com", "d-1", {})
+
+        for status, error_class in [
+            (400, OutboxRejectedError),
+            (429, OutboxDeliveryError),
+            (503, OutboxDeliveryError),
+        ]:
+            provider.pool.status = status
+
+            with self.assertRaises(error_class) as context:
+                provider.send("d-1", [message])
+
+            self.assertEqual(context.exception.retryable, status != 400)
+
+
+class TokenValidationCacheTests(TestCase):
+    def test_entries_expire_at_exp(self):
+        cache = TokenValidationCache(10)
+        cache.set(b"key", "token", expires_at=100)
+
+        self.assertEqual(cache.get(b"key", now=99), "token")
+        self.assertIsNone(cache.get(b"key", now=100))
+        self.assertEqual(cache.get_stats()["expirations"], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TokenValidationCache(2)
+        cache.set(b"one", 1, expires_at=100)
+        cache.set(b"two", 2, expires_at=100)
+        cache.get(b"one", now=0)
+        cache.set(b"three", 3, expires_at=100)
+
+        self.assertIsNone(cache.get(b"two", now=0))
+        self.assertEqual(cache.get(b"one", now=0), 1)
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+
+
+class RevocationFilterTests(TestCase):
+    def test_only_filter_positives_reach_the_database(self):
+        revocation_filter = RevocationFilter()
+        revocation_filter.sync()
+
+        revoked = AccessToken()
+        revocation_filter.revoke([revoked])
+
+        with self.assertNumQueries(0):
+            self.assertFalse(revocation_filter.is_revoked(AccessToken()["jti"]))
+
+        with self.assertNumQueries(1):
+            self.assertTrue(revocation_filter.is_revoked(revoked["jti"]))
+
+    def test_revocations_of_other_workers_arrive_with_the_sync(self):
+        revocation_filter = RevocationFilter()
+        revocation_filter.sync()
+
+        revoked = AccessToken()
+        RevocationFilter().revoke([revoked])
+        self.assertFalse(revocation_filter.is_revoked(revoked["jti"]))
+
+        revocation_filter.synced_at = 0
+        self.assertTrue(revocation_filter.is_revoked(revoked["jti"]))
+
+    def test_overlapping_syncs_count_each_token_once(self):
+        revocation_filter = RevocationFilter()
+        RevocationFilter().revoke([AccessToken()])
+        revocation_filter.sync()
+
+        revocation_filter.revoke([AccessToken()])
+        RevocationFilter().revoke([AccessToken(), AccessToken()])
+
+        # Every sync reads back the rows of the overlap window
+        for _ in range(3):
+            revocation_filter.synced_at = 0
+            revocation_filter.sync()
+
+        self.assertEqual(revocation_filter.get_stats()["revoked"], 4)
+
+        revocation_filter.built_at = 0
+        revocation_filter.synced_at = 0
+        revocation_filter.sync()
+        revocation_filter.synced_at = 0
+        revocation_filter.sync()
+
+        self.assertEqual(revocation_filter.get_stats()["revoked"], 4)
+
+
+class ServerErrorModelSerializerTests(TestCase):
+    class OutboxMessageSerializer(ServerErrorModelSerializer):
+        attempts = serializers.IntegerField(max_value=5)
+
+        class Meta:
+            model = OutboxMessage
+            fields = ["channel", "recipient", "attempts"]
+
+    def test_validator_messages_are_prefixed(self):
+        serializer = self.OutboxMessageSerializer(
+            data={"channel": "fax", "recipient": "x" * 300, "attempts": 6}
+        )
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(
+            serializer.errors,
+            {
+                "channel": ["server_invalid_choice"],
+                "recipient": ["server_max_length"],
+                "attempts": ["server_max_value"],
+            },
+        )
+
+
+class FastJSONTests(TestCase):
+    data = {
+        "token": uuid.UUID("6f1c1a52-6d0e-4a53-9a4d-3c1f7f6f0d2e"),
+        "expiry": datetime.datetime(2026, 10, 19, 13, 5, 7, 123456, timezone.utc),
+        "date": datetime.date(2026, 10, 19),
+        "time": datetime.time(13, 5),
+        "amount": decimal.Decimal("12.50"),
+        "label": gettext_lazy("Headquarters"),
+        "text": "Mumbai \u2028 मुंबई \u2029 \x00",
+        "rows": [{1: None, "nested": (1.5, True)}, {"a", "a"}],
+    }
+
+    def test_renders_like_json_renderer(self):
+        for media_type in [None, "application/json; indent=4"]:
+            self.assertEqual(
+                FastJSONRenderer().render(self.data, media_type),
+                JSONRenderer().render(self.data, media_type),
+            )
+
+        # Beyond 64 bits for orjson
+        self.assertEqual(
+            FastJSONRenderer().render({"big": 2**70}),
+            JSONRenderer().render({"big": 2**70}),
+        )
+
+        with mock.patch("core.renderers.orjson", None):
+            self.assertEqual(
+                FastJSONRenderer().render(self.data), JSONRenderer().render(self.data)
+            )
+
+    def test_parses_like_json_parser(self):
+        body = JSONRenderer().render(self.data)
+
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(body)),
+            JSONParser().parse(io.BytesIO(body)),
+        )
+
+        for body in [b'{"a": NaN}', b"{", b""]:
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body))
+
+
+class ColumnarJSONRendererTests(TestCase):
+    rows = [{"id": 1, "name": "A", "tags": [1]}, {"id": 2, "name": "B", "tags": []}]
+
+    def render(self, data):
+        return json.loads(ColumnarJSONRenderer().render(data))
+
+    def test_renders_rows_as_columns(self):
+        columns = {"id": [1, 2], "name": ["A", "B"], "tags": [[1], []]}
+
+        self.assertEqual(self.render(self.rows), columns)
+        self.assertEqual(
+            self.render({"current_page": 1, "results": self.rows}),
+            {"current_page": 1, "results": columns},
+        )
+
+    def test_renders_other_data_as_it_is(self):
+        for data in [[], [{"id": 1}, {"name": "B"}], [1, 2], {"id": 1}]:
+            self.assertEqual(self.render(data), data)
+
+
+class SQLiteResponseStoreTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "responses.sqlite3")
+
+    def test_generations_are_shared_between_stores(self):
+        store, other_store = SQLiteResponseStore(self.path), SQLiteResponseStore(
+            self.path
+        )
+
+        store.set("1:0:contacts:", 1, b"cached", 60)
+        self.assertEqual(other_store.get("1:0:contacts:"), b"cached")
+
+        other_store.bump_generations([1])
+
+        self.assertEqual(store.get_generation(1), 1)
+        self.assertEqual(store.get_generation(2), 0)
+        self.assertIsNone(store.get("1:0:contacts:"))
+
+        store.set("2:0:contacts:", 2, b"expired", -1)
+        self.assertIsNone(store.get("2:0:contacts:"))
+
+    def test_lookups_are_batched(self):
+        store = SQLiteResponseStore(self.path)
+        store.CHUNK_SIZE = 2
+
+        store.bump_generations([1, 3])
+        store.set_many([("1:1:contacts:", 1, b"one"), ("2:0:contacts:", 2, b"two")], 60)
+
+        statements = []
+        store.get_connection().set_trace_callback(statements.append)
+
+        self.assertEqual(store.get_generations([1, 2, 3]), {1: 1, 2: 0, 3: 1})
+        self.assertEqual(
+            store.get_many(["1:1:contacts:", "2:0:contacts:", "3:1:contacts:"]),
+            {"1:1:contacts:": b"one", "2:0:contacts:": b"two"},
+        )
+        # A statement per chunk of ids or keys, not one per business
+        self.assertEqual(len(statements), 4)
+
+
+class GeographyTreeTests(TestCase):
+    def setUp(self):
+        state = State.objects.create(name="State", gst_code=27)
+        district = District.objects.create(name="District", state=state)
+        City.objects.create(name="City", district=district)
+
+        geography_index.invalidate()
+        self.addCleanup(geography_index.invalidate)
+
+    def get_tree(self, version, **headers):
+        return self.client.get(f"/api/states/tree/{version}/", **headers)
+
+    def test_current_version_is_served(self):
+        response = self.client.get("/api/states/tree/")
+        version = response.json()["version"]
+
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertTrue(response.json()["url"].endswith(f"/tree/{version}/"))
+
+        response = self.get_tree(version)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()[0]["districts"][0]["cities"][0]["name"], "City"
+        )
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.get_tree(version, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_version_loaded_by_another_process_is_served(self):
+        old_version = geography_index.get_tree()["version"]
+
+        # No change signal, like a write in another worker process
+        State.objects.create(name="Other state", gst_code=29)
+        version = GeographySnapshot().tree["version"]
+
+        self.assertNotEqual(version, old_version)
+
+        geography_index.snapshot.loaded_at -= GEOGRAPHY_TREE_RELOAD_SECONDS + 1
+        response = self.get_tree(version)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+        self.assertEqual(self.get_tree(old_version).status_code, 404)
+
+    def test_unknown_version_is_not_found(self):
+        geography_index.get_tree()
+
+        with self.assertNumQueries(0):
+            response = self.get_tree("0123456789abcdef")
+
+        self.assertEqual(response.status_code, 404)
+
+
+class LoadGeographyTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "geography.json")
+        self.addCleanup(geography_index.invalidate)
+
+    def load(self, rows):
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(rows, file)
+
+        stdout = io.StringIO()
+        call_command("load_geography", self.path, batch_size=2, stdout=stdout)
+
+        return dict(
+            line.split(": ") for line in stdout.getvalue().splitlines() if ": " in line
+        )
+
+    def test_clean_row(self):
+        command = LoadGeographyCommand()
+        row = {
+            "state": " Maharashtra ",
+            "gst_code": "27",
+            "district": "Mumbai",
+            "city": "Andheri",
+            "pincode": 400053,
+        }
+
+        self.assertEqual(
+            command.clean_row(row),
+            {
+                "state": "Maharashtra",
+                "gst_code": 27,
+                "district": "Mumbai",
+                "city": "Andheri",
+                "pincode": "400053",
+            },
+        )
+
+        for invalid_row in [
+            {**row, "state": ""},
+            {**row, "gst_code": "MH"},
+            {**row, "pincode": "4000"},
+            {**row, "pincode": "40005A"},
+            ["Maharashtra", 27],
+            "Maharashtra",
+            None,
+        ]:
+            self.assertIsNone(command.clean_row(invalid_row), invalid_row)
+
+    def test_rows_are_upserted_by_natural_key(self):
+        rows = [
+            {
+                "state": "Maharashtra",
+                "gst_code": 27,
+                "district": "Mumbai",
+                "city": "Andheri",
+                "pincode": "400053",
+            },
+            {
+                "state": "Karnataka",
+                "gst_code": 29,
+                "district": "Mumbai",
+                "city": "Andheri",
+                "pincode": "560001",
+            },
+            {
+                "state": "maharashtra",
+                "gst_code": 27,
+                "district": "mumbai",
+                "city": "Bandra",
+                "pincode": "400050",
+            },
+            "not an object",
+            {"state": "Goa", "gst_code": "GA"},
+        ]
+
+        stats = self.load(rows)
+
+        self.assertEqual(stats["rows"], "5")
+        self.assertEqual(stats["skipped"], "2")
+        self.assertEqual(stats["districts_created"], "2")
+        self.assertEqual(stats["cities_created"], "3")
+        self.assertEqual(
+            set(
+                Pincode.objects.values_list(
+                    "code", "city__district__state__name", "city__name"
+                )
+            ),
+            {
+                ("400053", "Maharashtra", "Andheri"),
+                ("560001", "Karnataka", "Andheri"),
+                ("400050", "Maharashtra", "Bandra"),
+            },
+        )
+
+        stats = self.load(rows)
+
+        self.assertEqual(stats["states_created"], "0")
+        self.assertEqual(stats["cities_created"], "0")
+        self.assertEqual(stats["pincodes_created"], "0")
+        self.assertEqual(City.objects.count(), 3)
+
+
+class StartupTests(TestCase):
+    def test_views_do_not_import_the_authentication(self):
+        script = (
+            "import sys, django; django.setup(); import crown_backend.urls; "
+            "print('core.authentication' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "crown_backend.settings"},
+            text=True,
+        )
+
+        self.assertEqual(result.stdout.strip(), "False", result.stderr)
+
+    def test_import_times_are_summed_per_package(self):
+        output = "\n".join(
+            [
+                "import time: self [us] | cumulative | imported package",
+                "import time:       120 |        120 |   django.utils",
+                "import time:        80 |        200 | django",
+                "import time:        30 |         30 |     sentry_sdk.hub",
+                "unrelated line",
+            ]
+        )
+
+        self.assertEqual(
+            BenchmarkStartupCommand().get_import_times(output),
+            {"django": 200, "sentry_sdk": 30},
+        )
+
+    def test_max_seconds_fails_slow_startups(self):
+        run = (1.5, 1.2, 200, "import time:  100 |  100 | django")
+        stdout = io.StringIO()
+
+        with mock.patch.object(
+            BenchmarkStartupCommand, "run_interpreter", return_value=run
+        ) as run_interpreter:
+            call_command("benchmark_startup", repeat=2, max_seconds=2, stdout=stdout)
+
+            with self.assertRaisesMessage(CommandError, "above --max-seconds"):
+                call_command(
+                    "benchmark_startup", repeat=2, max_seconds=1, stdout=stdout
+                )
+
+        # The runs of both commands and one -X importtime run each
+        self.assertEqual(run_interpreter.call_count, 6)
+        self.assertIn("Setup to first response: median 1.200s", stdout.getvalue())
+        self.assertIn("django", stdout.getvalue())
@@ -0,0 +1,233 @@
+import abc
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.module_loading import import_string
+
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+def refill_bucket(tokens, updated_at, capacity, refill_rate, now):
+    """Tokens of a bucket last touched at updated_at, as of now."""
+    return min(capacity, tokens + max(0.0, now - updated_at) * refill_rate)
+
+
+def take_token(tokens, capacity, refill_rate):
+    """(allowed, tokens left, seconds until the next token) after one take."""
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+
+    return False, tokens, (1 - tokens) / refill_rate
+
+
+class LocalMemoryBucketStore:
+    """Token buckets of this process only, like the LocMem cache backend."""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.takes = 0
+
+    def take(self, key, capacity, refill_rate):
+        now = time.monotonic()
+
+        with self.lock:
+            tokens, updated_at, full_at = self.buckets.get(key, (capacity, now, now))
+            tokens = refill_bucket(tokens, updated_at, capacity, refill_rate, now)
+
+            allowed, tokens, wait = take_token(tokens, capacity, refill_rate)
+            full_at = now + (capacity - tokens) / refill_rate
+            self.buckets[key] = (tokens, now, full_at)
+
+            self.takes += 1
+
+            if self.takes % self.PRUNE_EVERY == 0:
+                # A full bucket is the same as no bucket
+                self.buckets = {
+                    key: bucket
+                    for key, bucket in self.buckets.items()
+                    if bucket[2] > now
+                }
+
+        return allowed, wait
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets in a SQLite file, shared by every worker process of a
+    host. Each take is one IMMEDIATE transaction, so the read and the write
+    of a bucket never interleave with another process.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path=None):
+        self.path = path or settings.THROTTLE_BUCKET_SQLITE_PATH
+        self.local = threading.local()
+        self.takes = 0
+
+    def get_connection(self):
+        connection = getattr(self.local, "connection", None)
+
+        if connection is None or getattr(self.local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL, updated_at REAL, full_at REAL)"
+            )
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+
+        return connection
+
+    def take(self, key, capacity, refill_rate):
+        connection = self.get_connection()
+        # Wall clock, monotonic clocks are not comparable across processes
+        now = time.time()
+
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE key = ?", [key]
+            ).fetchone()
+
+            tokens, updated_at = row if row is not None else (capacity, now)
+            tokens = refill_bucket(tokens, updated_at, capacity, refill_rate, now)
+
+            allowed, tokens, wait = take_token(tokens, capacity, refill_rate)
+            full_at = now + (capacity - tokens) / refill_rate
+
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)",
+                [key, tokens, now, full_at],
+            )
+
+            self.takes += 1
+
+            if self.takes % self.PRUNE_EVERY == 0:
+                connection.execute("DELETE FROM buckets WHERE full_at < ?", [now])
+
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        return allowed, wait
+
+
+bucket_store = None
+bucket_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    global bucket_store
+
+    if bucket_store is None:
+        with bucket_store_lock:
+            if bucket_store is None:
+                bucket_store = import_string(settings.THROTTLE_BUCKET_STORE)()
+
+    return bucket_store
+
+
+class TokenBucketThrottle(BaseThrottle, metaclass=abc.ABCMeta):
+    """
+    DRF throttle with a token bucket per scope, view action and identity.
+    The rate comes from REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"][scope],
+    "10/min" is a bucket of 10 tokens refilled at 10 per minute.
+
+    It only reads the request, so throttled requests never reach the
+    database or the password hasher.
+    """
+
+    scope = None
+
+    def __init__(self, scope=None):
+        self.scope = scope or self.scope
+        self.capacity, self.refill_rate = self.parse_rate(
+            api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        )
+        self.wait_seconds = None
+
+    @staticmethod
+    def parse_rate(rate):
+        count, period = rate.split("/")
+        seconds = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+
+        return int(count), int(count) / seconds
+
+    @abc.abstractmethod
+    def get_ident_value(self, request):
+        """The identity the bucket belongs to, a falsy one is not throttled."""
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_value(request)
+
+        if not ident:
+            return True
+
+        key = f"throttle:{self.scope}:{getattr(view, 'action', '')}:{ident}"
+        allowed, self.wait_seconds = get_bucket_store().take(
+            key, self.capacity, self.refill_rate
+        )
+
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ServerThrottledMixin:
+    """For views throttled with these classes, answers server_throttled."""
+
+    def throttled(self, request, wait):
+        exception = Throttled(detail="server_throttled")
+        exception.wait = wait
+        raise exception
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    scope = "auth_ip"
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+
+class EmailTokenBucketThrottle(TokenBucketThrottle):
+    scope = "auth_email"
+
+    def get_ident_value(self, request):
+        email = request.data.get("email") if hasattr(request.data, "get") else None
+        return get_user_model().objects.normalize_email(email)
+
+
+class LoginTokenBucketThrottle(EmailTokenBucketThrottle):
+    """
+    Password attempts on an email from one address. Attempts from other
+    addresses go to other buckets, so nobody can lock the owner of an email
+    out, IPTokenBucketThrottle bounds what one address tries overall.
+    """
+
+    scope = "auth_login"
+
+    def get_ident_value(self, request):
+        email = super().get_ident_value(request)
+        return f"{email}:{self.get_ident(request)}" if email else None
+
+
+class MobileTokenBucketThrottle(TokenBucketThrottle):
+    scope = "auth_mobile"
+
+    def get_ident_value(self, request):
+        mobile = request.data.get("mobile") if hasattr(request.data, "get") else None
+        return str(mobile or "").strip()
@@ -1,7 +1,12 @@
+import random
+from collections import defaultdict
 from pprint import pprint
 from datetime import timedelta
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Max
 from django.utils import timezone
 
 from django.core.paginator import Paginator
@@ -11,12 +16,15 @@ from rest_framework import pagination
 from rest_framework.response import Response
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 
-from rest_framework_simplejwt.authentication import JWTTokenUserAuthentication
-
-from sendgrid.sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-
-from sentry_sdk import capture_exception
+from core.constants import (
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_BASE_SECONDS,
+    OUTBOX_RETRY_MAX_SECONDS,
+)
+from core.models import OutboxMessage
+from core.outbox import OutboxRejectedError, get_provider
 
 
 class CurrentPagePagination(pagination.PageNumberPagination):
@@ -38,8 +46,12 @@ class CurrentPagePagination(pagination.PageNumberPagination):
 class CommonUtil:
     @staticmethod
     def get_authentication_classes():
+        # Imported here, management commands that use the other utils
+        # should not load simplejwt
+        from core.authentication import CachedJWTTokenUserAuthentication
+
         authentication_classes = [
-            JWTTokenUserAuthentication,
+            CachedJWTTokenUserAuthentication,
         ]
 
         if settings.ENVIRONMENT != "production":
@@ -49,9 +61,172 @@ class CommonUtil:
         return authentication_classes
 
 
+class CommonAuthenticationMixin:
+    """
+    Authenticates with CommonUtil.get_authentication_classes(), resolved on
+    the first request rather than when the view module is imported.
+    """
+
+    def get_authenticators(self):
+        return [
+            authentication()
+            for authentication in CommonUtil.get_authentication_classes()
+        ]
+
+
+class OutboxUtil:
+    @staticmethod
+    def build(channel, recipient, template, data):
+        return OutboxMessage(
+            channel=channel,
+            recipient=str(recipient),
+            template=template,
+            data=data,
+        )
+
+    @staticmethod
+    def enqueue(channel, recipient, template, data):
+        """
+        Saves the message for dispatch_outbox. Call it inside the transaction
+        that saves what the message is about, then it is sent only if that
+        commits.
+        """
+        message = OutboxUtil.build(channel, recipient, template, data)
+        message.save()
+
+        return message
+
+    @staticmethod
+    def bulk_enqueue(messages):
+        return OutboxMessage.objects.bulk_create(messages, batch_size=500)
+
+    @staticmethod
+    def get_retry_delay(attempts):
+        seconds = min(
+            OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        )
+
+        # Jitter keeps the retries of one failed batch from landing together
+        return timedelta(seconds=seconds * random.uniform(0.5, 1))
+
+    @staticmethod
+    def claim_due(batch_size=OUTBOX_BATCH_SIZE):
+        """
+        Due pending messages, hidden from other dispatchers for the lease.
+        Backends with SKIP LOCKED let concurrent dispatchers take disjoint
+        batches, on SQLite run a single dispatcher.
+        """
+        now = timezone.now()
+
+        with transaction.atomic():
+            ids = list(
+                OutboxMessage.objects.select_for_update(skip_locked=True)
+                .filter(status="pending", next_attempt_at__lte=now)
+                .order_by("next_attempt_at", "id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+
+            OutboxMessage.objects.filter(id__in=ids).update(
+                next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+            )
+
+        return list(OutboxMessage.objects.filter(id__in=ids).order_by("id"))
+
+    @staticmethod
+    def dispatch(messages):
+        """
+        Sends messages grouped by channel and template, one provider call per
+        group. Returns the number of messages sent, retried and given up.
+        """
+        groups = defaultdict(list)
+
+        for message in messages:
+            groups[(message.channel, message.template)].append(message)
+
+        sent = retried = failed = 0
+
+        for (channel, template), group in groups.items():
+            provider = get_provider(channel)
+
+            for start in range(0, len(group), provider.max_batch_size):
+                batch = group[start : start + provider.max_batch_size]
+
+                batch_sent, batch_retried, batch_failed = OutboxUtil.send_batch(
+                    provider, template, batch
+                )
+                sent += batch_sent
+                retried += batch_retried
+                failed += batch_failed
+
+        return sent, retried, failed
+
+    @staticmethod
+    def send_batch(provider, template, batch):
+        """
+        One provider call for batch. A rejected batch is sent again in
+        halves, so only the messages at fault fail, after about
+        2 * log2(len(batch)) more calls per bad message.
+        """
+        try:
+            provider.send(template, batch)
+        except OutboxRejectedError as error:
+            if len(batch) == 1:
+                return (0, *OutboxUtil.mark_failed(batch, error))
+
+            middle = len(batch) // 2
+            halves = [
+                OutboxUtil.send_batch(provider, template, half)
+                for half in [batch[:middle], batch[middle:]]
+            ]
+
+            return tuple(map(sum, zip(*halves)))
+        except Exception as error:
+            return (0, *OutboxUtil.mark_failed(batch, error))
+
+        OutboxMessage.objects.filter(id__in=[message.id for message in batch]).update(
+            status="sent",
+            sent_at=timezone.now(),
+            attempts=F("attempts") + 1,
+            last_error="",
+        )
+
+        return len(batch), 0, 0
+
+    @staticmethod
+    def mark_failed(messages, error):
+        """Backs messages off for a retry, or fails them when that is futile."""
+        now = timezone.now()
+        retryable = getattr(error, "retryable", True)
+        failed = 0
+
+        for message in messages:
+            message.attempts += 1
+            message.last_error = repr(error)[:1000]
+
+            if message.attempts >= OUTBOX_MAX_ATTEMPTS or not retryable:
+                message.status = "failed"
+                failed += 1
+            else:
+                message.next_attempt_at = now + OutboxUtil.get_retry_delay(
+                    message.attempts
+                )
+
+        if failed:
+            from sentry_sdk import capture_exception
+
+            # log to sentry, once per batch that gave up on messages
+            capture_exception(error)
+
+        OutboxMessage.objects.bulk_update(
+            messages, ["attempts", "last_error", "status", "next_attempt_at"]
+        )
+
+        return len(messages) - failed, failed
+
+
 class EmailUtil:
     @staticmethod
-    def send_signup_email(instance, verification_token):
+    def queue_signup_email(instance, verification_token):
 
         verify_url = settings.DOMAIN_NAME + "/#/signup/verify?"
 
@@ -63,26 +238,16 @@ class EmailUtil:
             + str(verification_token.token)
         )
 
-        message = Mail(
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to_emails=instance.email,
-        )
-
-        message.dynamic_template_data = {"verify_url": verify_url}
-
         # NOTE: DYNAMIC TEMPLATE ID OF THE TEMPLATE IN THE SENDGRID ACCOUNT for Sign Up email
-        message.template_id = settings.SENDGRID_TEMPLATE_ID_LABORATORY_SIGNUP_EMAIL
-
-        try:
-            sendgrid_client = SendGridAPIClient(settings.SENDGRID_API_KEY)
-            response = sendgrid_client.send(message)
-
-        except Exception as error:
-            # log to sentry
-            capture_exception(error)
+        return OutboxUtil.enqueue(
+            "email",
+            instance.email,
+            settings.SENDGRID_TEMPLATE_ID_LABORATORY_SIGNUP_EMAIL,
+            {"verify_url": verify_url},
+        )
 
     @staticmethod
-    def send_request_password_reset_email(instance, verification_token):
+    def queue_request_password_reset_email(instance, verification_token):
 
         verify_url = settings.DOMAIN_NAME + "/#/password/reset?"
 
@@ -94,26 +259,92 @@ class EmailUtil:
             + str(verification_token.token)
         )
 
-        message = Mail(
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to_emails=instance.email,
+        # NOTE: DYNAMIC TEMPLATE ID OF THE TEMPLATE IN THE RESET PASSWORD email
+        return OutboxUtil.enqueue(
+            "email",
+            instance.email,
+            settings.SENDGRID_TEMPLATE_ID_REQUEST_PASSWORD_RESET_EMAIL,
+            {"verify_url": verify_url},
         )
 
-        message.dynamic_template_data = {"verify_url": verify_url}
+    @staticmethod
+    def build_employee_invite_email(instance, invite_token, business):
+        """Unsaved outbox message, for OutboxUtil.bulk_enqueue."""
 
-        # NOTE: DYNAMIC TEMPLATE ID OF THE TEMPLATE IN THE RESET PASSWORD email
-        message.template_id = settings.SENDGRID_TEMPLATE_ID_REQUEST_PASSWORD_RESET_EMAIL
+        if not settings.SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL:
+            # Any other template would reach the employee without the accept link
+            raise ImproperlyConfigured(
+                "SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL is not set"
+            )
 
-        try:
-            sendgrid_client = SendGridAPIClient(settings.SENDGRID_API_KEY)
-            response = sendgrid_client.send(message)
+        accept_url = settings.DOMAIN_NAME + "/#/invitation/accept?"
 
-        except Exception as error:
-            # log to sentry
-            capture_exception(error)
+        accept_url += (
+            "email=" + str(instance.email) + "&" + "token=" + str(invite_token.token)
+        )
+
+        return OutboxUtil.build(
+            "email",
+            instance.email,
+            settings.SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL,
+            {
+                "accept_url": accept_url,
+                "first_name": instance.first_name,
+                "business_name": business.name,
+            },
+        )
+
+
+class SmsUtil:
+    @staticmethod
+    def queue_mobile_token_sms(mobile_token):
+        return OutboxUtil.enqueue(
+            "sms", mobile_token.mobile, "mobile_token", {"token": mobile_token.token}
+        )
 
 
 class TimeUtil:
     @staticmethod
     def get_minutes_from_now(MINUTES):
         return timezone.now() + timedelta(minutes=MINUTES)
+
+
+class BulkUtil:
+    @staticmethod
+    def bulk_create_with_ids(model, objects, batch_size=None):
+        """
+        bulk_create that sets the primary key on every object, also on
+        backends that do not return ids from a bulk insert (SQLite).
+
+        There the rows are read back by id range inside one transaction. The
+        transaction keeps other writers from interleaving ids, the count check
+        turns a violated assumption into an error instead of wrong ids.
+        """
+        objects = list(objects)
+
+        if not objects:
+            return objects
+
+        if connection.features.can_return_rows_from_bulk_insert:
+            return model.objects.bulk_create(objects, batch_size=batch_size)
+
+        with transaction.atomic():
+            last_id = model.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+            model.objects.bulk_create(objects, batch_size=batch_size)
+
+            ids = list(
+                model.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+
+            if len(ids) != len(objects):
+                raise IntegrityError(
+                    f"Expected {len(objects)} new {model.__name__} rows, "
+                    f"found {len(ids)}."
+                )
+
+        for instance, pk in zip(objects, ids):
+            instance.pk = pk
+
+        return objects
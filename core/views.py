@@ -1,9 +1,31 @@
+from django.http import HttpResponse, HttpResponseNotModified
 from django.shortcuts import render
 
-from rest_framework import viewsets
+from rest_framework import serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
 
+from rest_framework_simplejwt import views as jwt_views
+
+from core.constants import (
+    GEOGRAPHY_DISTRICTS_MAX_AGE,
+    GEOGRAPHY_TREE_MAX_AGE,
+    PINCODE_SEARCH_LIMIT,
+)
+from core.geography import geography_index
 from core.models import State, JobType
-from core.serializers import StateSerializer, JobTypeSerializer
+from core.serializers import (
+    JobTypeSerializer,
+    StateSerializer,
+    TokenRefreshSerializer,
+)
+from core.throttling import (
+    IPTokenBucketThrottle,
+    LoginTokenBucketThrottle,
+    ServerThrottledMixin,
+)
 
 
 class StateViewset(viewsets.ReadOnlyModelViewSet):
@@ -11,9 +33,96 @@ class StateViewset(viewsets.ReadOnlyModelViewSet):
     serializer_class = StateSerializer
 
     def get_queryset(self):
-        queryset = State.objects.all()
+        queryset = State.objects.all().prefetch_related("districts__cities")
         return queryset
 
+    def get_tree_url(self, request, version):
+        return reverse(
+            "states-versioned-tree", kwargs={"version": version}, request=request
+        )
+
+    @action(detail=False, methods=["get"])
+    def tree(self, request, *args, **kwargs):
+        version = geography_index.get_tree()["version"]
+
+        data = {"version": version, "url": self.get_tree_url(request, version)}
+
+        response = Response(data)
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path=r"tree/(?P<version>[0-9a-f]+)",
+        url_name="versioned-tree",
+    )
+    def versioned_tree(self, request, version, *args, **kwargs):
+        """
+        The tree at the URL given by tree. Versions are digests of the data,
+        so every process serves the same ones, an outdated version is a 404.
+        """
+        tree = geography_index.get_tree(version)
+
+        if tree is None:
+            raise NotFound()
+
+        etag = f'"{tree["version"]}"'
+
+        if request.META.get("HTTP_IF_NONE_MATCH") == etag:
+            response = HttpResponseNotModified()
+
+        elif "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+            response = HttpResponse(
+                tree["gzip_content"], content_type="application/json"
+            )
+            response["Content-Encoding"] = "gzip"
+
+        else:
+            response = HttpResponse(tree["content"], content_type="application/json")
+
+        response["ETag"] = etag
+        response["Vary"] = "Accept-Encoding"
+        response[
+            "Cache-Control"
+        ] = f"public, max-age={GEOGRAPHY_TREE_MAX_AGE}, immutable"
+        return response
+
+    @action(detail=True, methods=["get"])
+    def districts(self, request, pk=None, *args, **kwargs):
+        if not str(pk).isnumeric():
+            raise NotFound()
+
+        districts = geography_index.get_state_districts(int(pk))
+
+        if districts is None:
+            raise NotFound()
+
+        response = Response(districts)
+        response["Cache-Control"] = f"public, max-age={GEOGRAPHY_DISTRICTS_MAX_AGE}"
+        return response
+
+
+class PincodeViewset(viewsets.ViewSet):
+    """
+    Address autocomplete: ?search=<partial or full pincode> returns the
+    matching places with their city, district and state ids, from the
+    in-memory geography index.
+    """
+
+    def list(self, request, *args, **kwargs):
+        search = request.query_params.get("search", "").strip()
+
+        if not search.isnumeric() or len(search) > 6:
+            message = {"search": "server_invalid"}
+            raise serializers.ValidationError(message)
+
+        places = geography_index.search_pincodes(search, PINCODE_SEARCH_LIMIT)
+
+        response = Response(places)
+        response["Cache-Control"] = f"public, max-age={GEOGRAPHY_DISTRICTS_MAX_AGE}"
+        return response
+
 
 class JobTypeViewset(viewsets.ReadOnlyModelViewSet):
 
@@ -22,3 +131,15 @@ class JobTypeViewset(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         queryset = JobType.objects.all()
         return queryset
+
+
+class TokenRefreshView(jwt_views.TokenRefreshView):
+    serializer_class = TokenRefreshSerializer
+
+
+class TokenObtainPairView(ServerThrottledMixin, jwt_views.TokenObtainPairView):
+    """Checks passwords like EmailUserViewset.login, so it shares its buckets."""
+
+    throttle_classes = [IPTokenBucketThrottle, LoginTokenBucketThrottle]
+    # The action is part of the bucket key, alternating with login gains nothing
+    action = "login"
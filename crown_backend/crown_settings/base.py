@@ -109,6 +109,18 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# New passwords are hashed with the first hasher, a login with a hash from
+# any other one (or with fewer iterations) rehashes the password to it.
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+]
+
+# Threads hashing passwords for logins, caps the CPU they take at once
+PASSWORD_HASHING_WORKERS = os.cpu_count() or 1
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
@@ -135,6 +147,42 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media-root")
 AUTH_USER_MODEL = "users.EmailUser"
 
 
+REST_FRAMEWORK = {
+    # The DRF defaults, with the JSON ones encoding and decoding through orjson
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    # Token buckets of core.throttling, "10/min" is 10 requests at once and
+    # 10 more every minute
+    "DEFAULT_THROTTLE_RATES": {
+        "auth_ip": "60/min",
+        "auth_login": "10/hour",
+        "auth_email": "10/hour",
+        "auth_mobile": "5/hour",
+    },
+    # Client addresses of the throttles come from REMOTE_ADDR, a client can
+    # send any X-Forwarded-For. Behind N reverse proxies that set it, use N.
+    "NUM_PROXIES": 0,
+}
+
+# LocalMemoryBucketStore counts per process, SQLiteBucketStore shares the
+# counts between the worker processes of one host.
+THROTTLE_BUCKET_STORE = "core.throttling.LocalMemoryBucketStore"
+THROTTLE_BUCKET_SQLITE_PATH = os.path.join(BASE_DIR, "throttle-buckets.sqlite3")
+
+# Per business list responses and connections of core.response_cache.
+# LocalMemoryResponseStore suits a single process, with several worker
+# processes SQLiteResponseStore lets a write in one of them invalidate the
+# cached data of all.
+RESPONSE_CACHE_STORE = "core.response_cache.LocalMemoryResponseStore"
+RESPONSE_CACHE_SQLITE_PATH = os.path.join(BASE_DIR, "response-cache.sqlite3")
+
 SIMPLE_JWT = {
     # "ACCESS_TOKEN_LIFETIME": timedelta(hours=1),  # for production
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),  # for testing
@@ -145,5 +193,14 @@ DEFAULT_FROM_EMAIL = "rockstar.ryucoder@gmail.com"
 
 SENDGRID_TEMPLATE_ID_LABORATORY_SIGNUP_EMAIL = "d-8580bdbb342f4d0dafbd6e9ae46399f3"
 SENDGRID_TEMPLATE_ID_REQUEST_PASSWORD_RESET_EMAIL = "d-8580bdbb342f4d0dafbd6e9ae46399f3"
+# The account has no invite template yet, the env settings read its id from
+# SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL. Inviting fails until it is set.
+SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL = None
+
+# Delivery of core.models.OutboxMessage rows per channel, see core.outbox
+OUTBOX_PROVIDERS = {
+    "email": "core.outbox.SendGridEmailProvider",
+    "sms": "core.outbox.LoggingProvider",
+}
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -4,7 +4,7 @@ from crown_backend.crown_settings.base import *
 
 import environ
 
-environ.Env.read_env("env/local")
+environ.Env.read_env(os.path.join(BASE_DIR, "env", "local"))
 env = environ.Env()
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -40,3 +40,7 @@ DATABASES = {
 SENDGRID_API_KEY = env("SENDGRID_API_KEY")
 
 DOMAIN_NAME = env("DOMAIN_NAME")
+
+SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL = env(
+    "SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL", default=None
+)
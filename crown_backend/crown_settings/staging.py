@@ -4,7 +4,7 @@ from crown_backend.crown_settings.base import *
 
 import environ
 
-environ.Env.read_env("env/staging")
+environ.Env.read_env(os.path.join(BASE_DIR, "env", "staging"))
 env = environ.Env()
 
 
@@ -31,3 +31,7 @@ DATABASES = {
         "NAME": os.path.join(BASE_DIR, "packfect-staging.sqlite3"),
     }
 }
+
+SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL = env(
+    "SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL", default=None
+)
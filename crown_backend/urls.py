@@ -18,7 +18,6 @@ from django.contrib import admin
 from django.urls import include, path
 
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from businesses.views import (
     BusinessViewset,
@@ -28,12 +27,19 @@ from businesses.views import (
     OrderViewset,
 )
 
-from core.views import JobTypeViewset, StateViewset
+from core.views import (
+    JobTypeViewset,
+    PincodeViewset,
+    StateViewset,
+    TokenObtainPairView,
+    TokenRefreshView,
+)
 
 from users.views import EmailUserViewset, RegisteredEmailUserViewset
 
 default_router = DefaultRouter()
 default_router.register(r"api/states", StateViewset, basename="states")
+default_router.register(r"api/pincodes", PincodeViewset, basename="pincodes")
 default_router.register(r"api/job-types", JobTypeViewset, basename="job-type")
 default_router.register(r"api/businesses", BusinessViewset, basename="businesses")
 default_router.register(
@@ -7,15 +7,26 @@ USER_TYPE_CHOICES = [
 EMAIL_TOKEN_CATEGORY_CHOICES = [
     ("signup", "signup"),
     ("reset", "reset"),
+    ("invite", "invite"),
 ]
 
 
 RESET_PASSWORD_TOKEN_EXPIRY_MINUTES = 15
 MOBILE_TOKEN_EXPIRY_MINUTES = 15
 SIGNUP_TOKEN_EXPIRY_MINUTES = 15
+INVITE_TOKEN_EXPIRY_MINUTES = 7 * 24 * 60
+
+# Employees invited per request, bounds the IN lists of the existence check
+EMPLOYEE_INVITE_MAX_COUNT = 200
 
 DEFAULT_USER_PASSWORD = "123456789"
 
+EMAIL_TOKEN_SAVE_ATTEMPTS = 3
+
+# Expired and used tokens are kept this long before purge_tokens drops them
+TOKEN_PURGE_GRACE_MINUTES = 24 * 60
+TOKEN_PURGE_CHUNK_SIZE = 1000
+
 CUSTOM_ERROR_MESSAGES = {
     "CharField": {
         "blank": "server_blank",
@@ -38,4 +49,12 @@ CUSTOM_ERROR_MESSAGES = {
         "null": "server_null",
         "invalid": "server_invalid",
     },
+    "IntegerField": {
+        "required": "server_required",
+        "null": "server_null",
+        "invalid": "server_invalid",
+        "max_string_length": "server_max_length",
+        "max_value": "server_max_value",
+        "min_value": "server_min_value",
+    },
 }
@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from core.management.benchmark import BenchmarkCommand
+from core.utils import BulkUtil
+
+from businesses.models import Business, BusinessOwner
+
+from users.models import EmailUser
+
+PASSWORD = "benchmark-password"
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Sends --requests logins from --concurrency threads to the login "
+        "endpoint on a test database, reports queries per login, throughput "
+        "and latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=200)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=50)
+
+    def create_users(self, count):
+        encoded = make_password(PASSWORD)
+
+        users = BulkUtil.bulk_create_with_ids(
+            EmailUser,
+            [
+                EmailUser(
+                    email=f"owner{index}@benchmark.local",
+                    first_name="Owner",
+                    last_name=str(index),
+                    user_type="owner",
+                    password=encoded,
+                )
+                for index in range(count)
+            ],
+        )
+        businesses = BulkUtil.bulk_create_with_ids(
+            Business,
+            [Business(name=f"Benchmark {index}") for index in range(count)],
+        )
+        BusinessOwner.objects.bulk_create(
+            [
+                BusinessOwner(business=business, owner=user)
+                for user, business in zip(users, businesses)
+            ]
+        )
+
+        return [user.email for user in users]
+
+    def run_benchmark(self, *args, **options):
+        # Every login comes from one address, the throttles would cut it short
+        rates = {"auth_ip": "1000000/s", "auth_email": "1000000/s"}
+
+        with override_settings(REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": rates}):
+            self.benchmark_logins(options)
+
+    def benchmark_logins(self, options):
+        emails = self.create_users(options["users"])
+        local = threading.local()
+
+        def login(index):
+            client = getattr(local, "client", None)
+
+            if client is None:
+                client = local.client = Client()
+
+            started_at = time.perf_counter()
+            response = client.post(
+                "/api/users/login/",
+                {"email": emails[index % len(emails)], "password": PASSWORD},
+                content_type="application/json",
+            )
+            duration = time.perf_counter() - started_at
+
+            if "tokens" not in response.json():
+                raise AssertionError(f"Login failed: {response.content[:200]}")
+
+            return duration
+
+        with CaptureQueriesContext(connection) as queries:
+            login(0)
+
+        self.stdout.write(f"Queries per login: {len(queries)}")
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            started_at = time.perf_counter()
+            durations = list(pool.map(login, range(options["requests"])))
+            elapsed = time.perf_counter() - started_at
+
+        self.report(f"login, {options['concurrency']} concurrent", durations, elapsed)
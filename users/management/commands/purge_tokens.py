@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import RevokedToken
+from users.constants import TOKEN_PURGE_CHUNK_SIZE, TOKEN_PURGE_GRACE_MINUTES
+from users.models import EmailToken, MobileToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes email and mobile tokens that expired or were used more than "
+        "--grace-minutes ago, and revoked JWTs that expired that long ago. "
+        "Rows go in chunks of --chunk-size, each its own short DELETE by "
+        "primary key, so no lock is held for long. Meant to run periodically, "
+        "e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-minutes", type=int, default=TOKEN_PURGE_GRACE_MINUTES
+        )
+        parser.add_argument("--chunk-size", type=int, default=TOKEN_PURGE_CHUNK_SIZE)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to pause between chunks",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options["grace_minutes"])
+        stale = Q(expiry__lt=cutoff) | Q(is_used=True, used_time__lt=cutoff)
+
+        querysets = [
+            EmailToken.objects.filter(stale),
+            MobileToken.objects.filter(stale),
+            # An expired JWT is refused anyway, its revocation can go
+            RevokedToken.objects.filter(expiry__lt=cutoff),
+        ]
+
+        for queryset in querysets:
+            model = queryset.model
+
+            if options["dry_run"]:
+                self.stdout.write(f"{model.__name__}: {queryset.count()} to delete")
+                continue
+
+            deleted = self.purge(queryset, options["chunk_size"], options["sleep"])
+            self.stdout.write(f"{model.__name__}: {deleted} deleted")
+
+    def purge(self, queryset, chunk_size, sleep):
+        deleted = 0
+
+        while True:
+            ids = list(
+                queryset.order_by("id").values_list("id", flat=True)[:chunk_size]
+            )
+
+            if not ids:
+                return deleted
+
+            # Nothing references tokens, so this is a single DELETE per chunk
+            deleted += queryset.model.objects.filter(id__in=ids).delete()[0]
+
+            if sleep:
+                time.sleep(sleep)
@@ -6,6 +6,17 @@ class UserManager(BaseUserManager):
 
     use_in_migrations = True
 
+    @classmethod
+    def normalize_email(cls, email):
+        """
+        Emails are stored lowercased, so the unique index on the column also
+        serves case insensitive lookups through a plain email= filter.
+        """
+        return str(email or "").strip().lower()
+
+    def get_by_natural_key(self, username):
+        return self.get(**{self.model.USERNAME_FIELD: self.normalize_email(username)})
+
     def _create_user(self, email, password, **extra_fields):
         """Create and save a User with the given email and password."""
         if not email:
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.4 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailuser',
+            name='mobile',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.4 on 2026-10-19 13:45
+
+from django.db import migrations
+from django.db.models import Count, F
+from django.db.models.functions import Lower
+
+
+def lowercase_emails(apps, schema_editor):
+    EmailUser = apps.get_model('users', 'EmailUser')
+
+    queryset = EmailUser.objects.annotate(email_lower=Lower('email'))
+
+    # Users whose emails only differ in case would break the unique index,
+    # and login only looks up the lowercased email. They have to be merged by
+    # hand before this migration can run.
+    colliding = list(
+        queryset.values('email_lower')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('email_lower', flat=True)
+    )
+
+    if colliding:
+        users = queryset.filter(email_lower__in=colliding).order_by(
+            'email_lower', 'id'
+        )
+        raise RuntimeError(
+            'Merge the users whose emails only differ in case first: '
+            + ', '.join(f'{user.id} {user.email}' for user in users)
+        )
+
+    user_ids = list(
+        queryset.exclude(email=F('email_lower')).values_list('id', flat=True)
+    )
+
+    EmailUser.objects.filter(id__in=user_ids).update(email=Lower('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20261019_1320'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.4 on 2026-10-19 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_lowercase_emails'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailtoken',
+            index=models.Index(fields=['token', 'category'], name='email_token_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailtoken',
+            index=models.Index(fields=['email_user', 'category', 'created_at'], name='email_token_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mobiletoken',
+            index=models.Index(fields=['mobile', 'created_at'], name='mobile_token_latest_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.4 on 2026-10-19 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_auto_20261019_1326'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailtoken',
+            name='category',
+            field=models.CharField(choices=[('signup', 'signup'), ('reset', 'reset'), ('invite', 'invite')], default='signup', max_length=6),
+        ),
+    ]
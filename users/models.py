@@ -30,7 +30,7 @@ class EmailUser(TimeStampedModel, AbstractUser):
     is_email_verified = models.BooleanField(default=False)
     email_verified_time = models.DateTimeField(null=True, blank=True)
 
-    mobile = models.BigIntegerField(default=0)
+    mobile = models.BigIntegerField(default=0, db_index=True)
     is_mobile_verified = models.BooleanField(default=False)
     mobile_verified_time = models.DateTimeField(null=True, blank=True)
 
@@ -63,6 +63,10 @@ class EmailUser(TimeStampedModel, AbstractUser):
 
         return business
 
+    def save(self, *args, **kwargs):
+        self.email = EmailUser.objects.normalize_email(self.email)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.email}"
 
@@ -94,6 +98,13 @@ class EmailToken(TimeStampedModel):
         verbose_name = "Password Token"
         verbose_name_plural = "Password Tokens"
         unique_together = ["email_user", "token"]
+        indexes = [
+            models.Index(fields=["token", "category"], name="email_token_category_idx"),
+            models.Index(
+                fields=["email_user", "category", "created_at"],
+                name="email_token_latest_idx",
+            ),
+        ]
 
 
 class MobileToken(TimeStampedModel):
@@ -114,3 +125,8 @@ class MobileToken(TimeStampedModel):
     class Meta:
         verbose_name = "Mobile Token"
         verbose_name_plural = "Mobile Tokens"
+        indexes = [
+            models.Index(
+                fields=["mobile", "created_at"], name="mobile_token_latest_idx"
+            ),
+        ]
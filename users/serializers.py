@@ -1,26 +1,35 @@
 import uuid
+from collections import Counter
 
 from django.contrib.auth.hashers import make_password
 from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
 from django.utils import timezone
 
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
 from core.serializers import ServerErrorSerializer
-from core.utils import EmailUtil, TimeUtil
+from core.utils import EmailUtil, SmsUtil, TimeUtil
 
 from businesses.models import (
     Business,
     BusinessConnect,
     BusinessEmployee,
+    BusinessOwner,
 )
 from businesses.serializers import BusinessOnlySerializer
+from businesses.utils import ClaimUtil
 
-from users.utils import TokenUtil
+from users.utils import InvitationUtil, PasswordUtil, TokenUtil
 from users.constants import (
     CUSTOM_ERROR_MESSAGES,
     DEFAULT_USER_PASSWORD,
+    EMPLOYEE_INVITE_MAX_COUNT,
     MOBILE_TOKEN_EXPIRY_MINUTES,
     SIGNUP_TOKEN_EXPIRY_MINUTES,
 )
@@ -41,21 +50,13 @@ class LoginSerializer(ServerErrorSerializer):
     )
 
     def validate(self, data):
-        email_absent = False
-        password_matched = False
-
-        email = data["email"].strip().lower()
+        user = self.context["user"]
         password = data["password"].strip()
 
-        try:
-            user = EmailUser.objects.get(email=email)
-        except EmailUser.DoesNotExist:
-            email_absent = True
-
-        if (not email_absent) and user.check_password(password):
-            password_matched = True
+        if user is not None and not user.is_active:
+            user = None
 
-        if (email_absent == True) or (password_matched == False):
+        if not PasswordUtil.verify(user, password):
             message = "invalid_email_or_passsword"
             raise serializers.ValidationError(message)
 
@@ -151,11 +152,9 @@ class LaboratorySignUpSerializer(serializers.ModelSerializer):
     )
 
     def validate_email(self, email):
-        email = email.strip().lower()
-
-        queryset = self.context["queryset"]
+        email = EmailUser.objects.normalize_email(email)
 
-        if queryset.exists():
+        if EmailUser.objects.filter(email=email).exists():
             message = "server_exists_already"
             raise serializers.ValidationError(message)
 
@@ -195,7 +194,6 @@ class LaboratorySignUpSerializer(serializers.ModelSerializer):
         # EMAIL TOKEN
         verification_token = EmailToken()
         verification_token.email_user = instance
-        verification_token.token = uuid.uuid4()
         verification_token.category = "signup"
         verification_token.is_used = False
         verification_token.expiry = TimeUtil.get_minutes_from_now(
@@ -205,16 +203,20 @@ class LaboratorySignUpSerializer(serializers.ModelSerializer):
         # Business
         business = Business()
         business.name = company_name
-        business.owner = instance
         business.category = "laboratory"
         business.is_active = True
 
+        business_owner = BusinessOwner()
+        business_owner.business = business
+        business_owner.owner = instance
+        business_owner.is_active = True
+
         with transaction.atomic():
             instance.save()
-            verification_token.save()
+            TokenUtil.save_email_token(verification_token)
             business.save()
-
-        EmailUtil.send_signup_email(instance, verification_token)
+            business_owner.save()
+            EmailUtil.queue_signup_email(instance, verification_token)
 
         return instance
 
@@ -227,54 +229,36 @@ class LaboratoryVerifySignUpSerializer(serializers.Serializer):
         error_messages=CUSTOM_ERROR_MESSAGES["UUIDField"],
     )
 
-    def validate_email(self, email):
-        email = email.strip().lower()
-
-        queryset = EmailUser.objects.filter(email=email)
-
-        if not queryset.exists():
-            message = "server_absent"
-            raise serializers.ValidationError(message)
-
-        return queryset.first()
-
-    def validate_token(self, token):
-
-        email = self.initial_data["email"].strip().lower()
+    def validate(self, data):
+        email = EmailUser.objects.normalize_email(data["email"])
 
-        queryset = EmailToken.objects.filter(token=token, category="signup").order_by(
-            "-created_at"
+        # One query on (token, category), the user comes along for the checks
+        token_object = (
+            EmailToken.objects.filter(token=data["token"], category="signup")
+            .select_related("email_user")
+            .order_by("-created_at", "-id")
+            .first()
         )
 
-        if not queryset.exists():
+        if token_object is None:
             # NOTE: message should be server_absent, but for this endpoint server_invalid is chosen
-            message = "server_invalid"
-            raise serializers.ValidationError(message)
-
-        token_object = queryset.first()
+            raise serializers.ValidationError({"token": "server_invalid"})
 
         if token_object.is_used:
-            message = "server_used"
-            raise serializers.ValidationError(message)
+            raise serializers.ValidationError({"token": "server_used"})
 
         if token_object.expiry < timezone.now():
-            message = "server_expired"
-            raise serializers.ValidationError(message)
-
-        return token_object
+            raise serializers.ValidationError({"token": "server_expired"})
 
-    def validate(self, data):
-        email_user = data["email"]
-        token_object = data["token"]
-
-        queryset = EmailToken.objects.filter(
-            email_user_id=email_user.id, token=token_object.token, category="signup"
-        ).order_by("-created_at")
+        if token_object.email_user.email != email:
+            if not EmailUser.objects.filter(email=email).exists():
+                raise serializers.ValidationError({"email": "server_absent"})
 
-        if not queryset.exists():
             message = "server_email_token_mismatch"
             raise serializers.ValidationError(message)
 
+        data["email"] = token_object.email_user
+        data["token"] = token_object
         return data
 
     class Meta:
@@ -287,43 +271,46 @@ class RequestPasswordResetSerializer(serializers.Serializer):
     )
 
     def validate_email(self, email):
-        email = email.strip().lower()
-
-        queryset = EmailUser.objects.filter(email=email)
+        email = EmailUser.objects.normalize_email(email)
+
+        # The newest reset token is read in the same query, through the
+        # (email_user, category, created_at) index
+        latest_token = EmailToken.objects.filter(
+            email_user=OuterRef("pk"), category="reset"
+        ).order_by("-created_at", "-id")
+
+        email_user = (
+            EmailUser.objects.filter(email=email)
+            .annotate(
+                latest_token_is_used=Subquery(latest_token.values("is_used")[:1]),
+                latest_token_expiry=Subquery(latest_token.values("expiry")[:1]),
+            )
+            .first()
+        )
 
-        if not queryset.exists():
+        if email_user is None:
             message = "server_absent"
             raise serializers.ValidationError(message)
 
-        return queryset.first()
+        return email_user
 
     def validate(self, data):
-
-        is_initial = False
-
         email_user = data["email"]
 
-        user_tokens = EmailToken.objects.order_by("-created_at").filter(
-            email_user=email_user, category="reset"
-        )
-
-        if user_tokens.exists():
-            latest_token = user_tokens.first()
-
-        else:
-            is_initial = True
-
-        if is_initial == False:
-            if (latest_token.is_used == False) and (
-                latest_token.expiry > timezone.now()
-            ):
-                message = "server_latest_token_unused"
-                raise serializers.ValidationError(message)
+        if (
+            email_user.latest_token_expiry is not None
+            and email_user.latest_token_is_used == False
+            and email_user.latest_token_expiry > timezone.now()
+        ):
+            message = "server_latest_token_unused"
+            raise serializers.ValidationError(message)
 
         return data
 
 
 class ResetPasswordSerializer(serializers.Serializer):
+    category = "reset"
+
     email = serializers.EmailField(
         error_messages=CUSTOM_ERROR_MESSAGES["EmailField"],
     )
@@ -341,55 +328,46 @@ class ResetPasswordSerializer(serializers.Serializer):
         error_messages=CUSTOM_ERROR_MESSAGES["CharField"],
     )
 
-    def validate_email(self, email):
-        email = email.strip().lower()
-        # token = self.initial_data["token"].strip()
-
-        # TODO: same sql is being run twice, need a fix for this.
-        queryset = EmailToken.objects.filter(email_user__email=email).order_by(
-            "-created_at"
-        )
+    def validate(self, data):
+        password_one = data["password_one"]
+        password_two = data["password_two"]
 
-        if not queryset.exists():
-            message = "server_absent"
+        if password_one != password_two:
+            message = "server_passwords_not_match"
             raise serializers.ValidationError(message)
 
-        return queryset.first()
-
-    def validate_token(self, token):
+        email = EmailUser.objects.normalize_email(data["email"])
 
-        email = self.initial_data["email"].strip().lower()
-
-        # TODO: same sql is being run twice, need a fix for this.
-        queryset = EmailToken.objects.filter(
-            email_user__email=email, token=token
-        ).order_by("-created_at")
+        token_object = (
+            EmailToken.objects.filter(
+                email_user__email=email, token=data["token"], category=self.category
+            )
+            .select_related("email_user")
+            .order_by("-created_at", "-id")
+            .first()
+        )
 
-        if not queryset.exists():
-            message = "server_absent"
-            raise serializers.ValidationError(message)
+        if token_object is None:
+            if not EmailToken.objects.filter(email_user__email=email).exists():
+                raise serializers.ValidationError({"email": "server_absent"})
 
-        token_object = queryset.first()
+            raise serializers.ValidationError({"token": "server_absent"})
 
         if token_object.is_used:
-            message = "server_used"
-            raise serializers.ValidationError(message)
+            raise serializers.ValidationError({"token": "server_used"})
 
         if token_object.expiry < timezone.now():
-            message = "server_expired"
-            raise serializers.ValidationError(message)
+            raise serializers.ValidationError({"token": "server_expired"})
 
-        return token_object
+        data["email"] = token_object.email_user
+        data["token"] = token_object
+        return data
 
-    def validate(self, data):
-        password_one = data["password_one"]
-        password_two = data["password_two"]
 
-        if password_one != password_two:
-            message = "server_passwords_not_match"
-            raise serializers.ValidationError(message)
+class AcceptInvitationSerializer(ResetPasswordSerializer):
+    """Sets the first password of an invited employee, see InvitationUtil."""
 
-        return data
+    category = "invite"
 
 
 class MobileTokenSerializer(serializers.ModelSerializer):
@@ -404,22 +382,29 @@ class MobileTokenSerializer(serializers.ModelSerializer):
             message = "server_max_length"
             raise serializers.ValidationError(message)
 
-        queryset = EmailUser.objects.filter(mobile=mobile)
+        # The newest token is read in the same query, on (mobile, created_at)
+        latest_token = MobileToken.objects.filter(mobile=OuterRef("mobile")).order_by(
+            "-created_at", "-id"
+        )
 
-        if not queryset.exists():
+        # Placeholder owners of unclaimed businesses may share the mobile
+        email_user = (
+            EmailUser.objects.filter(mobile=mobile, is_active=True)
+            .exclude(owned_business__business__is_claimed=False)
+            .annotate(latest_token_expiry=Subquery(latest_token.values("expiry")[:1]))
+            .first()
+        )
+
+        if email_user is None:
             message = "server_mobile_absent"
             raise serializers.ValidationError(message)
 
-        latest_token = (
-            MobileToken.objects.filter(mobile=mobile).order_by("-created_at").first()
-        )
-
-        if latest_token != None:
-            if timezone.now() < latest_token.expiry:
+        if email_user.latest_token_expiry is not None:
+            if timezone.now() < email_user.latest_token_expiry:
                 message = "server_mobile_token_not_expired"
                 raise serializers.ValidationError(message)
 
-        return queryset.first()
+        return email_user
 
     def create(self, validated_data):
 
@@ -432,10 +417,9 @@ class MobileTokenSerializer(serializers.ModelSerializer):
         instance.expiry = TimeUtil.get_minutes_from_now(MOBILE_TOKEN_EXPIRY_MINUTES)
         instance.is_used = False
 
-        instance.save()
-
-        # NOTE: SHOULD HAPPEN SYNCHRNOUSLY ONLY. CELERY TASK SHOULD NOT BE CREATED FOR THIS.
-        # SmsUtil.send_mobile_token_sms(instance)
+        with transaction.atomic():
+            instance.save()
+            SmsUtil.queue_mobile_token_sms(instance)
 
         return instance
 
@@ -446,31 +430,6 @@ class MobileTokenSerializer(serializers.ModelSerializer):
 
 
 class VerifyMobileTokenSerializer(serializers.ModelSerializer):
-    def validate_token(self, token):
-
-        mobile = self.initial_data["mobile"]
-
-        latest_token = (
-            MobileToken.objects.filter(mobile=mobile, token=token)
-            .order_by("-created_at")
-            .first()
-        )
-
-        if latest_token == None:
-            message = "server__absent"
-            raise serializers.ValidationError(message)
-
-        else:
-            if timezone.now() > latest_token.expiry:
-                message = "server_expired"
-                raise serializers.ValidationError(message)
-
-            if latest_token.is_used:
-                message = "server_used_already"
-                raise serializers.ValidationError(message)
-
-        return latest_token
-
     def validate_mobile(self, mobile):
         len_mobile = len(str(mobile).strip())
 
@@ -482,13 +441,39 @@ class VerifyMobileTokenSerializer(serializers.ModelSerializer):
             message = "server_max_length"
             raise serializers.ValidationError(message)
 
-        queryset = EmailUser.objects.filter(mobile=mobile)
+        return mobile
 
-        if not queryset.exists():
-            message = "server_mobile_absent"
-            raise serializers.ValidationError(message)
+    def validate(self, data):
+        mobile = data["mobile"]
 
-        return queryset.first()
+        latest_token = (
+            MobileToken.objects.filter(mobile=mobile, token=data["token"])
+            .select_related("email_user")
+            .order_by("-created_at", "-id")
+            .first()
+        )
+
+        if latest_token is None or latest_token.email_user.mobile != mobile:
+            # Only failures pay for telling an unknown mobile apart
+            if not EmailUser.objects.filter(mobile=mobile).exists():
+                raise serializers.ValidationError({"mobile": "server_mobile_absent"})
+
+        if latest_token is None:
+            raise serializers.ValidationError({"token": "server__absent"})
+
+        # Issued for a number the user has since changed, it does not verify
+        # the current one
+        if latest_token.email_user.mobile != mobile:
+            raise serializers.ValidationError({"token": "server_invalid"})
+
+        if timezone.now() > latest_token.expiry:
+            raise serializers.ValidationError({"token": "server_expired"})
+
+        if latest_token.is_used:
+            raise serializers.ValidationError({"token": "server_used_already"})
+
+        data["token"] = latest_token
+        return data
 
     def create(self, validated_data):
 
@@ -497,7 +482,15 @@ class VerifyMobileTokenSerializer(serializers.ModelSerializer):
         token.is_used = True
         token.used_time = TimeUtil.get_minutes_from_now(0)
 
-        token.save()
+        email_user = token.email_user
+        email_user.is_mobile_verified = True
+        email_user.mobile_verified_time = token.used_time
+
+        with transaction.atomic():
+            token.save()
+            email_user.save(
+                update_fields=["is_mobile_verified", "mobile_verified_time"]
+            )
 
         # NOTE: SHOULD HAPPEN SYNCHRNOUSLY ONLY. CELERY TASK SHOULD NOT BE CREATED FOR THIS.
         # SmsUtil.send_mobile_token_sms(instance)
@@ -538,8 +531,8 @@ class CreateRelatedBusinessSerializer(serializers.ModelSerializer):
     )
 
     def validate_email(self, email):
-        email = email.strip().lower()
-        queryset = EmailUser.objects.filter(email__iexact=email)
+        email = EmailUser.objects.normalize_email(email)
+        queryset = EmailUser.objects.filter(email=email)
 
         if queryset.exists():
             message = "server_exists_already"
@@ -684,9 +677,9 @@ class ConnectRelatedBusinessSerializer(serializers.ModelSerializer):
 
 
 class ToggleBusinessConnectSerializer(serializers.ModelSerializer):
-    connect_id = serializers.UUIDField(
+    connect_id = serializers.IntegerField(
         write_only=True,
-        error_messages=CUSTOM_ERROR_MESSAGES["UUIDField"],
+        error_messages=CUSTOM_ERROR_MESSAGES["IntegerField"],
     )
 
     def validate_connect_id(self, connect_id):
@@ -702,17 +695,19 @@ class ToggleBusinessConnectSerializer(serializers.ModelSerializer):
         model = BusinessConnect
         fields = [
             "id",
-            "dentist",
-            "laboratory",
+            "from_business",
+            "to_business",
             "is_active",
             "connect_id",
         ]
-        read_only_fields = ["dentist", "laboratory", "is_active"]
+        read_only_fields = ["from_business", "to_business", "is_active"]
 
     def create(self, validated_data):
 
         connect = validated_data["connect_id"]
         connect.is_active = False if connect.is_active else True
+
+        # post_save drops the cached connection graph of both businesses
         connect.save()
 
         return connect
@@ -758,8 +753,8 @@ class BusinessEmployeeSerializer(serializers.ModelSerializer):
     )
 
     def validate_email(self, email):
-        email = email.strip().lower()
-        queryset = EmailUser.objects.filter(email__iexact=email)
+        email = EmailUser.objects.normalize_email(email)
+        queryset = EmailUser.objects.filter(email=email)
 
         if queryset.exists():
             message = "server_exists_already"
@@ -818,7 +813,6 @@ class BusinessEmployeeSerializer(serializers.ModelSerializer):
         # EMAIL TOKEN
         email_token = EmailToken()
         email_token.email_user = employee
-        email_token.token = uuid.uuid4()
         email_token.category = "signup"
         email_token.is_used = False
         email_token.expiry = TimeUtil.get_minutes_from_now(SIGNUP_TOKEN_EXPIRY_MINUTES)
@@ -838,11 +832,122 @@ class BusinessEmployeeSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             employee.save()
             employment.save()
-            email_token.save()
+            TokenUtil.save_email_token(email_token)
 
             if mobile:
                 mobile_token.save()
 
-        # EmailUtil.send_signup_email(instance, email_token)
+        # EmailUtil.queue_signup_email(instance, email_token)
 
         return employee
+
+
+class EmployeeInviteSerializer(ServerErrorSerializer):
+    first_name = serializers.CharField(max_length=255)
+    last_name = serializers.CharField(max_length=255)
+    email = serializers.EmailField(max_length=255)
+    mobile = serializers.CharField(min_length=10, max_length=10, required=False)
+
+    def validate_email(self, email):
+        return EmailUser.objects.normalize_email(email)
+
+    def validate_mobile(self, mobile):
+
+        if not mobile.isnumeric():
+            message = "server_must_be_numeric"
+            raise serializers.ValidationError(message)
+
+        return int(mobile)
+
+
+class InviteBusinessEmployeesSerializer(ServerErrorSerializer):
+    employees = EmployeeInviteSerializer(many=True, allow_empty=False)
+
+    def validate_employees(self, employees):
+
+        if len(employees) > EMPLOYEE_INVITE_MAX_COUNT:
+            message = "server_max_length"
+            raise serializers.ValidationError(message)
+
+        emails = Counter(employee["email"] for employee in employees)
+        mobiles = Counter(
+            employee["mobile"] for employee in employees if employee.get("mobile")
+        )
+
+        # Every email and mobile of the request in one query
+        existing_emails = set()
+        existing_mobiles = set()
+
+        for email, mobile in EmailUser.objects.filter(
+            Q(email__in=emails) | Q(mobile__in=mobiles)
+        ).values_list("email", "mobile"):
+            existing_emails.add(email)
+            existing_mobiles.add(mobile)
+
+        errors = []
+
+        for employee in employees:
+            error = {}
+            email = employee["email"]
+            mobile = employee.get("mobile")
+
+            if email in existing_emails:
+                error["email"] = ["server_exists_already"]
+            elif emails[email] > 1:
+                error["email"] = ["server_duplicate_in_request"]
+
+            if mobile and mobile in existing_mobiles:
+                error["mobile"] = ["server_exists_already"]
+            elif mobile and mobiles[mobile] > 1:
+                error["mobile"] = ["server_duplicate_in_request"]
+
+            errors.append(error)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return employees
+
+    def create(self, validated_data):
+        business = self.context["user"].get_business()
+
+        return InvitationUtil.invite_employees(business, validated_data["employees"])
+
+
+class ClaimBusinessSerializer(ServerErrorSerializer):
+    business_id = serializers.IntegerField(
+        error_messages=CUSTOM_ERROR_MESSAGES["IntegerField"],
+    )
+
+    def validate_business_id(self, business_id):
+        user = self.context["user"]
+
+        message = ClaimUtil.get_claim_error(user, user.get_business(), business_id)
+
+        if message is not None:
+            raise serializers.ValidationError(message)
+
+        return business_id
+
+    def create(self, validated_data):
+        user = self.context["user"]
+        claimed = Business.objects.get(id=validated_data["business_id"])
+
+        return ClaimUtil.claim(user, user.get_business(), claimed)
+
+
+class LogoutSerializer(ServerErrorSerializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, refresh):
+        try:
+            refresh = RefreshToken(refresh)
+        except TokenError:
+            message = "server_invalid"
+            raise serializers.ValidationError(message)
+
+        if refresh[jwt_settings.USER_ID_CLAIM] != self.context["user_id"]:
+            message = "server_invalid"
+            raise serializers.ValidationError(message)
+
+        return refresh
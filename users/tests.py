@@ -1,3 +1,768 @@
-from django.test import TestCase
+import importlib
+import io
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from businesses.models import (
+    Business,
+    BusinessConnect,
+    BusinessContact,
+    BusinessOwner,
+    Order,
+)
+from businesses.utils import ClaimUtil
+from core import throttling
+from core.models import OutboxMessage, RevokedToken
+from users import serializers
+from users.models import EmailToken, EmailUser, MobileToken
+from users.utils import PasswordUtil
+
+
+class TokenValidationQueryCountTests(TestCase):
+    """Each token flow validates with a single query."""
+
+    MOBILE = 9876543210
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = EmailUser.objects.create_user(
+            "Owner@Example.com",
+            "password123",
+            first_name="Owner",
+            last_name="One",
+            user_type="owner",
+            mobile=cls.MOBILE,
+        )
+
+        expired = timezone.now() - timedelta(minutes=1)
+        valid = timezone.now() + timedelta(minutes=15)
+
+        cls.signup_token = EmailToken.objects.create(
+            email_user=cls.user, token=uuid.uuid4(), category="signup", expiry=valid
+        )
+        EmailToken.objects.create(
+            email_user=cls.user, token=uuid.uuid4(), category="reset", expiry=expired
+        )
+        cls.reset_token = EmailToken.objects.create(
+            email_user=cls.user, token=uuid.uuid4(), category="reset", expiry=valid
+        )
+        cls.mobile_token = MobileToken.objects.create(
+            email_user=cls.user, mobile=cls.MOBILE, token="123456", expiry=valid
+        )
+
+    def assertValidInOneQuery(self, serializer):
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        return serializer.validated_data
+
+    def test_laboratory_verify_signup(self):
+        serializer = serializers.LaboratoryVerifySignUpSerializer(
+            data={"email": "owner@example.com", "token": str(self.signup_token.token)}
+        )
+
+        data = self.assertValidInOneQuery(serializer)
+
+        self.assertEqual(data["email"], self.user)
+        self.assertEqual(data["token"], self.signup_token)
+
+    def test_request_password_reset(self):
+        EmailToken.objects.filter(id=self.reset_token.id).update(is_used=True)
+
+        serializer = serializers.RequestPasswordResetSerializer(
+            data={"email": "OWNER@example.com"}
+        )
+
+        data = self.assertValidInOneQuery(serializer)
+
+        self.assertEqual(data["email"], self.user)
+
+    def test_request_password_reset_with_pending_token(self):
+        serializer = serializers.RequestPasswordResetSerializer(
+            data={"email": "owner@example.com"}
+        )
+
+        with self.assertNumQueries(1):
+            self.assertFalse(serializer.is_valid())
+
+        self.assertEqual(
+            serializer.errors["non_field_errors"], ["server_latest_token_unused"]
+        )
+
+    def test_reset_password(self):
+        serializer = serializers.ResetPasswordSerializer(
+            data={
+                "email": "owner@example.com",
+                "token": str(self.reset_token.token),
+                "password_one": "new-password",
+                "password_two": "new-password",
+            }
+        )
+
+        data = self.assertValidInOneQuery(serializer)
+
+        self.assertEqual(data["email"], self.user)
+        self.assertEqual(data["token"], self.reset_token)
+
+    def test_reset_password_rejects_signup_token(self):
+        serializer = serializers.ResetPasswordSerializer(
+            data={
+                "email": "owner@example.com",
+                "token": str(self.signup_token.token),
+                "password_one": "new-password",
+                "password_two": "new-password",
+            }
+        )
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors["token"], ["server_absent"])
+
+    def test_request_mobile_token(self):
+        MobileToken.objects.filter(id=self.mobile_token.id).update(
+            expiry=timezone.now() - timedelta(minutes=1)
+        )
+
+        serializer = serializers.MobileTokenSerializer(data={"mobile": self.MOBILE})
+
+        data = self.assertValidInOneQuery(serializer)
+
+        self.assertEqual(data["mobile"], self.user)
+
+    def test_verify_mobile_token(self):
+        serializer = serializers.VerifyMobileTokenSerializer(
+            data={"mobile": self.MOBILE, "token": "123456"}
+        )
+
+        data = self.assertValidInOneQuery(serializer)
+
+        self.assertEqual(data["token"], self.mobile_token)
+
+        serializer.save()
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_mobile_verified)
+        self.assertIsNotNone(self.user.mobile_verified_time)
+
+
+@override_settings(SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL="d-invite")
+class EmployeeInvitationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = EmailUser.objects.create_user(
+            "owner@example.com", "password123", user_type="owner"
+        )
+        cls.business = Business.objects.create(name="Lab", category="laboratory")
+        BusinessOwner.objects.create(business=cls.business, owner=cls.owner)
+
+    def get_employees(self, count):
+        return [
+            {
+                "first_name": f"Tech {i}",
+                "last_name": "One",
+                "email": f"Tech{i}@Example.com",
+                "mobile": str(9000000000 + i),
+            }
+            for i in range(count)
+        ]
+
+    def invite(self, employees):
+        serializer = serializers.InviteBusinessEmployeesSerializer(
+            data={"employees": employees}, context={"user": self.owner}
+        )
+        serializer.is_valid(raise_exception=True)
+
+        return serializer.save()
+
+    def test_invite_query_count_does_not_grow_with_employees(self):
+        # Warm the owner's business so both runs start alike
+        self.owner.get_business()
+
+        with self.assertNumQueries(11):
+            self.invite(self.get_employees(2))
+
+        with self.assertNumQueries(11):
+            self.invite(self.get_employees(50)[2:])
+
+        self.assertEqual(self.business.employees.count(), 50)
+        self.assertEqual(EmailToken.objects.filter(category="invite").count(), 50)
+        self.assertEqual(OutboxMessage.objects.count(), 50)
+        self.assertFalse(
+            EmailUser.objects.get(email="tech0@example.com").has_usable_password()
+        )
+
+    def test_invite_needs_its_own_template(self):
+        (employee,) = self.invite(self.get_employees(1))
+
+        self.assertEqual(
+            OutboxMessage.objects.get(recipient=employee.email).template, "d-invite"
+        )
+
+        with override_settings(SENDGRID_TEMPLATE_ID_EMPLOYEE_INVITE_EMAIL=None):
+            with self.assertRaises(ImproperlyConfigured):
+                self.invite(self.get_employees(2)[1:])
+
+        self.assertFalse(EmailUser.objects.filter(email="tech1@example.com").exists())
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_invite_reports_existing_and_repeated_rows(self):
+        employees = self.get_employees(2)
+        employees[1]["email"] = "OWNER@example.com"
+        employees.append(dict(employees[0], mobile="9100000000"))
+
+        serializer = serializers.InviteBusinessEmployeesSerializer(
+            data={"employees": employees}, context={"user": self.owner}
+        )
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(
+            serializer.errors["employees"],
+            [
+                {"email": ["server_duplicate_in_request"]},
+                {"email": ["server_exists_already"]},
+                {"email": ["server_duplicate_in_request"]},
+            ],
+        )
+
+    def test_accept_invitation(self):
+        (employee,) = self.invite(self.get_employees(1))
+        token = EmailToken.objects.get(email_user=employee, category="invite")
+
+        serializer = serializers.AcceptInvitationSerializer(
+            data={
+                "email": employee.email,
+                "token": str(token.token),
+                "password_one": "new-password",
+                "password_two": "new-password",
+            }
+        )
+
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data["email"], employee)
+
+
+class ClaimBusinessTests(TestCase):
+    MOBILE = 9876543210
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.laboratory = Business.objects.create(name="Lab", category="laboratory")
+        cls.lab_owner = EmailUser.objects.create_user(
+            "lab@example.com", "password123", user_type="owner"
+        )
+        BusinessOwner.objects.create(business=cls.laboratory, owner=cls.lab_owner)
+
+        # What the lab created for the dentist before they signed up
+        cls.placeholder = Business.objects.create(
+            name="Clinic",
+            category="dentist",
+            referral=cls.laboratory,
+            is_claimed=False,
+        )
+        cls.placeholder_owner = EmailUser.objects.create(
+            email="clinic@example.com", user_type="owner", mobile=cls.MOBILE
+        )
+        BusinessOwner.objects.create(
+            business=cls.placeholder, owner=cls.placeholder_owner
+        )
+        BusinessConnect.objects.create(
+            from_business=cls.placeholder, to_business=cls.laboratory
+        )
+        cls.order = Order.objects.create(
+            doctor_name="Doctor",
+            patient_name="Patient",
+            patient_age=30,
+            teeth={},
+            from_business=cls.placeholder,
+            from_user=cls.placeholder_owner,
+            to_business=cls.laboratory,
+        )
+
+        cls.business = Business.objects.create(name="My clinic", category="dentist")
+        cls.user = EmailUser.objects.create_user(
+            "dentist@example.com",
+            "password123",
+            user_type="owner",
+            mobile=cls.MOBILE,
+            is_email_verified=True,
+        )
+        BusinessOwner.objects.create(business=cls.business, owner=cls.user)
+
+    def setUp(self):
+        # Django 3.1 shares the setUpTestData instances between tests
+        self.user.refresh_from_db()
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_candidates(self):
+        response = self.client.get("/api/users/registered/claim_candidates/")
+        self.assertEqual(response.status_code, 200)
+
+        return {item["id"]: item["matched_by"] for item in response.data}
+
+    def verify_mobile(self):
+        token = MobileToken.objects.create(
+            email_user=self.user,
+            mobile=self.MOBILE,
+            token="123456",
+            expiry=timezone.now() + timedelta(minutes=15),
+        )
+        serializer = serializers.VerifyMobileTokenSerializer(
+            data={"mobile": self.MOBILE, "token": token.token}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    def test_mobile_token_goes_to_the_signed_up_owner(self):
+        serializer = serializers.MobileTokenSerializer(data={"mobile": self.MOBILE})
+
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data["mobile"], self.user)
+
+    def test_candidates_match_on_verified_contacts_only(self):
+        self.assertEqual(self.get_candidates(), {})
+
+        self.verify_mobile()
+        self.assertEqual(self.get_candidates(), {self.placeholder.id: ["mobile"]})
+
+        BusinessContact.objects.create(
+            business=self.placeholder,
+            contact="Dentist@Example.com",
+            contact_type="email",
+        )
+        self.assertEqual(
+            self.get_candidates(), {self.placeholder.id: ["email", "mobile"]}
+        )
+
+    def test_unverified_claim_is_rejected(self):
+        response = self.client.post(
+            "/api/users/registered/claim_business/",
+            {"business_id": self.placeholder.id},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["business_id"], ["server_absent"])
+
+    def test_claim_merges_the_placeholder(self):
+        self.verify_mobile()
+
+        response = self.client.post(
+            "/api/users/registered/claim_business/",
+            {"business_id": self.placeholder.id},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+        self.business.refresh_from_db()
+        self.placeholder.refresh_from_db()
+        self.order.refresh_from_db()
+        self.placeholder_owner.refresh_from_db()
+
+        self.assertEqual(self.business.referral, self.laboratory)
+        self.assertFalse(self.placeholder.is_active)
+        self.assertFalse(self.placeholder_owner.is_active)
+        self.assertEqual(
+            list(BusinessConnect.objects.values_list("from_business", "to_business")),
+            [(self.business.id, self.laboratory.id)],
+        )
+        self.assertEqual(self.order.from_business, self.business)
+        self.assertEqual(self.order.from_user, self.user)
+        self.assertEqual(self.get_candidates(), {})
+
+    def test_editing_a_verified_contact_drops_the_verification(self):
+        contact = BusinessContact.objects.create(
+            business=self.business,
+            contact="dentist@example.com",
+            contact_type="email",
+            is_verified=True,
+        )
+
+        response = self.client.patch(
+            f"/api/business/contacts/{contact.id}/",
+            {"contact": "clinic@example.com", "contact_type": "email"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertFalse(response.data["is_verified"])
+
+        response = self.client.post(
+            "/api/users/registered/claim_business/",
+            {"business_id": self.placeholder.id},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["business_id"], ["server_absent"])
+
+    def test_claim_is_checked_again_when_it_is_made(self):
+        self.verify_mobile()
+        self.user.refresh_from_db()
+
+        ClaimUtil.claim(self.user, self.business, self.placeholder)
+
+        # Like a second request validated before the first one committed
+        with self.assertRaises(ValidationError) as raised:
+            ClaimUtil.claim(self.user, self.business, self.placeholder)
+
+        self.assertEqual(raised.exception.detail, {"business_id": ["server_absent"]})
+
+    def test_token_of_a_previous_mobile_verifies_nothing(self):
+        token = MobileToken.objects.create(
+            email_user=self.user,
+            mobile=self.MOBILE,
+            token="123456",
+            expiry=timezone.now() + timedelta(minutes=15),
+        )
+        self.user.mobile = 9123456789
+        self.user.save()
+
+        serializer = serializers.VerifyMobileTokenSerializer(
+            data={"mobile": self.MOBILE, "token": token.token}
+        )
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, {"token": ["server_invalid"]})
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_mobile_verified)
+
+
+class IntegerFieldErrorTests(TestCase):
+    def test_integer_fields_use_the_server_messages(self):
+        serializer = serializers.ToggleBusinessConnectSerializer(
+            data={"connect_id": "first"}
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, {"connect_id": ["server_invalid"]})
+
+        serializer = serializers.ClaimBusinessSerializer(data={}, context={})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, {"business_id": ["server_required"]})
+
+
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        # Fresh buckets, the store lives for the whole process
+        throttling.bucket_store = None
+        self.addCleanup(setattr, throttling, "bucket_store", None)
+
+        EmailUser.objects.create_user("owner@example.com", "password123")
+
+    def login(self, url, email, address="127.0.0.1", **headers):
+        return self.client.post(
+            url,
+            {"email": email, "password": "wrong-password"},
+            content_type="application/json",
+            REMOTE_ADDR=address,
+            **headers,
+        )
+
+    def test_login_is_throttled_after_the_burst(self):
+        for _ in range(10):
+            response = self.login("/api/users/login/", "owner@example.com")
+            self.assertEqual(response.status_code, 200)
+
+        response = self.login("/api/users/login/", "Owner@Example.com")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {"detail": "server_throttled"})
+        self.assertIn("Retry-After", response)
+
+        # The token endpoint checks passwords too, from the same buckets
+        response = self.login("/api/token/obtain/", "owner@example.com")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {"detail": "server_throttled"})
+
+        response = self.login("/api/token/obtain/", "other@example.com")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_addresses_keep_their_own_login_buckets(self):
+        for _ in range(10):
+            self.login("/api/users/login/", "owner@example.com", "10.0.0.1")
+
+        self.assertEqual(
+            self.login(
+                "/api/users/login/", "owner@example.com", "10.0.0.1"
+            ).status_code,
+            429,
+        )
+
+        # The owner of the email, elsewhere, is not locked out
+        response = self.login("/api/users/login/", "owner@example.com", "10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+
+    def test_forwarded_for_does_not_change_the_address(self):
+        for index in range(3):
+            self.login(
+                "/api/users/login/",
+                "owner@example.com",
+                HTTP_X_FORWARDED_FOR=f"10.1.0.{index}",
+            )
+
+        address_keys = [
+            key
+            for key in throttling.get_bucket_store().buckets
+            if key.startswith("throttle:auth_ip:")
+        ]
+        self.assertEqual(address_keys, ["throttle:auth_ip:login:127.0.0.1"])
+
+
+class PasswordLoginTests(TestCase):
+    def setUp(self):
+        throttling.bucket_store = None
+        self.addCleanup(setattr, throttling, "bucket_store", None)
+
+        self.user = EmailUser.objects.create_user(
+            "owner@example.com", "password123", user_type="owner"
+        )
+        BusinessOwner.objects.create(
+            business=Business.objects.create(name="Lab"), owner=self.user
+        )
+
+    def login(self, password="password123"):
+        return self.client.post(
+            "/api/users/login/",
+            {"email": "owner@example.com", "password": password},
+            content_type="application/json",
+        )
+
+    def test_outdated_hash_is_replaced_on_login(self):
+        self.user.password = make_password("password123", hasher="pbkdf2_sha1")
+        self.user.save(update_fields=["password"])
+
+        response = self.login()
+
+        self.assertEqual(response.json()["id"], self.user.id)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+        self.assertTrue(self.user.check_password("password123"))
+
+        # A wrong password leaves an outdated hash as it is
+        outdated_password = make_password("password123", hasher="pbkdf2_sha1")
+        self.user.password = outdated_password
+        self.user.save(update_fields=["password"])
+
+        self.assertFalse(PasswordUtil.verify(self.user, "wrong-password"))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, outdated_password)
+
+    def test_inactive_user_gets_the_wrong_password_error(self):
+        wrong_password = self.login("wrong-password").json()
+
+        self.user.is_active = False
+        self.user.save(update_fields=["is_active"])
+
+        self.assertEqual(self.login().json(), wrong_password)
+        self.assertEqual(
+            wrong_password,
+            {"errors": {"non_field_errors": ["invalid_email_or_passsword"]}},
+        )
+        self.assertFalse(PasswordUtil.verify(None, "password123"))
+
+    def test_login_takes_a_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.login()
+
+        self.assertEqual(response.json()["id"], self.user.id)
+
+
+class EmailCaseTests(TestCase):
+    def setUp(self):
+        self.user = EmailUser.objects.create_user(
+            " Owner@Example.COM", "password123", user_type="owner"
+        )
+        BusinessOwner.objects.create(
+            business=Business.objects.create(name="Lab"), owner=self.user
+        )
+
+    def test_emails_are_stored_lowercased(self):
+        self.assertEqual(self.user.email, "owner@example.com")
+
+        self.user.email = "Owner@EXAMPLE.com"
+        self.user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, "owner@example.com")
+
+    def test_login_ignores_the_case_of_the_email(self):
+        response = self.client.post(
+            "/api/users/login/",
+            {"email": " OWNER@example.Com ", "password": "password123"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("errors", response.json())
+        self.assertEqual(response.json()["id"], self.user.id)
+
+        response = self.client.post(
+            "/api/token/obtain/",
+            {"email": "OWNER@example.com", "password": "password123"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.json())
+
+    def test_migration_lowercases_emails(self):
+        migration = importlib.import_module("users.migrations.0003_lowercase_emails")
+
+        # bulk_create skips save(), the rows keep the case they were given
+        EmailUser.objects.bulk_create([EmailUser(email="Mixed@Example.com")])
+
+        migration.lowercase_emails(apps, None)
+
+        self.assertEqual(
+            sorted(EmailUser.objects.values_list("email", flat=True)),
+            ["mixed@example.com", "owner@example.com"],
+        )
+
+    def test_migration_fails_on_colliding_emails(self):
+        migration = importlib.import_module("users.migrations.0003_lowercase_emails")
+
+        EmailUser.objects.bulk_create(
+            [
+                EmailUser(email="Mixed@Example.com"),
+                EmailUser(email="Twin@Example.com"),
+                EmailUser(email="twin@example.com"),
+            ]
+        )
+        twins = EmailUser.objects.filter(email__iexact="twin@example.com")
+        message = ", ".join(f"{user.id} {user.email}" for user in twins.order_by("id"))
+
+        with self.assertRaisesMessage(RuntimeError, message):
+            migration.lowercase_emails(apps, None)
+
+        # Nothing is changed until the collisions are merged
+        self.assertTrue(EmailUser.objects.filter(email="Mixed@Example.com").exists())
+
+
+class PurgeTokensTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.cutoff = self.now - timedelta(days=1)
+        self.user = EmailUser.objects.create_user("owner@example.com", "password123")
+
+        self.kept = []
+        self.purged = []
+
+        cases = [
+            # (expiry, is_used, used_time, purged)
+            (self.now + timedelta(minutes=15), False, None, False),
+            (self.cutoff, False, None, False),
+            (self.cutoff - timedelta(seconds=1), False, None, True),
+            (self.now - timedelta(hours=1), False, None, False),
+            (self.now + timedelta(minutes=15), True, self.cutoff, False),
+            (
+                self.now + timedelta(minutes=15),
+                True,
+                self.cutoff - timedelta(seconds=1),
+                True,
+            ),
+            (self.now - timedelta(days=3), True, self.now, True),
+        ]
+
+        for expiry, is_used, used_time, purged in cases:
+            tokens = [
+                EmailToken.objects.create(
+                    email_user=self.user,
+                    token=uuid.uuid4(),
+                    expiry=expiry,
+                    is_used=is_used,
+                    used_time=used_time,
+                ),
+                MobileToken.objects.create(
+                    email_user=self.user,
+                    mobile=9876543210,
+                    token="123456",
+                    expiry=expiry,
+                    is_used=is_used,
+                    used_time=used_time,
+                ),
+            ]
+            (self.purged if purged else self.kept).extend(tokens)
+
+        for index, expiry in enumerate([self.cutoff - timedelta(seconds=1)] * 3):
+            self.purged.append(
+                RevokedToken.objects.create(jti=f"old{index}", expiry=expiry)
+            )
+
+        self.kept.append(RevokedToken.objects.create(jti="edge", expiry=self.cutoff))
+        self.kept.append(
+            RevokedToken.objects.create(
+                jti="live", expiry=self.now + timedelta(hours=1)
+            )
+        )
+
+    def purge_tokens(self, *args):
+        stdout = io.StringIO()
+
+        with mock.patch("django.utils.timezone.now", return_value=self.now):
+            call_command("purge_tokens", *args, stdout=stdout)
+
+        return stdout.getvalue()
+
+    def get_ids(self, tokens):
+        return {(type(token), token.id) for token in tokens}
+
+    def get_remaining_ids(self):
+        return {
+            (model, token_id)
+            for model in [EmailToken, MobileToken, RevokedToken]
+            for token_id in model.objects.values_list("id", flat=True)
+        }
+
+    def test_only_stale_tokens_are_deleted_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            output = self.purge_tokens("--chunk-size", "2")
+
+        self.assertEqual(self.get_remaining_ids(), self.get_ids(self.kept))
+        self.assertEqual(
+            output.splitlines(),
+            [
+                "EmailToken: 3 deleted",
+                "MobileToken: 3 deleted",
+                "RevokedToken: 3 deleted",
+            ],
+        )
+
+        deletes = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith("DELETE")
+        ]
+        # Two chunks of at most two rows per model
+        self.assertEqual(len(deletes), 6)
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.purge_tokens("--dry-run")
+
+        self.assertEqual(
+            self.get_remaining_ids(), self.get_ids(self.kept + self.purged)
+        )
+        self.assertEqual(
+            output.splitlines(),
+            [
+                "EmailToken: 3 to delete",
+                "MobileToken: 3 to delete",
+                "RevokedToken: 3 to delete",
+            ],
+        )
@@ -1,27 +1,140 @@
 import uuid
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from users.models import EmailToken
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.db import IntegrityError, transaction
+
+from businesses.models import BusinessEmployee
+from core.utils import BulkUtil, EmailUtil, OutboxUtil, TimeUtil
+from users.constants import EMAIL_TOKEN_SAVE_ATTEMPTS, INVITE_TOKEN_EXPIRY_MINUTES
+from users.models import EmailToken, EmailUser
 
 
 class TokenUtil:
     @staticmethod
-    def get_unique_password_token(email_user):
-
-        unique_found = False
-        all_tokens = EmailToken.objects.filter(email_user=email_user).values_list(
-            "token", flat=True
-        )
-
-        while not unique_found:
-            current_token = uuid.uuid4()
+    def save_email_token(email_token):
+        """
+        Saves an EmailToken under a fresh uuid4. The unique (email_user, token)
+        index is the uniqueness check, a collision just draws again.
+        """
+        for attempt in range(1, EMAIL_TOKEN_SAVE_ATTEMPTS + 1):
+            email_token.token = uuid.uuid4()
 
-            if current_token not in all_tokens:
-                unique_found = True
-
-        return current_token
+            try:
+                with transaction.atomic():
+                    email_token.save()
+            except IntegrityError:
+                if attempt == EMAIL_TOKEN_SAVE_ATTEMPTS:
+                    raise
+            else:
+                return email_token
 
     @staticmethod
     def get_mobile_token():
         mobile_token = str(random.randint(100000, 999999))
         return mobile_token
+
+
+class PasswordUtil:
+    """
+    Password hashing on a bounded thread pool. PBKDF2 releases the GIL, the
+    pool keeps a burst of logins from running more hashes than there are
+    cores while the request threads wait on their result.
+    """
+
+    executor = None
+    lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls):
+        if cls.executor is None:
+            with cls.lock:
+                if cls.executor is None:
+                    cls.executor = ThreadPoolExecutor(
+                        max_workers=settings.PASSWORD_HASHING_WORKERS,
+                        thread_name_prefix="password",
+                    )
+
+        return cls.executor
+
+    @classmethod
+    def verify(cls, user, password):
+        """
+        check_password for a user that may be None. An outdated hash is
+        replaced with one of the first PASSWORD_HASHERS entry.
+        """
+        executor = cls.get_executor()
+
+        if user is None:
+            # Costs as much as a real check, so unknown emails do not answer faster
+            executor.submit(make_password, password).result()
+            return False
+
+        outdated = []
+        matched = executor.submit(
+            check_password, password, user.password, outdated.append
+        ).result()
+
+        if matched and outdated:
+            user.password = executor.submit(make_password, password).result()
+            user.save(update_fields=["password"])
+
+        return matched
+
+
+class InvitationUtil:
+    @staticmethod
+    def invite_employees(business, employees):
+        """
+        Creates employee users of business from validated invite rows, with a
+        handful of bulk inserts whatever the count. The users get an unusable
+        password and an invite token instead, so nothing is hashed here, each
+        employee picks a password when accepting the invitation.
+        """
+        users = [
+            EmailUser(
+                email=employee["email"],
+                first_name=employee["first_name"],
+                last_name=employee["last_name"],
+                mobile=int(employee.get("mobile") or 0),
+                user_type="employee",
+                is_email_verified=False,
+                is_mobile_verified=False,
+                password=make_password(None),
+            )
+            for employee in employees
+        ]
+
+        expiry = TimeUtil.get_minutes_from_now(INVITE_TOKEN_EXPIRY_MINUTES)
+
+        with transaction.atomic():
+            BulkUtil.bulk_create_with_ids(EmailUser, users)
+
+            BusinessEmployee.objects.bulk_create(
+                [BusinessEmployee(business=business, employee=user) for user in users]
+            )
+
+            # New users, so the unique (email_user, token) pairs cannot collide
+            tokens = EmailToken.objects.bulk_create(
+                [
+                    EmailToken(
+                        email_user=user,
+                        token=uuid.uuid4(),
+                        category="invite",
+                        expiry=expiry,
+                    )
+                    for user in users
+                ]
+            )
+
+            OutboxUtil.bulk_enqueue(
+                [
+                    EmailUtil.build_employee_invite_email(user, token, business)
+                    for user, token in zip(users, tokens)
+                ]
+            )
+
+        return users
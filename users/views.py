@@ -1,12 +1,27 @@
 from decimal import Context
 
+from django.db import transaction
 from django.db.models import query
-from core.utils import CommonUtil, EmailUtil, TimeUtil
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.mixins import RetrieveModelMixin
 from rest_framework.response import Response
 
+from core.revocation import revocation_filter
+from core.throttling import (
+    EmailTokenBucketThrottle,
+    IPTokenBucketThrottle,
+    LoginTokenBucketThrottle,
+    MobileTokenBucketThrottle,
+    ServerThrottledMixin,
+)
+from core.utils import CommonAuthenticationMixin, EmailUtil, TimeUtil
+
+from businesses.models import Business
+from businesses.serializers import BusinessOnlySerializer, ClaimCandidateSerializer
+from businesses.utils import ClaimUtil
+
 from users import serializers
 from users.constants import RESET_PASSWORD_TOKEN_EXPIRY_MINUTES
 from users.models import EmailUser, EmailToken
@@ -26,15 +41,30 @@ from users.utils import TokenUtil
 # reset password
 
 
-class EmailUserViewset(RetrieveModelMixin, viewsets.GenericViewSet):
+class EmailUserViewset(
+    ServerThrottledMixin, RetrieveModelMixin, viewsets.GenericViewSet
+):
     permission_classes = []
     authentication_classes = []
 
+    throttle_classes_by_action = {
+        "login": [IPTokenBucketThrottle, LoginTokenBucketThrottle],
+        "request_password_reset_token": [
+            IPTokenBucketThrottle,
+            EmailTokenBucketThrottle,
+        ],
+        "request_mobile_token": [IPTokenBucketThrottle, MobileTokenBucketThrottle],
+        "verify_mobile_token": [IPTokenBucketThrottle, MobileTokenBucketThrottle],
+        "accept_invitation": [IPTokenBucketThrottle, EmailTokenBucketThrottle],
+    }
+
+    def get_throttles(self):
+        throttle_classes = self.throttle_classes_by_action.get(self.action, [])
+        return [throttle_class() for throttle_class in throttle_classes]
+
     def get_queryset(self):
-        return (
-            EmailUser.objects.all()
-            .select_related("owned_business")
-            .prefetch_related("owned_business__business")
+        return EmailUser.objects.all().select_related(
+            "owned_business__business", "employer__business"
         )
 
     def get_serializer_class(self):
@@ -71,10 +101,12 @@ class EmailUserViewset(RetrieveModelMixin, viewsets.GenericViewSet):
     @action(detail=False, methods=["post"])
     def login(self, request, *args, **kwargs):
 
-        queryset = self.get_queryset().filter(email__iexact=request.data["email"])
+        # The only query of a login, the business comes along for the profile
+        email = EmailUser.objects.normalize_email(request.data.get("email"))
+        user = self.get_queryset().filter(email=email).first()
 
         serializer = serializers.LoginSerializer(
-            data=request.data, context={"queryset": queryset}
+            data=request.data, context={"user": user}
         )
         result = serializer.is_valid(raise_exception=False)
 
@@ -82,8 +114,6 @@ class EmailUserViewset(RetrieveModelMixin, viewsets.GenericViewSet):
             data = {"errors": serializer.errors}
             return Response(data, status=status.HTTP_200_OK)
 
-        user = queryset.first()
-
         serializer = serializers.EmailUserWithBusinessSerializer(instance=user)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -128,7 +158,6 @@ class EmailUserViewset(RetrieveModelMixin, viewsets.GenericViewSet):
 
         verification_token = EmailToken()
         verification_token.email_user = email_user
-        verification_token.token = TokenUtil.get_unique_password_token(email_user)
         verification_token.expiry = TimeUtil.get_minutes_from_now(
             RESET_PASSWORD_TOKEN_EXPIRY_MINUTES
         )
@@ -136,10 +165,9 @@ class EmailUserViewset(RetrieveModelMixin, viewsets.GenericViewSet):
         verification_token.is_token_used = False
         verification_token.category = "reset"
 
-        verification_token.save()
-
-        # NOTE: DO NOT SEND EMAIL VIA CELERY TASK
-        EmailUtil.send_request_password_reset_email(email_user, verification_token)
+        with transaction.atomic():
+            TokenUtil.save_email_token(verification_token)
+            EmailUtil.queue_request_password_reset_email(email_user, verification_token)
 
         data = {"message": "token_generated"}
 
@@ -151,7 +179,7 @@ class EmailUserViewset(RetrieveModelMixin, viewsets.GenericViewSet):
         serializer = serializers.ResetPasswordSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        email = serializer.validated_data["email"]
+        email_user = serializer.validated_data["email"]
         password = serializer.validated_data["password_one"]
         token = serializer.validated_data["token"]
 
@@ -159,13 +187,39 @@ class EmailUserViewset(RetrieveModelMixin, viewsets.GenericViewSet):
         token.used_time = TimeUtil.get_minutes_from_now(0)
         token.save()
 
-        email.email_user.set_password(password)
-        email.email_user.save()
+        email_user.set_password(password)
+        email_user.save()
 
         data = {"message": "success"}
 
         return Response(data=data, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=["post"])
+    def accept_invitation(self, request, *args, **kwargs):
+
+        serializer = serializers.AcceptInvitationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        email_user = serializer.validated_data["email"]
+        password = serializer.validated_data["password_one"]
+        token = serializer.validated_data["token"]
+
+        token.is_used = True
+        token.used_time = TimeUtil.get_minutes_from_now(0)
+
+        # The invitation link arrived by email, which verifies it
+        email_user.set_password(password)
+        email_user.is_email_verified = True
+        email_user.email_verified_time = token.used_time
+
+        with transaction.atomic():
+            token.save()
+            email_user.save()
+
+        serializer = serializers.EmailUserWithBusinessSerializer(instance=email_user)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=["post"])
     def request_mobile_token(self, request, *args, **kwargs):
 
@@ -191,9 +245,7 @@ class EmailUserViewset(RetrieveModelMixin, viewsets.GenericViewSet):
         return Response(data=data, status=status.HTTP_200_OK)
 
 
-class RegisteredEmailUserViewset(viewsets.ModelViewSet):
-    authentication_classes = CommonUtil.get_authentication_classes()
-
+class RegisteredEmailUserViewset(CommonAuthenticationMixin, viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = EmailUser.objects.filter(id=self.request.user.id).select_related(
             "business",
@@ -263,3 +315,78 @@ class RegisteredEmailUserViewset(viewsets.ModelViewSet):
         instance = serializer.save()
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"])
+    def invite_business_employees(self, request, *args, **kwargs):
+        user = self.get_owner(request)
+
+        serializer = serializers.InviteBusinessEmployeesSerializer(
+            data=request.data, context={"user": user}
+        )
+        serializer.is_valid(raise_exception=True)
+
+        employees = serializer.save()
+
+        serializer = serializers.BusinessEmployeeSerializer(employees, many=True)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def get_owner(self, request):
+        user = (
+            EmailUser.objects.filter(id=request.user.pk, user_type="owner")
+            .select_related("owned_business__business")
+            .first()
+        )
+
+        if user is None:
+            raise ValidationError({"user_type": "server_invalid"})
+
+        return user
+
+    @action(detail=False, methods=["get"])
+    def claim_candidates(self, request, *args, **kwargs):
+
+        user = self.get_owner(request)
+
+        candidates = ClaimUtil.get_candidates(user, user.get_business())
+        businesses = Business.objects.in_bulk(list(candidates))
+
+        for business_id, business in businesses.items():
+            business.matched_by = candidates[business_id]
+
+        serializer = ClaimCandidateSerializer(list(businesses.values()), many=True)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["post"])
+    def claim_business(self, request, *args, **kwargs):
+
+        serializer = serializers.ClaimBusinessSerializer(
+            data=request.data, context={"user": self.get_owner(request)}
+        )
+        serializer.is_valid(raise_exception=True)
+
+        business = serializer.save()
+
+        serializer = BusinessOnlySerializer(instance=business)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["post"])
+    def logout(self, request, *args, **kwargs):
+
+        serializer = serializers.LogoutSerializer(
+            data=request.data, context={"user_id": request.user.pk}
+        )
+        serializer.is_valid(raise_exception=True)
+
+        # request.auth is the access token, None for session logins
+        tokens = [
+            token
+            for token in [request.auth, serializer.validated_data.get("refresh")]
+            if token is not None
+        ]
+
+        revocation_filter.revoke(tokens)
+
+        return Response({"message": "success"}, status=status.HTTP_200_OK)